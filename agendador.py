@@ -0,0 +1,385 @@
+"""
+Agendador dos jobs periódicos (lembretes, reconciliação de alertas de limite).
+
+Roda dentro do app (iniciar() no startup do FastAPI) ou como processo separado
+(python agendador.py). Com vários workers do uvicorn, todos chamam iniciar(),
+mas só o líder executa os jobs: é quem conseguir o lock exclusivo (fcntl) do
+arquivo ARQUIVO_LIDER. Se o líder morrer, o sistema operacional solta o lock e
+outro worker assume na próxima tentativa.
+
+Cada job tem:
+- agenda no formato cron (minuto hora dia mês dia_da_semana), no fuso de São Paulo,
+  configurável por variável de ambiente (AGENDA_<NOME>, ex: AGENDA_LEMBRETES="0 9 * * *");
+- atraso aleatório (jitter) de até N segundos, para não bater na planilha junto com outros;
+- faixa de prioridade no gateway_sheets (padrão "alertas"): o webhook passa na frente;
+- janela opcional (hora início, hora fim): jobs pesados só começam fora do horário de
+  pico, longe do tráfego do webhook na cota do Sheets. Fora da janela, ficam para a próxima;
+- tempo limite: passou do limite, a execução é registrada como 'timeout' e o job não
+  é iniciado de novo enquanto a anterior ainda estiver rodando (threads não podem ser
+  interrompidas à força; o limite evita sobreposição e fica visível no histórico).
+
+O histórico (início, duração, status, erro) fica em agendador.sqlite3 e aparece em /jobs.
+Uma execução perdida (ex: processo fora do ar) há menos de TOLERANCIA_ATRASO segundos
+é feita assim que possível. Uma execução interrompida no meio (o processo caiu com ela
+'rodando') é marcada como 'interrompido' pelo novo líder e, dentro da mesma tolerância,
+roda de novo uma vez, retomando os checkpoints do mesmo horário (execucao_paralela).
+"""
+import os
+import time
+import random
+import logging
+import threading
+from datetime import datetime, timedelta
+import pytz
+from armazenamento_local import conectar, transacao, caminho_do_banco
+import gateway_sheets
+import execucao_paralela
+
+try:
+    import fcntl
+except ImportError:  # Windows (desenvolvimento): sem eleição, o processo é sempre o líder
+    fcntl = None
+
+BANCO = os.getenv("AGENDADOR_BANCO", caminho_do_banco("agendador.sqlite3"))
+ARQUIVO_LIDER = os.getenv("AGENDADOR_ARQUIVO_LIDER", caminho_do_banco("agendador.lock"))
+INTERVALO_ELEICAO = int(os.getenv("AGENDADOR_INTERVALO_ELEICAO", "30"))  # segundos entre tentativas de virar líder
+TOLERANCIA_ATRASO = int(os.getenv("AGENDADOR_TOLERANCIA_ATRASO", "3600"))  # segundos
+HISTORICO_MAXIMO = int(os.getenv("AGENDADOR_HISTORICO_MAXIMO", "200"))      # execuções guardadas por job
+
+fuso = pytz.timezone("America/Sao_Paulo")
+
+# === CRON ===
+_LIMITES_CRON = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+def _campo_cron(texto, minimo, maximo):
+    valores = set()
+    for parte in texto.split(","):
+        passo = 1
+        if "/" in parte:
+            parte, passo = parte.split("/")
+            passo = int(passo)
+        if parte == "*":
+            inicio, fim = minimo, maximo
+        elif "-" in parte:
+            inicio, fim = map(int, parte.split("-"))
+        else:
+            inicio = int(parte)
+            fim = maximo if passo > 1 else inicio
+        if not (minimo <= inicio <= fim <= maximo) or passo < 1:
+            raise ValueError(f"Campo de cron inválido: {texto}")
+        valores.update(range(inicio, fim + 1, passo))
+    return valores
+
+class Cron:
+    """Expressão cron de 5 campos. Dia da semana: 0 = domingo (7 também vale)."""
+
+    def __init__(self, expressao):
+        campos = expressao.split()
+        if len(campos) != 5:
+            raise ValueError(f"Cron precisa de 5 campos: {expressao!r}")
+        self.expressao = expressao
+        self.minutos, self.horas, self.dias, self.meses, self.dias_semana = (
+            _campo_cron(campo, *limites) for campo, limites in zip(campos, _LIMITES_CRON)
+        )
+        self.dias_semana = {dia % 7 for dia in self.dias_semana}
+        # Como no cron: com dia do mês E dia da semana restritos, vale qualquer um dos dois
+        self._dia_livre = campos[2] == "*"
+        self._semana_livre = campos[4] == "*"
+
+    def _dia_confere(self, data):
+        no_mes = data.day in self.dias
+        na_semana = (data.weekday() + 1) % 7 in self.dias_semana
+        if self._dia_livre or self._semana_livre:
+            return no_mes and na_semana
+        return no_mes or na_semana
+
+    def proxima(self, depois_de):
+        """Próximo horário (datetime com fuso) estritamente depois de depois_de."""
+        momento = depois_de.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limite = momento + timedelta(days=366 * 5)
+        while momento < limite:
+            if momento.month not in self.meses:
+                ano, mes = (momento.year + 1, 1) if momento.month == 12 else (momento.year, momento.month + 1)
+                momento = fuso.localize(datetime(ano, mes, 1))
+            elif not self._dia_confere(momento):
+                momento = fuso.localize(datetime(momento.year, momento.month, momento.day) + timedelta(days=1))
+            elif momento.hour not in self.horas:
+                momento = fuso.normalize(momento.replace(minute=0) + timedelta(hours=1))
+            elif momento.minute not in self.minutos:
+                momento = fuso.normalize(momento + timedelta(minutes=1))
+            else:
+                return momento
+        raise ValueError(f"Cron sem próxima execução: {self.expressao!r}")
+
+# === JOBS ===
+class Job:
+    def __init__(self, nome, funcao, cron, timeout, jitter=0, janela=None, prioridade="alertas"):
+        self.nome = nome
+        self.funcao = funcao
+        self.cron = Cron(os.getenv(f"AGENDA_{nome.upper()}", cron))
+        self.timeout = timeout
+        self.jitter = jitter
+        self.janela = janela          # (hora_inicio, hora_fim) ou None; hora_fim exclusiva, pode virar a meia-noite
+        self.prioridade = prioridade  # Faixa das chamadas ao Sheets feitas pelo job (gateway_sheets)
+        self.proxima = None           # Próximo horário agendado (datetime)
+        self.thread = None            # Execução em andamento (ou que estourou o tempo e ainda roda)
+
+    def na_janela(self, momento):
+        if not self.janela:
+            return True
+        inicio, fim = self.janela
+        if inicio <= fim:
+            return inicio <= momento.hour < fim
+        return momento.hour >= inicio or momento.hour < fim
+
+def _reconciliar_alertas():
+    import alertas_limite
+    return alertas_limite.reconciliar()
+
+def _enviar_lembretes():
+    import enviar_lembretes
+    return enviar_lembretes.enviar_lembretes()
+
+JOBS = [
+    # Lembretes de manhã: só leem o calendário em memória e enfileiram mensagens
+    Job("lembretes", _enviar_lembretes, "0 9 * * *", timeout=1800, jitter=120),
+    # Rede de segurança dos alertas (o normal é o alerta sair no registro do gasto): de madrugada
+    Job("alertas_limite", _reconciliar_alertas, "30 3 * * *", timeout=3600, jitter=300, janela=(1, 6)),
+]
+
+# === HISTÓRICO ===
+_banco_pronto = False
+
+def _conexao():
+    global _banco_pronto
+    conexao = conectar(BANCO, sincronismo="NORMAL")
+    if not _banco_pronto:
+        conexao.execute(
+            "CREATE TABLE IF NOT EXISTS execucoes ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, job TEXT NOT NULL, agendado_para REAL NOT NULL,"
+            " iniciado_em REAL, terminado_em REAL, duracao REAL, status TEXT NOT NULL, detalhe TEXT, pid INTEGER)"
+        )
+        conexao.execute("CREATE INDEX IF NOT EXISTS idx_execucoes_job ON execucoes (job, agendado_para)")
+        _banco_pronto = True
+    return conexao
+
+def _anotar(job, agendado_para, status, iniciado_em=None, terminado_em=None, detalhe=None, id_execucao=None):
+    conexao = _conexao()
+    duracao = round(terminado_em - iniciado_em, 3) if iniciado_em and terminado_em else None
+    with transacao(conexao):
+        if id_execucao is None:
+            cursor = conexao.execute(
+                "INSERT INTO execucoes (job, agendado_para, iniciado_em, terminado_em, duracao, status, detalhe, pid)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job, agendado_para.timestamp(), iniciado_em, terminado_em, duracao, status, detalhe, os.getpid()),
+            )
+            id_execucao = cursor.lastrowid
+            conexao.execute(
+                "DELETE FROM execucoes WHERE job = ? AND id NOT IN "
+                "(SELECT id FROM execucoes WHERE job = ? ORDER BY id DESC LIMIT ?)",
+                (job, job, HISTORICO_MAXIMO),
+            )
+        else:
+            conexao.execute(
+                "UPDATE execucoes SET terminado_em = ?, duracao = ?, status = ?, detalhe = ? WHERE id = ?",
+                (terminado_em, duracao, status, detalhe, id_execucao),
+            )
+    return id_execucao
+
+def _marcar_interrompidas(job):
+    """Execuções 'rodando' de outro processo ficaram órfãs: só o líder roda jobs, e o lock
+    de líder só passa para cá depois que o processo anterior morreu."""
+    conexao = _conexao()
+    with transacao(conexao):
+        conexao.execute(
+            "UPDATE execucoes SET status = 'interrompido', detalhe = 'processo encerrado durante a execução'"
+            " WHERE job = ? AND status = 'rodando' AND pid != ?",
+            (job, os.getpid()),
+        )
+
+def _ultimo_agendamento(job):
+    """Último horário já tratado. Um horário interrompido e ainda não repetido não conta,
+    para que proximo_horario o devolva (uma vez) se estiver dentro da tolerância."""
+    linha = _conexao().execute(
+        "SELECT MAX(agendado_para) FROM execucoes AS e WHERE job = ? AND NOT ("
+        " status = 'interrompido' AND"
+        " (SELECT COUNT(*) FROM execucoes WHERE job = e.job AND agendado_para = e.agendado_para) = 1)",
+        (job,),
+    ).fetchone()
+    return datetime.fromtimestamp(linha[0], fuso) if linha and linha[0] else None
+
+# === EXECUÇÃO ===
+def _executar(job, agendado_para):
+    inicio = time.time()
+    id_execucao = _anotar(job.nome, agendado_para, "rodando", iniciado_em=inicio)
+    resultado = {}
+
+    def _alvo():
+        try:
+            # A execução dos checkpoints é o horário agendado: uma retomada depois de reinício
+            # continua a mesma, e um horário novo nunca herda os checkpoints de outro
+            with gateway_sheets.prioridade(job.prioridade), \
+                    execucao_paralela.execucao_agendada(agendado_para.strftime("%Y-%m-%dT%H:%M")):
+                resultado["retorno"] = job.funcao()
+        except Exception as e:
+            logging.exception(f"[Agendador] Job {job.nome} falhou: {e}")
+            resultado["erro"] = e
+        finally:
+            if resultado.get("timeout"):
+                # Terminou depois do limite: completa o registro com a duração real
+                _anotar(job.nome, agendado_para, "timeout", inicio, time.time(),
+                        f"terminou depois do limite de {job.timeout}s", id_execucao)
+
+    job.thread = threading.Thread(target=_alvo, name=f"job-{job.nome}", daemon=True)
+    job.thread.start()
+    job.thread.join(job.timeout)
+    if job.thread.is_alive():
+        resultado["timeout"] = True
+        logging.error(f"[Agendador] Job {job.nome} passou do limite de {job.timeout}s e segue rodando em segundo plano.")
+        _anotar(job.nome, agendado_para, "timeout", inicio, time.time(), f"limite de {job.timeout}s", id_execucao)
+        return
+    status = "erro" if "erro" in resultado else "ok"
+    detalhe = str(resultado.get("erro") or resultado.get("retorno") or "")[:1000]
+    _anotar(job.nome, agendado_para, status, inicio, time.time(), detalhe, id_execucao)
+    logging.info(f"[Agendador] Job {job.nome} terminou ({status}) em {time.time() - inicio:.1f}s.")
+
+def proximo_horario(cron, ultimo, agora, tolerancia=TOLERANCIA_ATRASO):
+    """Próximo horário a executar, dado o último horário já registrado.
+
+    Um horário perdido depois do último registrado e há menos de `tolerancia` segundos
+    é devolvido (vencido) para rodar uma vez; os mais antigos que isso são pulados.
+    Sem histórico (ultimo=None), começa do próximo horário depois de agora.
+    """
+    if ultimo is None:
+        return cron.proxima(agora)
+    return cron.proxima(max(ultimo, agora - timedelta(seconds=tolerancia)))
+
+def _agendar(job, agora):
+    """Calcula o próximo horário do job (retoma uma execução perdida ou interrompida há pouco)."""
+    _marcar_interrompidas(job.nome)
+    job.proxima = proximo_horario(job.cron, _ultimo_agendamento(job.nome), agora)
+
+def _rodar_vencidos(agora):
+    for job in JOBS:
+        if job.proxima is None:
+            _agendar(job, agora)
+        if job.proxima > agora:
+            continue
+        agendado_para, job.proxima = job.proxima, job.cron.proxima(max(job.proxima, agora))
+        if not job.na_janela(agora):
+            logging.warning(f"[Agendador] Job {job.nome} fora da janela {job.janela}; fica para {job.proxima}.")
+            _anotar(job.nome, agendado_para, "ignorado", detalhe="fora da janela")
+            continue
+        if job.thread and job.thread.is_alive():
+            logging.warning(f"[Agendador] Job {job.nome} ainda rodando da vez anterior; execução de {agendado_para} pulada.")
+            _anotar(job.nome, agendado_para, "ignorado", detalhe="execução anterior ainda rodando")
+            continue
+        atraso = random.uniform(0, job.jitter) if job.jitter else 0
+        threading.Thread(
+            target=lambda j=job, a=agendado_para, d=atraso: (time.sleep(d), _executar(j, a)),
+            name=f"agendador-{job.nome}", daemon=True,
+        ).start()
+
+# === ELEIÇÃO DE LÍDER E LOOP ===
+_arquivo_lider = None
+_thread = None
+_parar = threading.Event()
+
+def _tentar_liderar():
+    """Tenta o lock exclusivo do arquivo de líder. O lock dura enquanto o processo viver."""
+    global _arquivo_lider
+    if _arquivo_lider is not None:
+        return True
+    if fcntl is None:
+        _arquivo_lider = True
+        return True
+    pasta = os.path.dirname(ARQUIVO_LIDER)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    arquivo = open(ARQUIVO_LIDER, "a+")
+    try:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        arquivo.close()
+        return False
+    arquivo.truncate(0)
+    arquivo.write(str(os.getpid()))
+    arquivo.flush()
+    _arquivo_lider = arquivo
+    logging.info(f"[Agendador] Processo {os.getpid()} é o líder dos jobs agendados.")
+    return True
+
+def e_lider():
+    return _arquivo_lider is not None
+
+def _loop():
+    while not _parar.is_set():
+        try:
+            if _tentar_liderar():
+                _rodar_vencidos(datetime.now(fuso))
+                espera = 60 - datetime.now().second  # Acorda na virada de cada minuto
+            else:
+                espera = INTERVALO_ELEICAO
+        except Exception as e:
+            logging.error(f"Erro no agendador: {e}")
+            espera = INTERVALO_ELEICAO
+        _parar.wait(espera)
+
+def iniciar():
+    """Inicia (uma única vez por processo) o loop do agendador."""
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    _parar.clear()
+    _thread = threading.Thread(target=_loop, name="agendador", daemon=True)
+    _thread.start()
+
+def parar():
+    _parar.set()
+
+# === VISIBILIDADE ===
+def situacao(ultimas=5):
+    """Agenda, próxima execução e últimas execuções de cada job (para o endpoint /jobs)."""
+    conexao = _conexao()
+    agora = datetime.now(fuso)
+    jobs = []
+    for job in JOBS:
+        linhas = conexao.execute(
+            "SELECT agendado_para, iniciado_em, duracao, status, detalhe, pid FROM execucoes"
+            " WHERE job = ? ORDER BY id DESC LIMIT ?",
+            (job.nome, ultimas),
+        ).fetchall()
+        jobs.append({
+            "nome": job.nome,
+            "cron": job.cron.expressao,
+            "janela": job.janela,
+            "timeout": job.timeout,
+            "proxima": (job.proxima or job.cron.proxima(agora)).isoformat(),
+            "rodando": bool(job.thread and job.thread.is_alive()),
+            "execucoes": [
+                {
+                    "agendado_para": datetime.fromtimestamp(agendado, fuso).isoformat(),
+                    "iniciado_em": datetime.fromtimestamp(iniciado, fuso).isoformat() if iniciado else None,
+                    "duracao": duracao, "status": status, "detalhe": detalhe, "pid": pid,
+                }
+                for agendado, iniciado, duracao, status, detalhe, pid in linhas
+            ],
+        })
+    return {"lider": e_lider(), "pid": os.getpid(), "jobs": jobs}
+
+if __name__ == "__main__":
+    # Processo separado só para os jobs (nesse caso, AGENDADOR_ATIVO=false no app web)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    # Sem o app web, ninguém mais mantém as cópias em memória em dia com edições de linhas
+    # existentes (lembrete ativado, categoria e valor corrigidos): reconcilia aqui também
+    from replica_planilhas import replica_gastos_diarios, replica_gastos_fixos
+    from diretorio_usuarios import iniciar_ressincronizacao_periodica
+    replica_gastos_diarios.iniciar_reconciliacao_periodica()
+    replica_gastos_fixos.iniciar_reconciliacao_periodica()
+    iniciar_ressincronizacao_periodica()
+    iniciar()
+    try:
+        while _thread.is_alive():
+            _thread.join(1)
+    except KeyboardInterrupt:
+        parar()
@@ -0,0 +1,218 @@
+"""
+Motor de agregação dos gastos diários sobre uma visão colunar em NumPy.
+
+A réplica de 'Gastos Diários' é convertida (uma vez, e depois só as linhas novas
+e as editadas) em colunas numéricas: código do usuário, data (ordinal), valor em centavos,
+código da categoria e código da forma de pagamento. Todos os relatórios fazem
+as contas com agrupar(), que filtra por usuário/período e soma por qualquer
+combinação de usuário, categoria, forma de pagamento, mês ou dia.
+
+Também concentra a leitura de valores em reais (valor_em_centavos) e de datas
+dd/mm/aaaa (data_do_texto), que antes cada relatório fazia do seu jeito.
+"""
+import calendar
+import logging
+import threading
+from datetime import date, datetime
+import numpy as np
+from planilhas import formatar_numero
+from replica_planilhas import replica_gastos_diarios
+
+# Colunas de 'Gastos Diários': NOME, NÚMERO, DESCRIÇÃO, CATEGORIA, VALOR (R$), FORMA DE PAGAMENTO, DATA DO GASTO, ...
+COLUNA_NUMERO, COLUNA_CATEGORIA, COLUNA_VALOR, COLUNA_FORMA, COLUNA_DATA = 1, 3, 4, 5, 6
+
+DIMENSOES = ("usuario", "categoria", "forma", "mes", "dia")
+
+# === LEITURA DE VALORES E DATAS ===
+def valor_em_centavos(texto):
+    """Converte um valor em reais para centavos (int). Aceita 'R$1.234,56', '1234,56', '1234.56' e números.
+
+    Returns:
+        int: Valor em centavos, ou None se o texto não for um valor válido.
+    """
+    if isinstance(texto, (int, float)):
+        return int(round(texto * 100))
+    texto = str(texto).replace("R$", "").replace(" ", "").strip()
+    if not texto:
+        return None
+    if "," in texto:
+        texto = texto.replace(".", "").replace(",", ".")
+    elif texto.count(".") > 1 or (texto.count(".") == 1 and len(texto.rsplit(".", 1)[1]) == 3):
+        texto = texto.replace(".", "")  # Só separador de milhar (ex: 1.234)
+    try:
+        return int(round(float(texto) * 100))
+    except ValueError:
+        return None
+
+def data_do_texto(texto):
+    """Converte 'dd/mm/aaaa' (com ou sem hora depois) em date, ou None se inválida."""
+    try:
+        return datetime.strptime(str(texto).strip()[:10], "%d/%m/%Y").date()
+    except ValueError:
+        return None
+
+def intervalo_do_mes(ano, mes):
+    """Primeiro e último dia do mês."""
+    return date(ano, mes, 1), date(ano, mes, calendar.monthrange(ano, mes)[1])
+
+# === VISÃO COLUNAR ===
+class _Vocabulario:
+    """Mapa texto <-> código inteiro, só cresce (códigos antigos continuam válidos)."""
+
+    def __init__(self):
+        self.textos = []
+        self.codigos = {}
+
+    def codigo(self, texto):
+        codigo = self.codigos.get(texto)
+        if codigo is None:
+            codigo = self.codigos[texto] = len(self.textos)
+            self.textos.append(texto)
+        return codigo
+
+class VisaoColunar:
+    """Snapshot imutável das colunas numéricas do livro de gastos."""
+
+    def __init__(self, usuario, dia, mes, centavos, categoria, forma, valido, vocabularios):
+        self.usuario = usuario      # int32: código do usuário
+        self.dia = dia              # int32: date.toordinal() (0 se a data é inválida)
+        self.mes = mes              # int32: ano * 100 + mês (0 se a data é inválida)
+        self.centavos = centavos    # int64: valor em centavos (0 se inválido)
+        self.categoria = categoria  # int32: código da categoria
+        self.forma = forma          # int32: código da forma de pagamento
+        self.valido = valido        # bool: data e valor legíveis
+        self.vocabularios = vocabularios  # {"usuario"|"categoria"|"forma": _Vocabulario}
+
+    def __len__(self):
+        return len(self.centavos)
+
+    def coluna(self, dimensao):
+        return getattr(self, dimensao)
+
+    def decodificar(self, dimensao, codigo):
+        codigo = int(codigo)
+        if dimensao in self.vocabularios:
+            return self.vocabularios[dimensao].textos[codigo]
+        if dimensao == "mes":
+            return f"{codigo // 100:04d}-{codigo % 100:02d}"
+        return date.fromordinal(codigo)
+
+_lock = threading.Lock()
+_vocabularios = {"usuario": _Vocabulario(), "categoria": _Vocabulario(), "forma": _Vocabulario()}
+_visao = VisaoColunar(*(np.zeros(0, dtype=t) for t in (np.int32, np.int32, np.int32, np.int64, np.int32, np.int32, bool)), _vocabularios)
+_geracao = 0
+_trocas_vistas = 0
+
+def _converter(linhas):
+    """Converte linhas da réplica em colunas (a única parte linha a linha, feita uma vez por linha)."""
+    n = len(linhas)
+    usuario = np.empty(n, dtype=np.int32)
+    dia = np.zeros(n, dtype=np.int32)
+    mes = np.zeros(n, dtype=np.int32)
+    centavos = np.zeros(n, dtype=np.int64)
+    categoria = np.empty(n, dtype=np.int32)
+    forma = np.empty(n, dtype=np.int32)
+    valido = np.zeros(n, dtype=bool)
+    for i, linha in enumerate(linhas):
+        usuario[i] = _vocabularios["usuario"].codigo(formatar_numero(linha[COLUNA_NUMERO]))
+        categoria[i] = _vocabularios["categoria"].codigo(linha[COLUNA_CATEGORIA].strip() or "A DEFINIR")
+        forma[i] = _vocabularios["forma"].codigo(linha[COLUNA_FORMA].strip() or "Outro")
+        data = data_do_texto(linha[COLUNA_DATA])
+        valor = valor_em_centavos(linha[COLUNA_VALOR])
+        if data:
+            dia[i] = data.toordinal()
+            mes[i] = data.year * 100 + data.month
+        if valor is not None:
+            centavos[i] = valor
+        valido[i] = data is not None and valor is not None
+    return usuario, dia, mes, centavos, categoria, forma, valido
+
+def visao():
+    """Retorna a visão colunar atualizada.
+
+    Converte só as linhas novas e as editadas desde a última chamada; a visão inteira
+    só é reconstruída depois de uma recarga completa da réplica.
+    """
+    global _visao, _geracao, _trocas_vistas
+    with _lock:
+        geracao, inicio, novas, trocadas, trocas = replica_gastos_diarios.linhas_novas(_geracao, len(_visao), _trocas_vistas)
+        _trocas_vistas = trocas
+        if geracao == _geracao and not novas and not trocadas:
+            return _visao
+        colunas = _converter(novas)
+        if geracao == _geracao:
+            atuais = (_visao.usuario, _visao.dia, _visao.mes, _visao.centavos, _visao.categoria, _visao.forma, _visao.valido)
+            # Colunas novas (cópia): quem ainda lê a visão anterior não a vê mudar
+            colunas = [np.concatenate((atual, nova)) for atual, nova in zip(atuais, colunas)]
+            if trocadas:
+                posicoes = np.array([indice for indice, _ in trocadas])
+                for coluna, valores in zip(colunas, _converter([linha for _, linha in trocadas])):
+                    coluna[posicoes] = valores
+        else:
+            logging.info(f"Visão colunar dos gastos reconstruída: {len(novas)} linhas.")
+        _visao = VisaoColunar(*colunas, _vocabularios)
+        _geracao = geracao
+        return _visao
+
+# === CONSULTAS ===
+def agrupar(por=("categoria",), numero=None, inicio=None, fim=None, apenas_positivos=False, apenas_validos=True):
+    """Soma os gastos agrupados pelas dimensões pedidas.
+
+    Args:
+        por (tuple): Dimensões do agrupamento, entre DIMENSOES. Vazio = total geral.
+        numero (str): Filtra um usuário (None = todos).
+        inicio (date): Primeiro dia do período (inclusive). None = sem limite.
+        fim (date): Último dia do período (inclusive). None = sem limite.
+        apenas_positivos (bool): Ignora valores <= 0.
+        apenas_validos (bool): Ignora linhas com data ou valor ilegível.
+
+    Returns:
+        dict: {chave: (centavos, quantidade)}, onde chave é uma tupla com um valor por dimensão
+        (texto para usuário/categoria/forma, 'AAAA-MM' para mês e date para dia), na ordem
+        em que cada combinação apareceu primeiro no livro.
+    """
+    v = visao()
+    filtro = v.valido.copy() if apenas_validos else np.ones(len(v), dtype=bool)
+    if numero is not None:
+        codigo = v.vocabularios["usuario"].codigos.get(formatar_numero(str(numero)))
+        if codigo is None:
+            return {}
+        filtro &= v.usuario == codigo
+    if inicio is not None:
+        filtro &= v.dia >= inicio.toordinal()
+    if fim is not None:
+        filtro &= v.dia <= fim.toordinal()
+    if apenas_positivos:
+        filtro &= v.centavos > 0
+
+    posicoes = np.flatnonzero(filtro)
+    if not len(posicoes):
+        return {}
+    if not por:
+        return {(): (int(v.centavos[posicoes].sum()), len(posicoes))}
+
+    colunas = np.stack([v.coluna(dimensao)[posicoes].astype(np.int64) for dimensao in por], axis=1)
+    chaves, primeira, inverso = np.unique(colunas, axis=0, return_index=True, return_inverse=True)
+    inverso = inverso.reshape(-1)
+    somas = np.zeros(len(chaves), dtype=np.int64)
+    np.add.at(somas, inverso, v.centavos[posicoes])
+    quantidades = np.bincount(inverso, minlength=len(chaves))
+
+    resultado = {}
+    for k in np.argsort(primeira, kind="stable"):
+        chave = tuple(v.decodificar(dimensao, codigo) for dimensao, codigo in zip(por, chaves[k]))
+        resultado[chave] = (int(somas[k]), int(quantidades[k]))
+    return resultado
+
+def totais_por_categoria(numero, inicio=None, fim=None, apenas_positivos=False):
+    """{categoria: total em reais} do usuário no período."""
+    grupos = agrupar(("categoria",), numero=numero, inicio=inicio, fim=fim, apenas_positivos=apenas_positivos)
+    return {categoria: centavos / 100 for (categoria,), (centavos, _) in grupos.items()}
+
+def totais_do_mes(ano, mes, numero=None):
+    """Status mensal: {numero: {categoria: total em reais}} de um usuário ou de todos numa só redução."""
+    inicio, fim = intervalo_do_mes(ano, mes)
+    totais = {}
+    for (usuario, categoria), (centavos, _) in agrupar(("usuario", "categoria"), numero=numero, inicio=inicio, fim=fim).items():
+        totais.setdefault(usuario, {})[categoria] = centavos / 100
+    return totais
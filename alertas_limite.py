@@ -0,0 +1,146 @@
+"""
+Alertas de limite por categoria (faixas 50/70/90/100/>100 de mensagens.alerta_limite_excedido).
+
+O alerta é avaliado na hora do registro do gasto: com o total da categoria no mês
+(consolidado_mensal) e o limite do usuário (cache de limites), verifica se o gasto
+fez o percentual entrar numa faixa nova. Cada faixa é enviada no máximo uma vez por
+categoria e mês: a chave é anotada na tabela alertas_enviados (alertas.sqlite3) e a
+mensagem vai para a fila de envio (enviar_whatsapp), sem atrasar a resposta do webhook.
+
+A anotação é um INSERT OR IGNORE por (numero, chave), fora do estado da conversa: o
+job noturno e uma mensagem do mesmo usuário podem anotar ao mesmo tempo sem que a
+gravação de uma sessão apague a chave anotada pela outra. Chaves antigas, guardadas
+em estado["alertas_enviados"], continuam valendo.
+
+reconciliar() é a rede de segurança em lote (jobs verificar_alertas): percorre o
+status do mês de todos os usuários e envia as faixas que ainda não foram avisadas.
+"""
+import os
+import time
+import logging
+from datetime import datetime
+import pytz
+import mensagens
+import limites
+import consolidado_mensal
+import execucao_paralela
+from agregacao import totais_do_mes
+from enviar_whatsapp import enviar_whatsapp
+from armazenamento_local import conectar, transacao, caminho_do_banco
+from estado_usuario import carregar_estado
+from planilhas import formatar_numero
+
+BANCO = os.getenv("ALERTAS_BANCO", caminho_do_banco("alertas.sqlite3"))
+
+fuso = pytz.timezone("America/Sao_Paulo")
+_banco_pronto = False
+
+def _conexao():
+    global _banco_pronto
+    conexao = conectar(BANCO, sincronismo="NORMAL")
+    if not _banco_pronto:
+        conexao.execute(
+            "CREATE TABLE IF NOT EXISTS alertas_enviados ("
+            " numero TEXT NOT NULL, chave TEXT NOT NULL, enviado_em REAL NOT NULL, PRIMARY KEY (numero, chave))"
+        )
+        _banco_pronto = True
+    return conexao
+
+# Faixas em ordem crescente: (percentual a partir do qual a faixa vale, faixa)
+FAIXAS = ((45, "50"), (65, "70"), (85, "90"), (95, "100"), (105, ">100"))
+
+def faixa_atingida(total, limite):
+    """Maior faixa já atingida pelo total em relação ao limite, ou None se nenhuma."""
+    if not limite or limite <= 0:
+        return None
+    percentual = (total / limite) * 100
+    atingida = None
+    for minimo, faixa in FAIXAS:
+        if percentual > minimo:
+            atingida = faixa
+    return atingida
+
+def chave_alerta(categoria, faixa, ano, mes):
+    """Chave única por categoria, faixa e mês (o limite é mensal)."""
+    return f"{categoria}_{faixa}_{ano:04d}-{mes:02d}"
+
+def disparar(numero, categoria, total, limite, faixa, ano, mes):
+    """Anota a faixa como avisada e enfileira o alerta. Retorna False se já foi avisada."""
+    chave = chave_alerta(categoria, faixa, ano, mes)
+    if chave in carregar_estado(numero).get("alertas_enviados", []):
+        return False  # Anotada no formato antigo
+    conexao = _conexao()
+    with transacao(conexao):
+        cursor = conexao.execute(
+            "INSERT OR IGNORE INTO alertas_enviados (numero, chave, enviado_em) VALUES (?, ?, ?)",
+            (numero, chave, time.time()),
+        )
+    if not cursor.rowcount:
+        return False  # Outra thread ou processo anotou primeiro
+    if enviar_whatsapp(numero, mensagens.alerta_limite_excedido(categoria, total, limite, faixa)):
+        logging.info(f"Alerta {chave} enfileirado para {numero}.")
+    return True
+
+# === AVALIAÇÃO NO REGISTRO DO GASTO (O(1)) ===
+def avaliar_gasto(numero, categoria, valor, data_gasto):
+    """Chamar depois que o gasto entrou no livro (o consolidado já inclui o valor).
+
+    Args:
+        numero (str): Número do usuário.
+        categoria (str): Categoria do gasto.
+        valor (float): Valor do gasto (ou soma dos gastos da categoria, num lote).
+        data_gasto (str): Data do gasto (dd/mm/aaaa). Só gastos do mês corrente geram alerta.
+
+    Returns:
+        str: Faixa disparada, ou None.
+    """
+    try:
+        hoje = datetime.now(fuso).date()
+        data = datetime.strptime(str(data_gasto).strip(), "%d/%m/%Y").date()
+        if (data.year, data.month) != (hoje.year, hoje.month):
+            return None
+
+        numero = formatar_numero(str(numero))
+        limite = limites.limites_do_usuario(numero).get(categoria)
+        if not limite or limite <= 0:
+            return None
+
+        total = consolidado_mensal.total_da_categoria(numero, hoje.year, hoje.month, categoria)
+        faixa = faixa_atingida(total, limite)
+        if not faixa or faixa == faixa_atingida(total - valor, limite):
+            return None  # O gasto não mudou a faixa
+        return faixa if disparar(numero, categoria, total, limite, faixa, hoje.year, hoje.month) else None
+    except Exception as e:
+        logging.error(f"Erro ao avaliar alerta de limite para {numero} ({categoria}): {e}")
+        return None
+
+# === RECONCILIAÇÃO EM LOTE ===
+def reconciliar():
+    """Envia as faixas atingidas no mês que ainda não foram avisadas, para todos os usuários.
+
+    Os usuários são verificados em paralelo (execucao_paralela), com checkpoint: se o
+    processo cair no meio, a próxima chamada continua de onde parou.
+
+    Returns:
+        dict: Resumo da execução (enviados = usuários com algum alerta disparado).
+    """
+    hoje = datetime.now(fuso).date()
+    limites_todos = limites.todos_os_limites()  # 1 leitura da aba, no máximo
+
+    def _verificar_usuario(item):
+        numero, categorias = item
+        limites_user = limites_todos.get(numero)
+        if not numero or not limites_user:
+            return execucao_paralela.IGNORADO
+        disparados = 0
+        for categoria, total in categorias.items():
+            limite = limites_user.get(categoria)
+            faixa = faixa_atingida(total, limite)
+            if faixa and disparar(numero, categoria, total, limite, faixa, hoje.year, hoje.month):
+                disparados += 1
+        return execucao_paralela.ENVIADO if disparados else execucao_paralela.IGNORADO
+
+    totais = totais_do_mes(hoje.year, hoje.month)
+    return execucao_paralela.executar(
+        "alertas_limite", ((numero, (numero, categorias)) for numero, categorias in totais.items()), _verificar_usuario
+    )
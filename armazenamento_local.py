@@ -0,0 +1,55 @@
+"""
+Conexões SQLite locais (modo WAL) compartilhadas pelos módulos que guardam dados em disco.
+
+Cada thread recebe a sua conexão (sqlite3 não compartilha conexões entre threads
+por padrão). O modo WAL deixa leituras e uma escrita acontecerem ao mesmo tempo,
+inclusive entre processos (vários workers do uvicorn), e busy_timeout faz uma
+escrita esperar a outra em vez de falhar com "database is locked". Cada transação
+é atômica: se o processo cair no meio, o banco volta ao último commit.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+PASTA = os.getenv("ARMAZENAMENTO_LOCAL_PASTA", "dados")
+ESPERA_BLOQUEIO = int(os.getenv("ARMAZENAMENTO_LOCAL_ESPERA_MS", "10000"))  # milissegundos
+
+_local = threading.local()
+
+def caminho_do_banco(nome):
+    """Caminho de um banco dentro da pasta de dados locais (ex: 'estados.sqlite3')."""
+    return os.path.join(PASTA, nome)
+
+def conectar(caminho, sincronismo="FULL"):
+    """Conexão da thread atual com o banco (criada e configurada na primeira chamada).
+
+    sincronismo="FULL" só retorna do commit depois de o dado chegar ao disco; "NORMAL"
+    (ainda seguro contra queda do processo no modo WAL) troca isso por commits mais rápidos.
+    """
+    conexoes = getattr(_local, "conexoes", None)
+    if conexoes is None:
+        conexoes = _local.conexoes = {}
+    conexao = conexoes.get(caminho)
+    if conexao is None:
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        # isolation_level=None: as transações são abertas explicitamente em transacao()
+        conexao = sqlite3.connect(caminho, timeout=ESPERA_BLOQUEIO / 1000, isolation_level=None)
+        conexao.execute(f"PRAGMA busy_timeout = {ESPERA_BLOQUEIO}")
+        conexao.execute("PRAGMA journal_mode = WAL")
+        conexao.execute(f"PRAGMA synchronous = {sincronismo}")
+        conexoes[caminho] = conexao
+    return conexao
+
+@contextmanager
+def transacao(conexao):
+    """BEGIN IMMEDIATE ... COMMIT (ROLLBACK se der erro). Reserva a escrita logo no início."""
+    conexao.execute("BEGIN IMMEDIATE")
+    try:
+        yield conexao
+    except BaseException:
+        conexao.execute("ROLLBACK")
+        raise
+    conexao.execute("COMMIT")
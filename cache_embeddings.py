@@ -0,0 +1,201 @@
+"""
+Cache persistente de embeddings da OpenAI, endereçado pelo conteúdo.
+
+A chave é sha256(modelo + texto normalizado): espaços nas pontas e repetidos
+não contam, então "oi", " oi " e "quanto  gastei" acertam o cache de novo. Duas camadas:
+
+- memória: LRU com até CACHE_EMBEDDINGS_MEMORIA vetores (numpy float32);
+- disco: embeddings.f32, uma matriz float32 de CACHE_EMBEDDINGS_MB megabytes aberta
+  com np.memmap (um vetor por linha), e embeddings.sqlite3 ligando cada chave à sua
+  linha, com a data do último uso e um CRC do vetor. Cheio, o vetor usado há mais
+  tempo cede a linha. O CRC descarta uma linha que outro processo está regravando.
+
+Como a chave é o próprio conteúdo, um vetor guardado nunca fica velho; vários
+workers do uvicorn podem compartilhar os arquivos. A data de uso só é regravada
+quando passou de CACHE_EMBEDDINGS_ATUALIZAR_USO segundos (um acerto no disco
+normalmente não escreve nada), e pedidos simultâneos do mesmo texto que não estão
+na memória viram uma leitura/chamada só. metricas() mostra acertos na memória e
+no disco, chamadas à API, pedidos coalescidos e despejos.
+"""
+import os
+import zlib
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import numpy as np
+from armazenamento_local import conectar, transacao, caminho_do_banco
+
+MODELO = "text-embedding-ada-002"
+DIMENSAO = int(os.getenv("CACHE_EMBEDDINGS_DIMENSAO", "1536"))
+MEMORIA = int(os.getenv("CACHE_EMBEDDINGS_MEMORIA", "2000"))       # vetores na LRU em memória
+TAMANHO_MB = int(os.getenv("CACHE_EMBEDDINGS_MB", "64"))           # tamanho máximo da matriz em disco
+ATUALIZAR_USO = int(os.getenv("CACHE_EMBEDDINGS_ATUALIZAR_USO", "60"))  # segundos entre regravações de usado_em
+BANCO = os.getenv("CACHE_EMBEDDINGS_BANCO", caminho_do_banco("embeddings.sqlite3"))
+ARQUIVO_VETORES = os.getenv("CACHE_EMBEDDINGS_VETORES", caminho_do_banco("embeddings.f32"))
+
+CAPACIDADE = max(1, TAMANHO_MB * 1024 * 1024 // (DIMENSAO * 4))  # linhas da matriz em disco
+
+_lock = threading.Lock()
+_memoria = OrderedDict()  # chave -> np.ndarray float32
+_em_voo = {}  # chave -> Future da leitura/geração em andamento
+_matriz = None
+_banco_pronto = False
+_contadores = {"acertos_memoria": 0, "acertos_disco": 0, "chamadas_api": 0, "coalescidos": 0, "despejos": 0, "erros_disco": 0}
+
+def normalizar(texto):
+    return " ".join(str(texto).split())
+
+def chave(texto, modelo=MODELO):
+    return hashlib.sha256(f"{modelo}\0{normalizar(texto)}".encode("utf-8")).hexdigest()
+
+# === DISCO ===
+def _conexao():
+    global _banco_pronto
+    conexao = conectar(BANCO, sincronismo="NORMAL")
+    if not _banco_pronto:
+        conexao.executescript(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " chave TEXT PRIMARY KEY, linha INTEGER NOT NULL UNIQUE, crc INTEGER NOT NULL, usado_em REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_uso ON embeddings (usado_em);"
+        )
+        # CACHE_EMBEDDINGS_MB diminuiu: as linhas além da nova capacidade saem do cache
+        with transacao(conexao):
+            conexao.execute("DELETE FROM embeddings WHERE linha >= ?", (CAPACIDADE,))
+        _banco_pronto = True
+    return conexao
+
+def _matriz_em_disco():
+    global _matriz
+    with _lock:
+        if _matriz is None:
+            os.makedirs(os.path.dirname(ARQUIVO_VETORES) or ".", exist_ok=True)
+            tamanho = CAPACIDADE * DIMENSAO * 4
+            with open(ARQUIVO_VETORES, "ab") as f:
+                if f.tell() < tamanho:
+                    f.truncate(tamanho)  # Arquivo esparso: só ocupa disco o que for gravado
+            _matriz = np.memmap(ARQUIVO_VETORES, dtype=np.float32, mode="r+", shape=(CAPACIDADE, DIMENSAO))
+        return _matriz
+
+def _ler_do_disco(chave_texto):
+    conexao = _conexao()
+    linha = conexao.execute("SELECT linha, crc, usado_em FROM embeddings WHERE chave = ?", (chave_texto,)).fetchone()
+    if linha is None:
+        return None
+    vetor = np.array(_matriz_em_disco()[linha[0]])
+    if zlib.crc32(vetor.tobytes()) != linha[1]:
+        return None  # Linha sendo reaproveitada por outro processo: trata como ausente
+    agora = time.time()
+    if agora - linha[2] >= ATUALIZAR_USO:  # Para o despejo basta a ordem aproximada: evita uma escrita por acerto
+        with transacao(conexao):
+            conexao.execute("UPDATE embeddings SET usado_em = ? WHERE chave = ?", (agora, chave_texto))
+    return vetor
+
+def _gravar_no_disco(chave_texto, vetor):
+    conexao = _conexao()
+    matriz = _matriz_em_disco()
+    with transacao(conexao):
+        if conexao.execute("SELECT 1 FROM embeddings WHERE chave = ?", (chave_texto,)).fetchone():
+            return  # Outro processo gravou primeiro
+        ocupadas = conexao.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if ocupadas < CAPACIDADE:
+            linha = ocupadas  # As linhas ocupadas são sempre 0..ocupadas-1
+        else:
+            antiga, linha = conexao.execute("SELECT chave, linha FROM embeddings ORDER BY usado_em LIMIT 1").fetchone()
+            conexao.execute("DELETE FROM embeddings WHERE chave = ?", (antiga,))
+            with _lock:
+                _contadores["despejos"] += 1
+        matriz[linha] = vetor
+        matriz.flush()
+        conexao.execute(
+            "INSERT INTO embeddings (chave, linha, crc, usado_em) VALUES (?, ?, ?, ?)",
+            (chave_texto, linha, zlib.crc32(vetor.tobytes()), time.time()),
+        )
+
+# === API ===
+def _guardar_na_memoria(chave_texto, vetor):
+    with _lock:
+        _memoria[chave_texto] = vetor
+        _memoria.move_to_end(chave_texto)
+        while len(_memoria) > MEMORIA:
+            _memoria.popitem(last=False)
+
+def _gerar(texto, modelo):
+    import openai  # Import pesado: fica para o primeiro uso (ver inicializacao)
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    response = openai.Embedding.create(input=texto, model=modelo)
+    return response['data'][0]['embedding']
+
+def _buscar(chave_texto, texto, modelo):
+    """Disco ou API (o vetor vai para a memória nos dois casos)."""
+    try:
+        vetor = _ler_do_disco(chave_texto)
+    except Exception as e:
+        logging.warning(f"[Embeddings] Falha ao ler o cache em disco: {e}")
+        vetor = None
+        with _lock:
+            _contadores["erros_disco"] += 1
+    if vetor is not None:
+        with _lock:
+            _contadores["acertos_disco"] += 1
+        _guardar_na_memoria(chave_texto, vetor)
+        return vetor
+
+    resultado = _gerar(texto, modelo)
+    with _lock:
+        _contadores["chamadas_api"] += 1
+    vetor = np.asarray(resultado, dtype=np.float32)
+    _guardar_na_memoria(chave_texto, vetor)
+    if len(vetor) == DIMENSAO:
+        try:
+            _gravar_no_disco(chave_texto, vetor)
+        except Exception as e:
+            logging.warning(f"[Embeddings] Falha ao gravar no cache em disco: {e}")
+            with _lock:
+                _contadores["erros_disco"] += 1
+    return vetor
+
+def embedding(texto, modelo=MODELO):
+    """Embedding do texto, do cache quando possível.
+
+    Returns:
+        list: O vetor (lista de floats, como a API devolve).
+    """
+    chave_texto = chave(texto, modelo)
+    with _lock:
+        vetor = _memoria.get(chave_texto)
+        if vetor is not None:
+            _memoria.move_to_end(chave_texto)
+            _contadores["acertos_memoria"] += 1
+            return vetor.tolist()
+        futuro = _em_voo.get(chave_texto)
+        lider = futuro is None
+        if lider:
+            futuro = _em_voo[chave_texto] = Future()
+        else:
+            _contadores["coalescidos"] += 1
+    if not lider:
+        return futuro.result().tolist()  # Outra thread já está buscando o mesmo texto
+    try:
+        vetor = _buscar(chave_texto, texto, modelo)
+        futuro.set_result(vetor)
+        return vetor.tolist()
+    except BaseException as e:
+        futuro.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            _em_voo.pop(chave_texto, None)
+
+# === MÉTRICAS ===
+def metricas():
+    with _lock:
+        resultado = dict(_contadores)
+        resultado["na_memoria"] = len(_memoria)
+    consultas = resultado["acertos_memoria"] + resultado["acertos_disco"] + resultado["chamadas_api"] + resultado["coalescidos"]
+    resultado["taxa_de_acerto"] = round((consultas - resultado["chamadas_api"]) / consultas, 3) if consultas else 0.0
+    resultado["em_disco"] = _conexao().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    resultado["capacidade_disco"] = CAPACIDADE
+    return resultado
@@ -0,0 +1,157 @@
+"""
+Calendário de vencimentos dos gastos fixos com lembrete ativo: data -> {numero: [vencimentos]}.
+
+Mantido pelos avisos da réplica de 'Gastos Fixos' (como o consolidado_mensal):
+salvar_gasto_fixo, atualizar_categoria_gasto_fixo e a ativação de lembretes no
+webhook entram no calendário na hora, e cada recarga da réplica o reconstrói. O
+job diário só consulta os dias de hoje e de amanhã, sem baixar a aba.
+
+Regras da data de vencimento (próximos HORIZONTE dias):
+- dia 29/30/31 em mês mais curto vence no último dia do mês;
+- vencimento em sábado/domingo segue DIA_UTIL: "seguinte" (padrão, como a
+  prorrogação de boletos), "anterior" ou "nenhum" (mantém a data).
+Só entram linhas com LEMBRETE_ATIVO = SIM.
+"""
+import os
+import calendar
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+import pytz
+from agregacao import valor_em_centavos
+from planilhas import formatar_numero
+from replica_planilhas import replica_gastos_fixos
+
+HORIZONTE = int(os.getenv("LEMBRETES_HORIZONTE_DIAS", "35"))
+DIA_UTIL = os.getenv("LEMBRETES_DIA_UTIL", "seguinte")  # seguinte | anterior | nenhum
+
+# Colunas de 'Gastos Fixos': NÚMERO, DESCRIÇÃO, VALOR, FORMA_PGTO, CATEGORIA, DIA_DO_MÊS, LEMBRETE_ATIVO
+COLUNA_NUMERO, COLUNA_DESCRICAO, COLUNA_VALOR, COLUNA_DIA, COLUNA_LEMBRETE = 0, 1, 2, 5, 6
+
+fuso = pytz.timezone("America/Sao_Paulo")
+
+_lock = threading.RLock()
+_ativos = Counter()   # (numero, descricao, centavos, dia) -> quantas linhas iguais estão ativas
+_calendario = {}      # date -> {numero: [{"descricao", "valor", "vencimento"}]}
+_inicio = None        # Primeiro dia coberto pelo calendário (hoje, quando foi montado)
+
+# === DATAS ===
+def data_de_vencimento(ano, mes, dia):
+    """Vencimento do dia do mês em (ano, mes), com ajuste de fim de mês e de dia útil."""
+    data = datetime(ano, mes, min(dia, calendar.monthrange(ano, mes)[1])).date()
+    if DIA_UTIL == "seguinte":
+        while data.weekday() >= 5:
+            data += timedelta(days=1)
+    elif DIA_UTIL == "anterior":
+        while data.weekday() >= 5:
+            data -= timedelta(days=1)
+    return data
+
+def _vencimentos(dia, inicio, fim):
+    """Datas de vencimento do dia do mês entre inicio e fim (inclusive)."""
+    datas = []
+    ano, mes = inicio.year, inicio.month
+    # Começa um mês antes: o ajuste de dia útil pode empurrar um vencimento para dentro do período
+    mes -= 1
+    if not mes:
+        ano, mes = ano - 1, 12
+    while (ano, mes) <= (fim.year, fim.month):
+        data = data_de_vencimento(ano, mes, dia)
+        if inicio <= data <= fim:
+            datas.append(data)
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return datas
+
+# === MONTAGEM ===
+def _chave(linha):
+    """Chave da linha se ela tem lembrete ativo e dados válidos; None caso contrário."""
+    if str(linha[COLUNA_LEMBRETE]).strip().upper() != "SIM":
+        return None
+    numero = formatar_numero(linha[COLUNA_NUMERO])
+    centavos = valor_em_centavos(linha[COLUNA_VALOR])
+    try:
+        dia = int(str(linha[COLUNA_DIA]).strip())
+    except ValueError:
+        return None
+    if not numero or centavos is None or not 1 <= dia <= 31:
+        return None
+    return numero, linha[COLUNA_DESCRICAO].strip(), centavos, dia
+
+def _incluir(chave, fim):
+    numero, descricao, centavos, dia = chave
+    for data in _vencimentos(dia, _inicio, fim):
+        _calendario.setdefault(data, {}).setdefault(numero, []).append(
+            {"descricao": descricao, "valor": centavos / 100, "vencimento": data}
+        )
+
+def _excluir(chave):
+    numero, descricao, centavos, _ = chave
+    for data in list(_calendario):
+        vencimentos = _calendario[data].get(numero)
+        if not vencimentos:
+            continue
+        for i, item in enumerate(vencimentos):
+            if item["descricao"] == descricao and item["valor"] == centavos / 100 and item["vencimento"] == data:
+                del vencimentos[i]
+                break
+        if not vencimentos:
+            del _calendario[data][numero]
+        if not _calendario[data]:
+            del _calendario[data]
+
+def _montar(hoje):
+    """Reconstrói o calendário a partir das linhas ativas (sem acessar a planilha)."""
+    global _calendario, _inicio
+    _calendario, _inicio = {}, hoje
+    fim = hoje + timedelta(days=HORIZONTE)
+    for chave, quantidade in _ativos.items():
+        for _ in range(quantidade):
+            _incluir(chave, fim)
+
+# === AVISOS DA RÉPLICA (chamados sob o lock da réplica) ===
+def _ao_mudar_replica(evento, *dados):
+    with _lock:
+        if evento == "recarga":
+            _ativos.clear()
+            _ativos.update(chave for chave in map(_chave, dados[0]) if chave)
+            _montar(datetime.now(fuso).date())
+            logging.info(f"Calendário de lembretes montado: {sum(_ativos.values())} gasto(s) fixo(s) com lembrete ativo.")
+            return
+        antiga, nova = dados
+        chave_antiga = _chave(antiga) if antiga is not None else None
+        chave_nova = _chave(nova)
+        if chave_antiga == chave_nova:
+            return
+        fim = _inicio + timedelta(days=HORIZONTE) if _inicio else None
+        if chave_antiga and _ativos[chave_antiga]:
+            _ativos[chave_antiga] -= 1
+            if not _ativos[chave_antiga]:
+                del _ativos[chave_antiga]
+            if fim:
+                _excluir(chave_antiga)
+        if chave_nova:
+            _ativos[chave_nova] += 1
+            if fim:
+                _incluir(chave_nova, fim)
+
+# === CONSULTA ===
+def vencimentos_do_dia(data):
+    """{numero: [{"descricao", "valor", "vencimento"}]} dos gastos fixos ativos que vencem na data."""
+    replica_gastos_fixos.atualizar()
+    with _lock:
+        hoje = datetime.now(fuso).date()
+        if _inicio != hoje:
+            _montar(hoje)  # Virou o dia: desloca a janela (só recalcula datas, sem ler a planilha)
+        if not _inicio <= data <= _inicio + timedelta(days=HORIZONTE):
+            # Fora da janela: calcula só para esta data
+            resultado = {}
+            for (numero, descricao, centavos, dia), quantidade in _ativos.items():
+                if data in _vencimentos(dia, data, data):
+                    resultado.setdefault(numero, []).extend(
+                        [{"descricao": descricao, "valor": centavos / 100, "vencimento": data}] * quantidade
+                    )
+            return resultado
+        return {numero: list(itens) for numero, itens in _calendario.get(data, {}).items()}
+
+replica_gastos_fixos.adicionar_ouvinte(_ao_mudar_replica)
@@ -0,0 +1,175 @@
+"""
+Consolidado materializado dos gastos: (usuário, mês, categoria) -> total e quantidade.
+
+É mantido pelos avisos da réplica de 'Gastos Diários': cada linha registrada
+(registrar_gasto), corrigida (corrigir_gasto) ou recategorizada (atualizar_categoria)
+soma ou desconta só a sua parte, e cada recarga completa reconstrói tudo a partir
+do livro. Assim "quanto gastei" e "status dos limites" custam O(categorias).
+
+O consolidado é gravado em disco (escrita atômica) junto com uma marca d'água
+(quantidade de linhas e ID da última). Na primeira carga depois de reiniciar, se o
+início do livro bate com a marca, só as linhas novas são somadas; as
+reconciliações seguintes reconstroem tudo e corrigem edições feitas direto na planilha.
+"""
+import os
+import json
+import logging
+import threading
+from agregacao import valor_em_centavos, data_do_texto, COLUNA_NUMERO, COLUNA_CATEGORIA, COLUNA_VALOR, COLUNA_DATA
+from planilhas import formatar_numero
+from replica_planilhas import replica_gastos_diarios
+
+ARQUIVO = os.getenv("CONSOLIDADO_MENSAL_ARQUIVO", os.path.join("dados", "consolidado_mensal.json"))
+INTERVALO_GRAVACAO = int(os.getenv("CONSOLIDADO_MENSAL_INTERVALO_GRAVACAO", "30"))  # segundos
+COLUNA_ID = 8
+
+_lock = threading.RLock()
+_totais = {}         # numero -> {"AAAA-MM": {categoria: [centavos, quantidade]}}
+_marca = {"linhas": 0, "ultimo_id": ""}
+_alterado = False
+_primeira_carga = True
+_thread_gravacao = None
+
+def _parcela(linha):
+    """(numero, mes, categoria, centavos) da linha, ou None se a data/valor não forem legíveis."""
+    data = data_do_texto(linha[COLUNA_DATA])
+    centavos = valor_em_centavos(linha[COLUNA_VALOR])
+    if data is None or centavos is None:
+        return None
+    categoria = linha[COLUNA_CATEGORIA].strip() or "A DEFINIR"
+    return formatar_numero(linha[COLUNA_NUMERO]), f"{data.year:04d}-{data.month:02d}", categoria, centavos
+
+def _aplicar(linha, sinal):
+    parcela = _parcela(linha)
+    if not parcela:
+        return
+    numero, mes, categoria, centavos = parcela
+    categorias = _totais.setdefault(numero, {}).setdefault(mes, {})
+    total = categorias.setdefault(categoria, [0, 0])
+    total[0] += sinal * centavos
+    total[1] += sinal
+    if total[1] <= 0:
+        del categorias[categoria]
+
+def _reconstruir(linhas):
+    global _totais
+    _totais = {}
+    for linha in linhas:
+        _aplicar(linha, 1)
+    logging.info(f"Consolidado mensal reconstruído a partir de {len(linhas)} linhas do livro.")
+
+# === AVISOS DA RÉPLICA (chamados sob o lock da réplica) ===
+def _ao_mudar_replica(evento, *dados):
+    global _alterado, _primeira_carga
+    with _lock:
+        if evento == "recarga":
+            linhas = dados[0]
+            n = _marca["linhas"]
+            continua_do_disco = (
+                _primeira_carga and 0 < n <= len(linhas) and linhas[n - 1][COLUNA_ID] == _marca["ultimo_id"]
+            )
+            if continua_do_disco:
+                for linha in linhas[n:]:
+                    _aplicar(linha, 1)
+                logging.info(f"Consolidado mensal retomado do disco: {len(linhas) - n} linha(s) nova(s) somadas.")
+            else:
+                _reconstruir(linhas)
+            _primeira_carga = False
+            _marca["linhas"] = len(linhas)
+            _marca["ultimo_id"] = linhas[-1][COLUNA_ID] if linhas else ""
+        else:
+            antiga, nova = dados
+            if antiga is not None:
+                _aplicar(antiga, -1)
+            else:
+                _marca["linhas"] += 1
+                _marca["ultimo_id"] = nova[COLUNA_ID]
+            _aplicar(nova, 1)
+        _alterado = True
+
+# === PERSISTÊNCIA ===
+def carregar_do_disco():
+    global _totais, _marca
+    if not os.path.exists(ARQUIVO):
+        return False
+    try:
+        with open(ARQUIVO, encoding="utf-8") as f:
+            conteudo = json.load(f)
+        with _lock:
+            _totais = conteudo["totais"]
+            _marca = conteudo["marca"]
+        logging.info(f"Consolidado mensal carregado do disco ({_marca['linhas']} linhas do livro).")
+        return True
+    except (OSError, ValueError, KeyError) as e:
+        logging.error(f"Erro ao ler consolidado mensal do disco, será reconstruído: {e}")
+        return False
+
+def gravar():
+    """Grava o consolidado em disco se mudou (arquivo temporário + os.replace)."""
+    global _alterado
+    with _lock:
+        if not _alterado:
+            return False
+        conteudo = json.dumps({"marca": _marca, "totais": _totais}, ensure_ascii=False)
+        _alterado = False
+    pasta = os.path.dirname(ARQUIVO)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    temporario = f"{ARQUIVO}.tmp"
+    try:
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(conteudo)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, ARQUIVO)
+        return True
+    except OSError as e:
+        logging.error(f"Erro ao gravar consolidado mensal: {e}")
+        with _lock:
+            _alterado = True
+        return False
+
+def _loop_gravacao(intervalo):
+    evento = threading.Event()
+    while not evento.wait(intervalo):
+        gravar()
+
+def iniciar_gravacao_periodica(intervalo=INTERVALO_GRAVACAO):
+    """Inicia (uma única vez por processo) a thread que grava o consolidado quando ele muda."""
+    global _thread_gravacao
+    with _lock:
+        if _thread_gravacao and _thread_gravacao.is_alive():
+            return
+        _thread_gravacao = threading.Thread(
+            target=_loop_gravacao, args=(intervalo,), name="consolidado-mensal", daemon=True
+        )
+        _thread_gravacao.start()
+
+def reconstruir():
+    """Reconstrói o consolidado sob demanda a partir do livro inteiro (recarrega a réplica)."""
+    replica_gastos_diarios.recarregar()
+
+# === CONSULTAS (O(categorias)) ===
+def categorias_do_mes(numero, ano, mes):
+    """{categoria: (total em reais, quantidade)} do usuário no mês."""
+    try:
+        replica_gastos_diarios.atualizar()
+    except Exception as e:
+        # Sem acesso à planilha: responde com o que já está consolidado
+        logging.error(f"Erro ao atualizar réplica, usando consolidado local: {e}")
+    with _lock:
+        categorias = _totais.get(formatar_numero(str(numero)), {}).get(f"{ano:04d}-{mes:02d}", {})
+        return {categoria: (centavos / 100, quantidade) for categoria, (centavos, quantidade) in categorias.items()}
+
+def total_da_categoria(numero, ano, mes, categoria):
+    """Total em reais de uma categoria no mês, sem sincronizar a réplica (O(1), para o caminho do registro)."""
+    with _lock:
+        centavos, _ = _totais.get(formatar_numero(str(numero)), {}).get(f"{ano:04d}-{mes:02d}", {}).get(categoria, (0, 0))
+        return centavos / 100
+
+def totais_do_mes(numero, ano, mes):
+    """{categoria: total em reais} do usuário no mês."""
+    return {categoria: total for categoria, (total, _) in categorias_do_mes(numero, ano, mes).items()}
+
+carregar_do_disco()
+replica_gastos_diarios.adicionar_ouvinte(_ao_mudar_replica)
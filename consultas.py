@@ -7,7 +7,8 @@ import datetime
 import pytz
 # Assumindo que existe um módulo para operações com Google Sheets
 # Se o nome for diferente, precisará ser ajustado.
-from planilhas import ler_limites_usuario, ler_gastos_usuario_periodo
+from planilhas import ler_limites_usuario
+import consolidado_mensal
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -34,23 +35,9 @@ def consultar_status_limites(numero_usuario):
         if not limites:
             return "Você ainda não definiu nenhum limite de gasto. Use o comando para definir limites primeiro."
 
-        # Define o período como o mês atual
+        # Totais do mês atual por categoria, direto do consolidado (sem varrer o livro)
         hoje = datetime.datetime.now(fuso_horario)
-        primeiro_dia_mes = hoje.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        # Não precisamos do último dia, a função ler_gastos_usuario_periodo deve lidar com isso
-        # (Assumindo que ela filtra por mês/ano ou data >= primeiro_dia_mes)
-        
-        # Assumindo que ler_gastos_usuario_periodo retorna uma lista de dicionários
-        # com pelo menos as chaves 'Categoria' e 'Valor'
-        gastos_mes = ler_gastos_usuario_periodo(numero_usuario, primeiro_dia_mes)
-
-        gastos_por_categoria = {}
-        if gastos_mes:
-            for gasto in gastos_mes:
-                categoria = gasto.get("Categoria")
-                valor = gasto.get("Valor")
-                if categoria and valor is not None:
-                    gastos_por_categoria[categoria] = gastos_por_categoria.get(categoria, 0) + valor
+        gastos_por_categoria = consolidado_mensal.totais_do_mes(numero_usuario, hoje.year, hoje.month)
         
         logging.info(f"Limites encontrados: {limites}")
         logging.info(f"Gastos agregados do mês: {gastos_por_categoria}")
@@ -0,0 +1,129 @@
+"""
+Buffer write-behind dos contadores de tokens (coluna E) e interações (coluna F).
+
+Os incrementos ficam em memória como deltas pendentes sobre o valor que o
+diretório de usuários já conhece. As leituras (get_interacoes/get_tokens) somam
+base + pendente sem tocar na planilha, e os deltas são gravados de uma vez só,
+com um batch_update por aba, a cada INTERVALO_DESCARGA segundos ou no desligamento.
+"""
+import os
+import logging
+import threading
+from diretorio_usuarios import buscar_usuario, atualizar_usuario
+from planilhas import get_pagantes, get_gratuitos, formatar_numero
+
+INTERVALO_DESCARGA = int(os.getenv("CONTADORES_INTERVALO_DESCARGA", "30"))  # segundos
+
+COLUNAS = {"tokens": "E", "interacoes": "F"}
+
+_lock = threading.Lock()           # Protege _pendentes
+_lock_descarga = threading.Lock()  # Garante uma única descarga por vez
+_pendentes = {}                    # numero -> {"tokens": int, "interacoes": int}
+_thread_descarga = None
+
+def _valor(numero, campo):
+    numero = formatar_numero(numero)
+    # Fora do _lock: com o diretório ainda frio, buscar_usuario lê a planilha
+    usuario = buscar_usuario(numero)
+    base = usuario[campo] if usuario else 0
+    with _lock:
+        return base + _pendentes.get(numero, {}).get(campo, 0)
+
+def _incrementar(numero, campo, quantidade):
+    numero = formatar_numero(numero)
+    with _lock:
+        pendente = _pendentes.setdefault(numero, {"tokens": 0, "interacoes": 0})
+        pendente[campo] += quantidade
+    return _valor(numero, campo)
+
+# === LEITURAS E INCREMENTOS (sem chamadas à API) ===
+def get_interacoes(numero):
+    return _valor(numero, "interacoes")
+
+def get_tokens(numero):
+    return _valor(numero, "tokens")
+
+def incrementar_interacoes(numero, quantidade=1):
+    return _incrementar(numero, "interacoes", quantidade)
+
+def incrementar_tokens(numero, quantidade):
+    return _incrementar(numero, "tokens", quantidade)
+
+# === DESCARGA PARA A PLANILHA ===
+def descarregar():
+    """Grava os contadores pendentes nas colunas E/F (um batch_update por aba).
+
+    Returns:
+        int: Quantidade de usuários gravados com sucesso.
+    """
+    with _lock_descarga:
+        with _lock:
+            snapshot = {numero: dict(delta) for numero, delta in _pendentes.items()}
+        if not snapshot:
+            return 0
+
+        por_aba = {}
+        for numero, delta in snapshot.items():
+            usuario = buscar_usuario(numero)
+            if not usuario:
+                logging.warning(f"Contadores pendentes de {numero} descartados: usuário não está no diretório.")
+                with _lock:
+                    _pendentes.pop(numero, None)
+                continue
+            valores = {
+                "tokens": usuario["tokens"] + delta["tokens"],
+                "interacoes": usuario["interacoes"] + delta["interacoes"],
+            }
+            por_aba.setdefault(usuario["aba"], []).append((numero, usuario["linha"], delta, valores))
+
+        gravados = 0
+        for nome_aba, itens in por_aba.items():
+            aba = get_pagantes() if nome_aba == "Pagantes" else get_gratuitos()
+            dados = [
+                {
+                    "range": f"{COLUNAS['tokens']}{linha}:{COLUNAS['interacoes']}{linha}",
+                    "values": [[valores["tokens"], valores["interacoes"]]],
+                }
+                for _, linha, _, valores in itens
+            ]
+            try:
+                aba.batch_update(dados)
+            except Exception as e:
+                # Mantém os deltas pendentes para a próxima tentativa
+                logging.error(f"[ERRO Planilha] Falha ao descarregar contadores da aba {nome_aba}: {e}")
+                continue
+
+            # Gravou: incorpora o valor gravado na base do diretório e abate o delta já persistido
+            with _lock:
+                for numero, _, delta, valores in itens:
+                    atualizar_usuario(numero, aba=nome_aba, **valores)
+                    pendente = _pendentes.get(numero)
+                    if pendente is None:
+                        continue
+                    for campo in COLUNAS:
+                        pendente[campo] -= delta[campo]
+                    if not any(pendente.values()):
+                        _pendentes.pop(numero, None)
+            gravados += len(itens)
+
+        logging.info(f"Contadores descarregados para {gravados} usuário(s).")
+        return gravados
+
+def _loop_descarga(intervalo):
+    evento = threading.Event()
+    while not evento.wait(intervalo):
+        try:
+            descarregar()
+        except Exception as e:
+            logging.error(f"Erro na descarga periódica de contadores: {e}")
+
+def iniciar_descarga_periodica(intervalo=INTERVALO_DESCARGA):
+    """Inicia (uma única vez por processo) a thread que grava os contadores periodicamente."""
+    global _thread_descarga
+    with _lock:
+        if _thread_descarga and _thread_descarga.is_alive():
+            return
+        _thread_descarga = threading.Thread(
+            target=_loop_descarga, args=(intervalo,), name="contadores-descarga", daemon=True
+        )
+        _thread_descarga.start()
@@ -0,0 +1,210 @@
+"""
+Diretório em memória dos usuários das abas 'Pagantes' e 'Gratuitos'.
+
+Carrega as duas abas uma única vez e mantém um mapa número -> dados do usuário
+(aba, linha, nome, email e contadores). As consultas no caminho do webhook não
+fazem nenhuma chamada à API do Sheets; o diretório se atualiza a cada cadastro
+ou alteração feita pelo próprio app e é ressincronizado periodicamente em
+segundo plano para captar mudanças feitas direto na planilha (ex: upgrade de plano).
+"""
+import os
+import logging
+import threading
+import datetime
+import pytz
+from concurrent.futures import Future
+from planilhas import get_pagantes, get_gratuitos, formatar_numero, GOOGLE_SHEET_ID
+import fila_insercoes
+from gateway_sheets import prioridade
+
+INTERVALO_RESSINCRONIZACAO = int(os.getenv("DIRETORIO_USUARIOS_INTERVALO", "300"))  # segundos
+TENTATIVAS_CARGA = 3  # Leituras descartadas porque o diretório mudou no meio, antes de desistir
+
+ABAS = ("Pagantes", "Gratuitos")  # Ordem de prioridade: Pagantes prevalece sobre Gratuitos
+
+# Protege a troca dos mapas e as atualizações locais. A leitura da planilha acontece fora
+# dele (consultas não esperam a API); cada atualização local incrementa _geracao, e uma
+# ressincronização só troca os mapas se a geração não mudou desde que começou a ler.
+# Assim uma leitura com dados antigos nunca sobrescreve uma alteração mais nova.
+# Quem grava na planilha deve gravar primeiro e só depois atualizar o diretório.
+_lock = threading.RLock()
+_lock_carga = threading.Lock()  # Uma leitura das abas por vez
+_usuarios = {aba: {} for aba in ABAS}
+_carregado = False
+_geracao = 0
+_thread_ressincronizacao = None
+_cadastros_em_andamento = {}  # numero -> Future com o usuário, para não inserir o mesmo número duas vezes
+
+def _inteiro(valor):
+    valor = str(valor).strip()
+    return int(valor) if valor.isdigit() else 0
+
+def _get_aba(nome_aba):
+    return get_pagantes() if nome_aba == "Pagantes" else get_gratuitos()
+
+def _ler_aba(nome_aba):
+    """Lê a aba inteira (1 chamada à API) e monta {numero: dados}. Pula o cabeçalho."""
+    usuarios = {}
+    for i, linha in enumerate(_get_aba(nome_aba).get_all_values()[1:], start=2):
+        linha = linha + [""] * (6 - len(linha))
+        numero = formatar_numero(str(linha[1]))
+        if not numero or numero in usuarios:  # Mantém a primeira ocorrência, como col_values().index()
+            continue
+        usuarios[numero] = {
+            "aba": nome_aba,
+            "linha": i,
+            "nome": linha[0].strip(),     # Coluna A
+            "email": linha[2].strip(),    # Coluna C
+            "tokens": _inteiro(linha[4]),      # Coluna E
+            "interacoes": _inteiro(linha[5]),  # Coluna F
+        }
+    return usuarios
+
+# === CARGA E RESSINCRONIZAÇÃO ===
+def carregar(forcar=False):
+    """Carrega (ou recarrega, se forcar=True) as abas Pagantes e Gratuitos para a memória."""
+    global _usuarios, _carregado
+    if _carregado and not forcar:
+        return
+    with _lock_carga:
+        if _carregado and not forcar:
+            return  # Outra thread carregou enquanto esperávamos
+        for _ in range(TENTATIVAS_CARGA):
+            geracao = _geracao
+            novos = {aba: _ler_aba(aba) for aba in ABAS}
+            with _lock:
+                if _geracao == geracao:
+                    _usuarios = novos
+                    _carregado = True
+                    logging.info(
+                        f"Diretório de usuários carregado: {len(novos['Pagantes'])} pagantes, "
+                        f"{len(novos['Gratuitos'])} gratuitos."
+                    )
+                    return
+            logging.info("Diretório de usuários mudou durante a leitura da planilha; lendo de novo.")
+        logging.warning("Ressincronização do diretório de usuários adiada: alterações locais contínuas.")
+
+def ressincronizar():
+    try:
+        carregar(forcar=True)
+    except Exception as e:
+        logging.error(f"Erro ao ressincronizar diretório de usuários: {e}")
+
+def _loop_ressincronizacao(intervalo):
+    evento = threading.Event()
+    while not evento.wait(intervalo):
+        with prioridade("relatorios"):  # Não disputa a cota do Sheets com o webhook
+            ressincronizar()
+
+def iniciar_ressincronizacao_periodica(intervalo=INTERVALO_RESSINCRONIZACAO):
+    """Inicia (uma única vez por processo) a thread que ressincroniza o diretório em segundo plano."""
+    global _thread_ressincronizacao
+    with _lock:
+        if _thread_ressincronizacao and _thread_ressincronizacao.is_alive():
+            return
+        _thread_ressincronizacao = threading.Thread(
+            target=_loop_ressincronizacao, args=(intervalo,), name="diretorio-usuarios", daemon=True
+        )
+        _thread_ressincronizacao.start()
+
+# === CONSULTAS (O(1), sem chamadas à API depois da carga) ===
+def buscar_na_aba(numero, nome_aba):
+    carregar()
+    usuario = _usuarios[nome_aba].get(formatar_numero(numero))
+    return dict(usuario) if usuario else None
+
+def buscar_usuario(numero):
+    """Retorna uma cópia dos dados do usuário (Pagantes tem prioridade) ou None se não cadastrado."""
+    for nome_aba in ABAS:
+        usuario = buscar_na_aba(numero, nome_aba)
+        if usuario:
+            return usuario
+    return None
+
+def aba_do_usuario(usuario):
+    """Retorna a worksheet (Pagantes/Gratuitos) onde o usuário está."""
+    return _get_aba(usuario["aba"])
+
+# === ATUALIZAÇÕES ===
+def obter_ou_criar_usuario(numero):
+    """Busca o usuário; se não existir, adiciona à aba Gratuitos (via fila de inserções) e registra no diretório.
+
+    Cadastros de números diferentes seguem em paralelo e podem sair no mesmo append_rows;
+    chamadas simultâneas para o mesmo número esperam o mesmo cadastro.
+    """
+    numero = formatar_numero(numero)
+    usuario = buscar_usuario(numero)
+    if usuario:
+        return usuario
+
+    with _lock:
+        usuario = buscar_usuario(numero)  # Outro request pode ter criado enquanto esperávamos
+        if usuario:
+            return usuario
+        cadastro = _cadastros_em_andamento.get(numero)
+        responsavel = cadastro is None
+        if responsavel:
+            cadastro = _cadastros_em_andamento[numero] = Future()
+
+    if not responsavel:
+        return cadastro.result(timeout=fila_insercoes.TIMEOUT_PADRAO)
+
+    try:
+        usuario = _cadastrar(numero)
+        cadastro.set_result(usuario)
+        return usuario
+    except Exception as e:
+        cadastro.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            _cadastros_em_andamento.pop(numero, None)
+
+def _cadastrar(numero):
+    logging.info(f"Usuário {numero} não encontrado. Adicionando à aba Gratuitos.")
+    now = datetime.datetime.now(pytz.timezone("America/Sao_Paulo")).strftime("%d/%m/%Y %H:%M:%S")
+    global _geracao
+    linha = fila_insercoes.inserir(GOOGLE_SHEET_ID, "Gratuitos", [["", numero, "", now, 0, 0]])
+
+    if linha is None:
+        logging.warning(f"Resposta do append sem intervalo para {numero}. Recarregando diretório.")
+        carregar(forcar=True)
+        usuario = buscar_usuario(numero)
+        if not usuario:
+            raise LookupError(f"Usuário {numero} não encontrado após inclusão na aba Gratuitos.")
+        return usuario
+
+    with _lock:
+        _geracao += 1
+        _usuarios["Gratuitos"][numero] = {
+            "aba": "Gratuitos", "linha": linha, "nome": "", "email": "", "tokens": 0, "interacoes": 0
+        }
+    logging.info(f"Usuário {numero} adicionado com sucesso na linha {linha}.")
+    return buscar_usuario(numero)
+
+def atualizar_usuario(numero, aba=None, **campos):
+    """Reflete no diretório uma alteração JÁ gravada na planilha (nome, email, tokens, interacoes...).
+
+    Args:
+        numero (str): Número do usuário.
+        aba (str): Aba a atualizar. Se None, usa a aba em que o usuário está ativo.
+        **campos: Campos a atualizar.
+
+    Returns:
+        bool: True se o usuário foi encontrado e atualizado.
+    """
+    global _geracao
+    numero = formatar_numero(numero)
+    carregar()
+    with _lock:
+        if aba is None:
+            usuario = buscar_usuario(numero)
+            if not usuario:
+                return False
+            aba = usuario["aba"]
+        registro = _usuarios[aba].get(numero)
+        if not registro:
+            return False
+        registro.update(campos)
+        _geracao += 1
+        return True
@@ -1,4 +1,4 @@
-from planilhas import get_gastos_diarios
+from replica_planilhas import replica_gastos_diarios
 from datetime import datetime, timedelta
 import pytz
 import re
@@ -21,8 +21,7 @@ def detectar_emocao(mensagem):
     return None
 
 def aumento_pos_emocao(numero_usuario, emocao, data_mensagem):
-    aba = get_gastos_diarios()
-    registros = aba.get_all_values()[1:]
+    registros = [linha for _, linha in replica_gastos_diarios.linhas_do_usuario(numero_usuario)]
 
     fuso = pytz.timezone("America/Sao_Paulo")
     data_base = datetime.strptime(data_mensagem, "%Y-%m-%d %H:%M:%S")
@@ -1,17 +1,11 @@
 import os
-import gspread
 from dotenv import load_dotenv
+from planilhas import get_aba
 from datetime import datetime, timedelta
 import pytz
-from oauth2client.service_account import ServiceAccountCredentials
 
 load_dotenv()
 GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
-GOOGLE_SHEETS_KEY_FILE = os.getenv("GOOGLE_SHEETS_KEY_FILE")
-
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-creds = ServiceAccountCredentials.from_json_keyfile_name(GOOGLE_SHEETS_KEY_FILE, scope)
-gs = gspread.authorize(creds)
 
 fuso = pytz.timezone("America/Sao_Paulo")
 hoje = datetime.now(fuso).date()
@@ -19,7 +13,7 @@ hoje = datetime.now(fuso).date()
 # === CHECA SE USUÁRIO JÁ GANHOU ESTRELA POR MOTIVO HOJE ===
 def ja_ganhou_hoje(numero, motivo):
     try:
-        aba = gs.open_by_key(GOOGLE_SHEET_ID).worksheet("Engajamento")
+        aba = get_aba(GOOGLE_SHEET_ID, "Engajamento")
         registros = aba.get_all_records()
         for linha in registros:
             if linha["NÚMERO"] == numero and linha["MOTIVO"] == motivo:
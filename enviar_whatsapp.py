@@ -1,25 +1,256 @@
+"""
+Envio de mensagens de WhatsApp (Twilio) por uma fila persistente.
+
+enviar_whatsapp() só grava a mensagem na fila (banco SQLite envios.sqlite3) e
+retorna; ENVIO_WORKERS threads fazem as chamadas ao Twilio com um único Client,
+cuja sessão HTTP mantém as conexões abertas entre envios. Assim o webhook e os
+jobs (alertas, lembretes) não esperam o Twilio.
+
+- Ordem por destinatário: só a mensagem mais antiga ainda não enviada de cada
+  número pode sair, então as partes de uma resposta longa chegam em ordem.
+  Destinatários diferentes saem em paralelo.
+- Retentativas: 429, 5xx e erros de rede voltam para a fila com espera
+  exponencial (com variação aleatória), até ENVIO_TENTATIVAS vezes. Outros erros
+  (ex: número inválido) marcam a mensagem como 'falhou', sem repetir.
+- Taxa: no máximo ENVIO_TAXA mensagens por segundo somando todos os processos
+  (o próximo horário livre fica no próprio banco), com rajadas de até ENVIO_RAJADA.
+- Persistência: mensagens na fila sobrevivem a um reinício. Uma mensagem que
+  ficou 'enviando' quando o processo caiu volta a valer depois de ENVIO_RESERVA segundos.
+"""
 import os
-from twilio.rest import Client
+import time
+import random
+import logging
+import threading
 from dotenv import load_dotenv
+from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+from twilio.base.exceptions import TwilioRestException
+from requests.adapters import HTTPAdapter
+from armazenamento_local import conectar, transacao, caminho_do_banco
 
 load_dotenv()
 
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
-MESSAGING_SERVICE_SID = os.getenv("MESSAGING_SERVICE_SID")
+# main.py sempre usou TWILIO_MESSAGING_SERVICE_SID e este módulo MESSAGING_SERVICE_SID: aceita os dois
+MESSAGING_SERVICE_SID = os.getenv("TWILIO_MESSAGING_SERVICE_SID") or os.getenv("MESSAGING_SERVICE_SID")
+
+BANCO = os.getenv("ENVIO_BANCO", caminho_do_banco("envios.sqlite3"))
+WORKERS = int(os.getenv("ENVIO_WORKERS", "4"))
+TAXA = float(os.getenv("ENVIO_TAXA", "10"))            # mensagens por segundo (todos os processos)
+RAJADA = int(os.getenv("ENVIO_RAJADA", "5"))           # mensagens que podem sair de uma vez após um período parado
+TENTATIVAS = int(os.getenv("ENVIO_TENTATIVAS", "6"))
+ESPERA_BASE = float(os.getenv("ENVIO_ESPERA_BASE", "2"))       # segundos, dobra a cada tentativa
+ESPERA_MAXIMA = float(os.getenv("ENVIO_ESPERA_MAXIMA", "300"))
+RESERVA = float(os.getenv("ENVIO_RESERVA", "120"))     # segundos até uma mensagem 'enviando' ser retomada
+TIMEOUT_HTTP = float(os.getenv("ENVIO_TIMEOUT_HTTP", "15"))
+TAMANHO_PARTE = 1500  # Limite de caracteres por mensagem do WhatsApp/Twilio
+
+_condicao = threading.Condition()
+_threads = []
+_parando = False
+_cliente = None
+_banco_pronto = False
+
+# === CLIENTE TWILIO (um por processo) ===
+def configurado():
+    return bool(TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and MESSAGING_SERVICE_SID)
+
+def cliente_twilio():
+    global _cliente
+    with _condicao:
+        if _cliente is None:
+            http = TwilioHttpClient(pool_connections=True, timeout=TIMEOUT_HTTP)
+            # Uma conexão mantida aberta por worker
+            http.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max(1, WORKERS)))
+            _cliente = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=http)
+        return _cliente
+
+# === BANCO ===
+def _conexao():
+    global _banco_pronto
+    conexao = conectar(BANCO)
+    if not _banco_pronto:
+        conexao.executescript(
+            "CREATE TABLE IF NOT EXISTS envios ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, destino TEXT NOT NULL, corpo TEXT NOT NULL,"
+            " estado TEXT NOT NULL DEFAULT 'pendente', tentativas INTEGER NOT NULL DEFAULT 0,"
+            " proximo_em REAL NOT NULL, reservado_em REAL, criado_em REAL NOT NULL, erro TEXT);"
+            "CREATE INDEX IF NOT EXISTS idx_envios_destino ON envios (destino, estado, id);"
+            "CREATE INDEX IF NOT EXISTS idx_envios_estado ON envios (estado, proximo_em);"
+            "CREATE TABLE IF NOT EXISTS taxa (id INTEGER PRIMARY KEY CHECK (id = 1), proximo_horario REAL NOT NULL);"
+            "INSERT OR IGNORE INTO taxa (id, proximo_horario) VALUES (1, 0);"
+        )
+        _banco_pronto = True
+    return conexao
+
+# === PRODUTORES ===
+def dividir_em_partes(mensagem):
+    return [mensagem[i:i + TAMANHO_PARTE] for i in range(0, len(mensagem), TAMANHO_PARTE)]
 
 def enviar_whatsapp(numero_destino, mensagem):
-    client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    """Coloca a mensagem na fila de envio (dividida em partes de até 1500 caracteres).
+
+    Returns:
+        bool: True se entrou na fila.
+    """
+    if not mensagem or not mensagem.strip():
+        logging.warning(f"Tentativa de enviar mensagem VAZIA para {numero_destino}. Ignorado.")
+        return False
+    agora = time.time()
     try:
-        message = client.messages.create(
+        conexao = _conexao()
+        with transacao(conexao):
+            conexao.executemany(
+                "INSERT INTO envios (destino, corpo, proximo_em, criado_em) VALUES (?, ?, ?, ?)",
+                [(str(numero_destino), parte, agora, agora) for parte in dividir_em_partes(mensagem)],
+            )
+    except Exception as e:
+        logging.error(f"❌ Erro ao enfileirar WhatsApp para {numero_destino}: {e}")
+        return False
+    iniciar()
+    with _condicao:
+        _condicao.notify_all()
+    return True
+
+# === WORKERS ===
+def _reservar():
+    """Reserva a próxima mensagem que pode sair agora.
+
+    Returns:
+        tuple: ((id, destino, corpo, tentativas) ou None, segundos até valer a pena tentar de novo).
+    """
+    agora = time.time()
+    conexao = _conexao()
+    # Leitura sem bloqueio primeiro: workers ociosos não disputam a escrita do banco
+    if not conexao.execute("SELECT 1 FROM envios WHERE estado IN ('pendente', 'enviando') LIMIT 1").fetchone():
+        return None, 1.0
+    with transacao(conexao):
+        proximo_horario = conexao.execute("SELECT proximo_horario FROM taxa WHERE id = 1").fetchone()[0]
+        if proximo_horario > agora:
+            return None, proximo_horario - agora
+        # Só a primeira mensagem ainda não enviada de cada destino é candidata
+        linha = conexao.execute(
+            "SELECT id, destino, corpo, tentativas FROM envios e"
+            " WHERE ((estado = 'pendente' AND proximo_em <= ?) OR (estado = 'enviando' AND reservado_em < ?))"
+            " AND id = (SELECT MIN(id) FROM envios WHERE destino = e.destino AND estado IN ('pendente', 'enviando'))"
+            " ORDER BY proximo_em, id LIMIT 1",
+            (agora, agora - RESERVA),
+        ).fetchone()
+        if linha is None:
+            return None, 1.0
+        conexao.execute("UPDATE envios SET estado = 'enviando', reservado_em = ? WHERE id = ?", (agora, linha[0]))
+        conexao.execute(
+            "UPDATE taxa SET proximo_horario = ? WHERE id = 1",
+            (max(proximo_horario, agora - RAJADA / TAXA) + 1 / TAXA,),
+        )
+    return linha, 0.0
+
+def _temporario(erro):
+    if isinstance(erro, TwilioRestException):
+        return erro.status == 429 or (erro.status or 0) >= 500
+    return True  # Erro de rede/timeout: vale tentar de novo
+
+def _enviar(id_envio, destino, corpo, tentativas):
+    conexao = _conexao()
+    try:
+        message = cliente_twilio().messages.create(
             messaging_service_sid=MESSAGING_SERVICE_SID,
-            body=mensagem,
-            to=f"whatsapp:{numero_destino}"
+            body=corpo,
+            to=f"whatsapp:{destino}"
         )
-        print(f"✅ Mensagem enviada com sucesso para {numero_destino}. SID: {message.sid}")
     except Exception as e:
-        print(f"❌ Erro ao enviar WhatsApp: {e}")
+        tentativas += 1
+        if _temporario(e) and tentativas < TENTATIVAS:
+            espera = min(ESPERA_MAXIMA, ESPERA_BASE * 2 ** (tentativas - 1)) * random.uniform(0.5, 1.5)
+            logging.warning(f"Envio para {destino} falhou ({e}); tentativa {tentativas + 1} em {espera:.0f}s.")
+            with transacao(conexao):
+                conexao.execute(
+                    "UPDATE envios SET estado = 'pendente', tentativas = ?, proximo_em = ?, erro = ? WHERE id = ?",
+                    (tentativas, time.time() + espera, str(e), id_envio),
+                )
+        else:
+            logging.error(f"❌ Erro ao enviar WhatsApp para {destino} (desistindo após {tentativas} tentativa(s)): {e}")
+            with transacao(conexao):
+                conexao.execute(
+                    "UPDATE envios SET estado = 'falhou', tentativas = ?, erro = ? WHERE id = ?",
+                    (tentativas, str(e), id_envio),
+                )
+        return False
+    with transacao(conexao):
+        conexao.execute("DELETE FROM envios WHERE id = ?", (id_envio,))
+    logging.info(f"✅ Mensagem enviada com sucesso para {destino}. SID: {message.sid}")
+    return True
+
+def _loop():
+    while True:
+        with _condicao:
+            if _parando:
+                return
+        try:
+            reservada, espera = _reservar()
+            if reservada:
+                _enviar(*reservada)
+                continue
+        except Exception as e:
+            logging.error(f"Erro na fila de envio de WhatsApp: {e}")
+            espera = 1.0
+        with _condicao:
+            if not _parando:
+                _condicao.wait(min(espera, 1.0))  # Também acorda a cada segundo para ver envios de outros processos
+
+def iniciar(workers=WORKERS):
+    """Inicia (uma única vez por processo) os workers de envio."""
+    global _parando
+    with _condicao:
+        if _threads and any(thread.is_alive() for thread in _threads):
+            return
+        if not configurado():
+            logging.error("Envio de WhatsApp desativado: credenciais do Twilio/Messaging Service não configuradas.")
+            return
+        _parando = False
+        _threads[:] = [
+            threading.Thread(target=_loop, name=f"envio-whatsapp-{i}", daemon=True) for i in range(max(1, workers))
+        ]
+        for thread in _threads:
+            thread.start()
+
+def parar(timeout=15):
+    """Para os workers depois do envio em andamento (o que está na fila continua no banco)."""
+    global _parando
+    with _condicao:
+        _parando = True
+        _condicao.notify_all()
+    limite = time.monotonic() + timeout
+    for thread in _threads:
+        thread.join(max(0.0, limite - time.monotonic()))
+
+def descarregar(timeout=60):
+    """Espera a fila esvaziar (ex: fim de um job rodado pela linha de comando)."""
+    iniciar()
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if not _conexao().execute("SELECT 1 FROM envios WHERE estado IN ('pendente', 'enviando') LIMIT 1").fetchone():
+            return True
+        time.sleep(0.2)
+    return False
+
+# === MÉTRICAS ===
+def metricas():
+    conexao = _conexao()
+    por_estado = dict(conexao.execute("SELECT estado, COUNT(*) FROM envios GROUP BY estado").fetchall())
+    mais_antiga = conexao.execute("SELECT MIN(criado_em) FROM envios WHERE estado = 'pendente'").fetchone()[0]
+    return {
+        "workers_vivos": sum(thread.is_alive() for thread in _threads),
+        "taxa_por_segundo": TAXA,
+        "pendentes": por_estado.get("pendente", 0),
+        "enviando": por_estado.get("enviando", 0),
+        "falhas": por_estado.get("falhou", 0),
+        "espera_mais_antiga": round(time.time() - mais_antiga, 3) if mais_antiga else 0.0,
+    }
 
 # Exemplo para teste direto:
 if __name__ == "__main__":
-    enviar_whatsapp("+5562999022021", "Teste do Meu Conselheiro Financeiro em PRODUÇÃO!")
\ No newline at end of file
+    enviar_whatsapp("+5562999022021", "Teste do Meu Conselheiro Financeiro em PRODUÇÃO!")
+    descarregar()
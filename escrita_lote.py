@@ -0,0 +1,151 @@
+"""
+Agrupamento de gravações em células do Google Sheets dentro de um mesmo request.
+
+As abas devolvidas por planilhas.get_aba são embrulhadas em AbaComLote. Fora de um
+bloco `with escrita_em_lote():` elas se comportam exatamente como a worksheet do
+gspread. Dentro do bloco, update_cell/update ficam pendentes em memória e são
+gravados no fim com um único batch_update por aba (e por modo de entrada).
+
+Quem precisa saber que a gravação aconteceu antes de seguir (ex: atualizar uma
+réplica em memória ou responder "corrigido" ao usuário) chama aba.gravar_pendentes(),
+que grava na hora as pendências daquela aba e relança o erro, se houver.
+
+Leituras feitas dentro do bloco enxergam as gravações pendentes: cell e row_values
+aplicam as pendências por cima do valor lido; as demais leituras (get_all_values,
+get, col_values...) gravam as pendências da aba antes de ler.
+"""
+import logging
+import contextvars
+from contextlib import contextmanager
+from gspread.cell import Cell
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+
+USER_ENTERED = "USER_ENTERED"  # Modo usado pelo update_cell do gspread
+RAW = "RAW"                    # Padrão do update/batch_update do gspread
+
+# Lote ativo no contexto atual (request/tarefa). None = gravação imediata.
+_lote_atual = contextvars.ContextVar("lote_escritas", default=None)
+
+# Leituras que precisam ver a aba já com as pendências gravadas
+_LEITURAS_COM_DESCARGA = {
+    "get", "get_all_values", "get_all_records", "get_values", "batch_get",
+    "col_values", "acell", "range", "find", "findall", "append_row", "append_rows",
+}
+
+class LoteEscritas:
+    """Gravações pendentes por aba: {worksheet: {(linha, coluna): (valor, modo)}} em ordem de chegada."""
+
+    def __init__(self):
+        self._pendentes = {}
+
+    def registrar(self, aba, linha, coluna, valor, modo):
+        self._pendentes.setdefault(aba, {})[(linha, coluna)] = (valor, modo)
+
+    def pendentes_da_aba(self, aba):
+        return self._pendentes.get(aba, {})
+
+    def gravar_aba(self, aba):
+        """Grava as pendências de uma aba (um batch_update por modo de entrada)."""
+        pendentes = self._pendentes.pop(aba, None)
+        if not pendentes:
+            return 0
+        por_modo = {}
+        for (linha, coluna), (valor, modo) in pendentes.items():
+            por_modo.setdefault(modo, []).append({"range": rowcol_to_a1(linha, coluna), "values": [[valor]]})
+        for modo, dados in por_modo.items():
+            aba.batch_update(dados, value_input_option=modo)
+        return len(pendentes)
+
+    def gravar(self):
+        """Grava as pendências de todas as abas. Tenta todas e relança o primeiro erro, se houver."""
+        erro = None
+        for aba in list(self._pendentes):
+            try:
+                total = self.gravar_aba(aba)
+                logging.info(f"Lote de escrita gravado na aba '{aba.title}': {total} célula(s) em 1 chamada.")
+            except Exception as e:
+                logging.error(f"[ERRO Planilha] Falha ao gravar lote de escrita na aba '{aba.title}': {e}")
+                erro = erro or e
+        if erro:
+            raise erro
+
+@contextmanager
+def escrita_em_lote():
+    """Agrupa as gravações feitas no bloco e grava tudo na saída.
+
+    Blocos aninhados participam do lote mais externo (a gravação acontece uma vez só,
+    no fim do bloco de fora). As pendências são gravadas mesmo se o bloco levantar
+    exceção, como aconteceria com as gravações imediatas.
+    """
+    if _lote_atual.get() is not None:
+        yield _lote_atual.get()
+        return
+    lote = LoteEscritas()
+    token = _lote_atual.set(lote)
+    try:
+        yield lote
+    finally:
+        _lote_atual.reset(token)
+        lote.gravar()
+
+class AbaComLote:
+    """Proxy de gspread.Worksheet que respeita o lote de escritas do contexto atual."""
+
+    def __init__(self, aba):
+        self._aba = aba
+
+    def __getattr__(self, nome):
+        atributo = getattr(self._aba, nome)
+        if nome in _LEITURAS_COM_DESCARGA and callable(atributo):
+            def com_descarga(*args, **kwargs):
+                lote = _lote_atual.get()
+                if lote is not None:
+                    lote.gravar_aba(self._aba)
+                return atributo(*args, **kwargs)
+            return com_descarga
+        return atributo
+
+    def __repr__(self):
+        return f"AbaComLote({self._aba!r})"
+
+    # === Escritas ===
+    def gravar_pendentes(self):
+        """Grava agora as pendências desta aba no lote atual (nada a fazer fora de um lote)."""
+        lote = _lote_atual.get()
+        return lote.gravar_aba(self._aba) if lote is not None else 0
+
+    def update_cell(self, row, col, value):
+        lote = _lote_atual.get()
+        if lote is None:
+            return self._aba.update_cell(row, col, value)
+        lote.registrar(self._aba, row, col, value, USER_ENTERED)
+
+    def update(self, range_name, values=None, **kwargs):
+        lote = _lote_atual.get()
+        # Só agrupa a forma simples (intervalo + matriz de valores); o resto vai direto
+        if lote is None or not isinstance(values, list) or set(kwargs) - {"raw", "value_input_option"}:
+            return self._aba.update(range_name, values, **kwargs)
+        modo = kwargs.get("value_input_option") or (RAW if kwargs.get("raw", True) else USER_ENTERED)
+        linha_inicial, coluna_inicial = a1_to_rowcol(range_name.split("!")[-1].split(":")[0])
+        for i, valores_linha in enumerate(values):
+            for j, valor in enumerate(valores_linha):
+                lote.registrar(self._aba, linha_inicial + i, coluna_inicial + j, valor, modo)
+
+    # === Leituras com as gravações pendentes aplicadas ===
+    def cell(self, row, col, **kwargs):
+        lote = _lote_atual.get()
+        pendente = lote.pendentes_da_aba(self._aba).get((row, col)) if lote else None
+        if pendente is not None:
+            return Cell(row, col, pendente[0])
+        return self._aba.cell(row, col, **kwargs)
+
+    def row_values(self, row, **kwargs):
+        valores = self._aba.row_values(row, **kwargs)
+        lote = _lote_atual.get()
+        if lote is None:
+            return valores
+        for (linha, coluna), (valor, _) in lote.pendentes_da_aba(self._aba).items():
+            if linha == row:
+                valores += [""] * (coluna - len(valores))
+                valores[coluna - 1] = valor
+        return valores
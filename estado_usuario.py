@@ -1,30 +1,223 @@
+"""
+Estado da conversa de cada usuário, guardado num banco SQLite local (modo WAL).
+
+Antes era um arquivo estados/<numero>.json reescrito inteiro a cada salvar_estado,
+várias vezes por mensagem, com um cache em memória que só crescia. Agora:
+
+- cada estado é uma linha (numero, dados JSON, versao) do banco estados.sqlite3,
+  gravada em transação (atômica: um crash no meio não deixa estado pela metade);
+- um cache LRU de até CACHE_MAXIMO estados evita reler o JSON; a versão é
+  conferida no banco a cada carga, para enxergar o que outro processo gravou;
+- dentro de sessao_de_estado() (uma por mensagem processada), salvar_estado só
+  guarda uma cópia e marca o estado como alterado: a gravação em disco acontece
+  uma vez, no fim da sessão;
+- se outro processo gravou o mesmo estado nesse meio tempo (versão diferente),
+  as chaves alteradas pela sessão são aplicadas sobre a versão mais nova.
+
+Os arquivos antigos de estados/ são importados na primeira vez que o banco é aberto.
+"""
 import json
 import os
+import glob
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from armazenamento_local import conectar, transacao, caminho_do_banco
+
+BANCO = os.getenv("ESTADOS_BANCO", caminho_do_banco("estados.sqlite3"))
+PASTA_ANTIGA = "estados"
+CACHE_MAXIMO = int(os.getenv("ESTADOS_CACHE_MAXIMO", "2000"))
+
+_lock = threading.Lock()
+_cache = OrderedDict()  # numero -> (texto JSON, versao), do menos para o mais usado
+_banco_pronto = False
+_sessao = ContextVar("sessao_de_estado", default=None)
+
+class _EstadoDaSessao:
+    def __init__(self, estado, texto_base, versao_base):
+        self.estado = estado            # Objeto entregue por carregar_estado (o mesmo durante a sessão)
+        self.texto_base = texto_base    # Como estava no banco quando a sessão carregou
+        self.versao_base = versao_base
+        self.texto_salvo = texto_base   # Última versão passada a salvar_estado (None = resetado)
+        self.alterado = False
+
+# === BANCO ===
+def _conexao():
+    global _banco_pronto
+    conexao = conectar(BANCO)
+    if not _banco_pronto:
+        with _lock:
+            if not _banco_pronto:
+                conexao.execute(
+                    "CREATE TABLE IF NOT EXISTS estados ("
+                    "numero TEXT PRIMARY KEY, dados TEXT NOT NULL, versao INTEGER NOT NULL, atualizado_em REAL NOT NULL)"
+                )
+                _migrar_arquivos_antigos(conexao)
+                _banco_pronto = True
+    return conexao
+
+def _migrar_arquivos_antigos(conexao):
+    """Importa estados/<numero>.json para o banco (só números que ainda não estão lá)."""
+    arquivos = glob.glob(os.path.join(PASTA_ANTIGA, "*.json"))
+    if not arquivos:
+        return
+    importados = 0
+    with transacao(conexao):
+        for caminho in arquivos:
+            numero = os.path.splitext(os.path.basename(caminho))[0]
+            try:
+                with open(caminho, "r", encoding="utf-8") as file:
+                    texto = json.dumps(json.load(file), ensure_ascii=False)
+            except (OSError, ValueError) as e:
+                logging.error(f"Estado antigo {caminho} ilegível, ignorado: {e}")
+                continue
+            cursor = conexao.execute(
+                "INSERT OR IGNORE INTO estados (numero, dados, versao, atualizado_em) VALUES (?, ?, 1, ?)",
+                (numero, texto, time.time()),
+            )
+            importados += cursor.rowcount
+    if importados:
+        logging.info(f"{importados} estado(s) importado(s) de {PASTA_ANTIGA}/ para {BANCO}.")
 
-_estados_cache = {}
+def _lembrar(numero, texto, versao):
+    with _lock:
+        if texto is None:
+            _cache.pop(numero, None)
+            return
+        _cache[numero] = (texto, versao)
+        _cache.move_to_end(numero)
+        while len(_cache) > CACHE_MAXIMO:
+            _cache.popitem(last=False)
 
+def _ler(numero):
+    """(texto JSON, versao) atual do estado; (None, 0) se não existe. Só relê os dados se a versão mudou."""
+    conexao = _conexao()
+    linha = conexao.execute("SELECT versao FROM estados WHERE numero = ?", (numero,)).fetchone()
+    if linha is None:
+        _lembrar(numero, None, 0)
+        return None, 0
+    with _lock:
+        em_cache = _cache.get(numero)
+        if em_cache and em_cache[1] == linha[0]:
+            _cache.move_to_end(numero)
+            return em_cache
+    linha = conexao.execute("SELECT dados, versao FROM estados WHERE numero = ?", (numero,)).fetchone()
+    if linha is None:
+        return None, 0
+    _lembrar(numero, linha[0], linha[1])
+    return linha[0], linha[1]
+
+def _mesclar(texto_base, texto_nosso, texto_atual):
+    """Aplica sobre o estado atual só as chaves que mudaram entre base e nosso."""
+    base = json.loads(texto_base) if texto_base else {}
+    nosso = json.loads(texto_nosso) if texto_nosso else {}
+    atual = json.loads(texto_atual) if texto_atual else {}
+    for chave, valor in nosso.items():
+        if chave not in base or base[chave] != valor:
+            atual[chave] = valor
+    for chave in base:
+        if chave not in nosso:
+            atual.pop(chave, None)
+    return json.dumps(atual, ensure_ascii=False)
+
+def _gravar(conexao, numero, texto_base, versao_base, texto_novo):
+    """Grava o estado (chamar dentro de uma transação). Retorna (texto gravado, nova versão); (None, 0) se apagou."""
+    linha = conexao.execute("SELECT dados, versao FROM estados WHERE numero = ?", (numero,)).fetchone()
+    texto_atual, versao_atual = linha if linha else (None, 0)
+    if versao_atual != versao_base and texto_novo is not None:
+        logging.warning(f"Estado de {numero} alterado fora desta sessão (outro processo ou thread); mesclando as chaves alteradas.")
+        texto_novo = _mesclar(texto_base, texto_novo, texto_atual)
+    if texto_novo is None:
+        conexao.execute("DELETE FROM estados WHERE numero = ?", (numero,))
+        return None, 0
+    conexao.execute(
+        "INSERT INTO estados (numero, dados, versao, atualizado_em) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(numero) DO UPDATE SET dados = excluded.dados, versao = excluded.versao, atualizado_em = excluded.atualizado_em",
+        (numero, texto_novo, versao_atual + 1, time.time()),
+    )
+    return texto_novo, versao_atual + 1
+
+def _gravar_agora(numero, texto_base, versao_base, texto_novo):
+    conexao = _conexao()
+    with transacao(conexao):
+        gravado = _gravar(conexao, numero, texto_base, versao_base, texto_novo)
+    _lembrar(numero, *gravado)
+
+# === SESSÃO (uma gravação por mensagem) ===
+@contextmanager
+def sessao_de_estado():
+    """Agrupa as gravações de estado feitas dentro do bloco numa única transação no final.
+
+    Sessões aninhadas usam a de fora. O que foi passado a salvar_estado é gravado
+    mesmo se o bloco terminar com exceção (como acontecia quando cada chamada gravava na hora).
+    """
+    if _sessao.get() is not None:
+        yield
+        return
+    estados = {}
+    token = _sessao.set(estados)
+    try:
+        yield
+    finally:
+        _sessao.reset(token)
+        _gravar_sessao(estados)
+
+def _gravar_sessao(estados):
+    alterados = {numero: item for numero, item in estados.items() if item.alterado}
+    if not alterados:
+        return
+    conexao = _conexao()
+    with transacao(conexao):
+        gravados = {
+            numero: _gravar(conexao, numero, item.texto_base, item.versao_base, item.texto_salvo)
+            for numero, item in alterados.items()
+        }
+    for numero, gravado in gravados.items():
+        _lembrar(numero, *gravado)
+
+# === API ===
 def carregar_estado(user_number):
-    if user_number not in _estados_cache:
-        caminho = f"estados/{user_number}.json"
-        if os.path.exists(caminho):
-            with open(caminho, "r", encoding="utf-8") as file:
-                _estados_cache[user_number] = json.load(file)
-        else:
-            _estados_cache[user_number] = {}
-    return _estados_cache[user_number]
+    estados = _sessao.get()
+    if estados is not None and user_number in estados:
+        return estados[user_number].estado
+    texto, versao = _ler(user_number)
+    estado = json.loads(texto) if texto else {}
+    if estados is not None:
+        estados[user_number] = _EstadoDaSessao(estado, texto, versao)
+    return estado
 
 def salvar_estado(user_number, estado):
-    _estados_cache[user_number] = estado
-    caminho = f"estados/{user_number}.json"
-    os.makedirs(os.path.dirname(caminho), exist_ok=True)
-    with open(caminho, "w", encoding="utf-8") as file:
-        json.dump(estado, file)
+    texto = json.dumps(estado, ensure_ascii=False)
+    estados = _sessao.get()
+    if estados is None:
+        texto_base, versao_base = _ler(user_number)
+        _gravar_agora(user_number, texto_base, versao_base, texto)
+        return
+    item = estados.get(user_number)
+    if item is None:
+        texto_base, versao_base = _ler(user_number)
+        item = estados[user_number] = _EstadoDaSessao(estado, texto_base, versao_base)
+    item.estado = estado
+    item.texto_salvo = texto
+    item.alterado = True
 
 def resetar_estado(user_number):
-    caminho = f"estados/{user_number}.json"
-    if os.path.exists(caminho):
-        os.remove(caminho)
-    
+    estados = _sessao.get()
+    if estados is None:
+        texto_base, versao_base = _ler(user_number)
+        _gravar_agora(user_number, texto_base, versao_base, None)
+        return
+    item = estados.get(user_number)
+    if item is None:
+        texto_base, versao_base = _ler(user_number)
+        item = estados[user_number] = _EstadoDaSessao({}, texto_base, versao_base)
+    item.estado = {}
+    item.texto_salvo = None
+    item.alterado = True
+
 def resposta_enviada_recentemente(user_number, resposta_atual):
     estado = carregar_estado(user_number)
     ultima_resposta = estado.get("ultima_resposta", "")
@@ -0,0 +1,162 @@
+"""
+Execução dos jobs em lote (lembretes, alertas) em paralelo, com checkpoint por usuário.
+
+executar() distribui os itens do job (um por usuário) num ThreadPoolExecutor de
+até WORKERS threads, então a latência de planilha/Twilio de um usuário não
+espera a do anterior. Cada item terminado é anotado no banco checkpoints.sqlite3
+(job, execução, chave, resultado). Se o processo cair no meio, a próxima
+chamada com a mesma execução pula o que já foi feito e só processa o resto;
+itens que falharam são tentados de novo. A execução vem do chamador, do
+agendador (execucao_agendada(), com o horário agendado do job) ou, sem nenhuma
+das duas, é a última que não terminou e começou há menos de RETOMAR_HORAS —
+uma execução interrompida antiga não faz as noites seguintes pularem usuários.
+
+No fim, um resumo (enviados, ignorados, falhas, já feitos, tempo total) é
+registrado no log e na tabela de execuções.
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from armazenamento_local import conectar, transacao, caminho_do_banco
+
+BANCO = os.getenv("CHECKPOINTS_BANCO", caminho_do_banco("checkpoints.sqlite3"))
+WORKERS = int(os.getenv("JOBS_WORKERS", "16"))
+RETOMAR_HORAS = float(os.getenv("JOBS_RETOMAR_HORAS", "6"))  # idade máxima de uma execução interrompida retomada
+PROGRESSO_A_CADA = int(os.getenv("JOBS_PROGRESSO_A_CADA", "500"))  # itens entre linhas de progresso no log
+
+# Resultados possíveis de um item
+ENVIADO, IGNORADO, FALHOU = "enviado", "ignorado", "falhou"
+_CONTADORES = {ENVIADO: "enviados", IGNORADO: "ignorados", FALHOU: "falhas"}
+
+_lock = threading.Lock()
+_banco_pronto = False
+_execucao_agendada = contextvars.ContextVar("execucao_agendada", default=None)
+
+@contextmanager
+def execucao_agendada(identificador):
+    """Usa `identificador` como execução dos executar() chamados dentro do bloco sem execução explícita."""
+    token = _execucao_agendada.set(identificador)
+    try:
+        yield
+    finally:
+        _execucao_agendada.reset(token)
+
+def _conexao():
+    global _banco_pronto
+    conexao = conectar(BANCO, sincronismo="NORMAL")
+    if not _banco_pronto:
+        conexao.executescript(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " job TEXT NOT NULL, execucao TEXT NOT NULL, chave TEXT NOT NULL, resultado TEXT NOT NULL,"
+            " PRIMARY KEY (job, execucao, chave));"
+            "CREATE TABLE IF NOT EXISTS execucoes ("
+            " job TEXT NOT NULL, execucao TEXT NOT NULL, iniciada_em REAL NOT NULL, terminada_em REAL,"
+            " total INTEGER, enviados INTEGER, ignorados INTEGER, falhas INTEGER, ja_feitos INTEGER,"
+            " PRIMARY KEY (job, execucao));"
+        )
+        _banco_pronto = True
+    return conexao
+
+def _execucao_a_retomar(conexao, job):
+    linha = conexao.execute(
+        "SELECT execucao FROM execucoes WHERE job = ? AND terminada_em IS NULL AND iniciada_em >= ?"
+        " ORDER BY iniciada_em DESC LIMIT 1",
+        (job, time.time() - RETOMAR_HORAS * 3600),
+    ).fetchone()
+    return linha[0] if linha else None
+
+def _anotar(conexao, job, execucao, chave, resultado):
+    with _lock, transacao(conexao):
+        conexao.execute(
+            "INSERT OR REPLACE INTO checkpoints (job, execucao, chave, resultado) VALUES (?, ?, ?, ?)",
+            (job, execucao, chave, resultado),
+        )
+
+def executar(job, itens, funcao, execucao=None, workers=WORKERS):
+    """Roda funcao(item) para cada (chave, item) em paralelo, com checkpoint por chave.
+
+    Args:
+        job (str): Nome do job (ex: "lembretes").
+        itens (iterable): Pares (chave, item). A chave identifica o item entre execuções (ex: número do usuário).
+        funcao (callable): funcao(item) -> ENVIADO ou IGNORADO (True/False/None também valem). Exceção = FALHOU.
+        execucao (str): Identificador da execução (ex: a data, para rodar no máximo uma vez por dia).
+            None = a de execucao_agendada(), senão a última do job que não terminou há menos de
+            RETOMAR_HORAS, senão uma nova.
+        workers (int): Itens processados ao mesmo tempo.
+
+    Returns:
+        dict: Resumo com total, enviados, ignorados, falhas, ja_feitos e duracao (segundos).
+    """
+    inicio = time.monotonic()
+    conexao = _conexao()
+    execucao = (
+        execucao or _execucao_agendada.get() or _execucao_a_retomar(conexao, job)
+        or datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+    )
+    with _lock, transacao(conexao):
+        conexao.execute(
+            "INSERT INTO execucoes (job, execucao, iniciada_em) VALUES (?, ?, ?) "
+            "ON CONFLICT(job, execucao) DO UPDATE SET terminada_em = NULL",
+            (job, execucao, time.time()),
+        )
+    feitos = {
+        chave for (chave,) in conexao.execute(
+            "SELECT chave FROM checkpoints WHERE job = ? AND execucao = ? AND resultado != ?", (job, execucao, FALHOU)
+        )
+    }
+    if feitos:
+        logging.info(f"[{job}] Retomando a execução {execucao}: {len(feitos)} item(ns) já feito(s) serão pulados.")
+
+    resumo = {"job": job, "execucao": execucao, "total": 0, "enviados": 0, "ignorados": 0, "falhas": 0, "ja_feitos": 0}
+
+    def _rodar(chave, item):
+        try:
+            resultado = funcao(item)
+            resultado = resultado if resultado in (ENVIADO, IGNORADO) else (ENVIADO if resultado else IGNORADO)
+        except Exception as e:
+            logging.error(f"[{job}] Falha no item {chave}: {e}")
+            resultado = FALHOU
+        _anotar(_conexao(), job, execucao, chave, resultado)
+        return resultado
+
+    def _contar(futuros):
+        for futuro in futuros:
+            resumo[_CONTADORES[futuro.result()]] += 1
+            processados = resumo["enviados"] + resumo["ignorados"] + resumo["falhas"]
+            if processados % PROGRESSO_A_CADA == 0:
+                logging.info(f"[{job}] {processados} item(ns) processado(s) ({time.monotonic() - inicio:.1f}s).")
+
+    # Mantém no máximo 2x workers itens em voo: a lista de itens pode ser grande (um por usuário)
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=f"job-{job}") as executor:
+        em_voo = set()
+        for chave, item in itens:
+            resumo["total"] += 1
+            chave = str(chave)
+            if chave in feitos:
+                resumo["ja_feitos"] += 1
+                continue
+            # Cada item roda no contexto de quem chamou (ex: a faixa de prioridade do Sheets)
+            em_voo.add(executor.submit(contextvars.copy_context().run, _rodar, chave, item))
+            if len(em_voo) >= 2 * max(1, workers):
+                terminados, em_voo = wait(em_voo, return_when=FIRST_COMPLETED)
+                _contar(terminados)
+        _contar(wait(em_voo).done)
+
+    resumo["duracao"] = round(time.monotonic() - inicio, 3)
+    with _lock, transacao(conexao):
+        conexao.execute(
+            "UPDATE execucoes SET terminada_em = ?, total = ?, enviados = ?, ignorados = ?, falhas = ?, ja_feitos = ? "
+            "WHERE job = ? AND execucao = ?",
+            (time.time(), resumo["total"], resumo["enviados"], resumo["ignorados"], resumo["falhas"], resumo["ja_feitos"],
+             job, execucao),
+        )
+    logging.info(
+        f"[{job}] Execução {execucao} concluída em {resumo['duracao']:.1f}s: {resumo['enviados']} enviado(s), "
+        f"{resumo['ignorados']} ignorado(s), {resumo['falhas']} falha(s), {resumo['ja_feitos']} já feito(s) antes."
+    )
+    return resumo
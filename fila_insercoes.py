@@ -0,0 +1,324 @@
+"""
+Fila de inserções (append) no Google Sheets, com coalescência por aba.
+
+Os produtores (registro de gastos, gastos fixos, limites, cadastro de usuários)
+enfileiram linhas e recebem um Future com o número da primeira linha gravada.
+Uma thread junta os pedidos de uma mesma aba e grava tudo com um único
+append_rows. Com a thread parada, o pedido é gravado na hora; os que chegam
+enquanto um append_rows está em andamento vão juntos no próximo (até
+TAMANHO_LOTE linhas). ESPERA_MAXIMA só limita a espera quando outra thread
+(descarregar) está gravando.
+
+inserir() espera até TIMEOUT_PADRAO. Se o tempo acabar com o pedido ainda na fila,
+ele é cancelado (nada é gravado) e inserir levanta TimeoutError. Se o append_rows
+já foi enviado, o pedido não pode mais ser desfeito: inserir levanta GravacaoPendente,
+e quem chamou registra com quando_gravado() o que fazer quando ele terminar (ex:
+atualizar a réplica ou liberar o ID reservado), em vez de tratar como falha.
+
+Cada pedido é anotado num diário local (JSON Lines) antes de entrar na fila,
+marcado como "enviando" logo antes do append_rows e confirmado depois, junto com
+o intervalo (updatedRange) que a API devolveu. Se o processo cair, a próxima
+inicialização regrava os pedidos que nunca foram enviados. Os que podem ter sido
+aplicados (enviados sem confirmação) são conferidos contra a planilha antes:
+pela coluna de ID quando a aba tem uma (ex: Gastos Diários), senão procurando as
+mesmas linhas, em sequência, no conteúdo da aba.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import Future
+from planilhas import get_aba, linha_do_append
+
+TAMANHO_LOTE = int(os.getenv("FILA_INSERCOES_TAMANHO_LOTE", "100"))     # linhas por append_rows
+ESPERA_MAXIMA = float(os.getenv("FILA_INSERCOES_ESPERA_MAXIMA", "0.3"))  # segundos
+TIMEOUT_PADRAO = float(os.getenv("FILA_INSERCOES_TIMEOUT", "60"))        # segundos esperando a gravação
+ARQUIVO_DIARIO = os.getenv("FILA_INSERCOES_DIARIO", os.path.join("dados", "fila_insercoes.jsonl"))
+
+_condicao = threading.Condition()  # Protege _pendentes, _em_gravacao e o arquivo do diário
+_pendentes = {}                    # (sheet_id, nome_aba, modo) -> [pedido, ...] em ordem de chegada
+_em_gravacao = 0                   # Pedidos retirados da fila e ainda não confirmados
+_thread = None
+
+class GravacaoPendente(TimeoutError):
+    """inserir() passou do tempo, mas o append_rows já foi enviado e ainda pode ser aplicado."""
+
+    def __init__(self, futuro, mensagem):
+        super().__init__(mensagem)
+        self.futuro = futuro
+
+class _Pedido:
+    def __init__(self, id_pedido, sheet_id, nome_aba, linhas, modo, coluna_id, futuro=None):
+        self.id = id_pedido
+        self.sheet_id = sheet_id
+        self.nome_aba = nome_aba
+        self.linhas = linhas
+        self.modo = modo
+        self.coluna_id = coluna_id
+        self.futuro = futuro or Future()
+        self.criado_em = time.monotonic()
+
+    def para_diario(self):
+        return {
+            "id": self.id, "sheet_id": self.sheet_id, "aba": self.nome_aba,
+            "linhas": self.linhas, "modo": self.modo, "coluna_id": self.coluna_id,
+        }
+
+# === DIÁRIO LOCAL (chamar com _condicao adquirida) ===
+def _anotar_no_diario(registro):
+    pasta = os.path.dirname(ARQUIVO_DIARIO)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    with open(ARQUIVO_DIARIO, "a", encoding="utf-8") as f:
+        f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def _compactar_diario():
+    """Zera o diário quando não há nada na fila nem em gravação."""
+    if not _pendentes and not _em_gravacao and os.path.exists(ARQUIVO_DIARIO):
+        open(ARQUIVO_DIARIO, "w", encoding="utf-8").close()
+
+def _ler_diario():
+    """Retorna os pedidos anotados e ainda não resolvidos, na ordem em que foram feitos.
+
+    Cada registro vem com "enviado": True se o append_rows pode ter chegado à API.
+    """
+    if not os.path.exists(ARQUIVO_DIARIO):
+        return []
+    pedidos, resolvidos, enviados = {}, set(), set()
+    with open(ARQUIVO_DIARIO, encoding="utf-8") as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError:
+                logging.warning("Linha corrompida no diário da fila de inserções ignorada.")
+                continue
+            if "resolvidos" in registro:
+                resolvidos.update(registro["resolvidos"])
+            elif "enviando" in registro:
+                enviados.update(registro["enviando"])
+            elif "id" in registro:
+                pedidos[registro["id"]] = registro
+    return [
+        dict(registro, enviado=id_pedido in enviados)
+        for id_pedido, registro in pedidos.items() if id_pedido not in resolvidos
+    ]
+
+# === PRODUTORES ===
+def enfileirar(sheet_id, nome_aba, linhas, value_input_option="RAW", coluna_id=None):
+    """Enfileira linhas para serem gravadas juntas num append_rows da aba.
+
+    Args:
+        sheet_id (str): ID da planilha.
+        nome_aba (str): Nome da aba.
+        linhas (list): Lista de linhas (listas de valores) deste pedido. Ficam consecutivas na planilha.
+        value_input_option (str): "RAW" (padrão do append_row) ou "USER_ENTERED".
+        coluna_id (int): Índice (base 0) da coluna de ID único, usado para não duplicar na recuperação.
+
+    Returns:
+        Future: Resolve com o número da primeira linha gravada (ou None se a API não informar).
+    """
+    iniciar()
+    pedido = _Pedido(uuid.uuid4().hex, sheet_id, nome_aba, [list(linha) for linha in linhas],
+                     value_input_option, coluna_id)
+    with _condicao:
+        _anotar_no_diario(pedido.para_diario())
+        _pendentes.setdefault((sheet_id, nome_aba, value_input_option), []).append(pedido)
+        _condicao.notify()
+    return pedido.futuro
+
+def inserir(sheet_id, nome_aba, linhas, value_input_option="RAW", coluna_id=None, timeout=TIMEOUT_PADRAO):
+    """Versão bloqueante de enfileirar: espera a gravação e retorna o número da primeira linha.
+
+    Levanta a exceção da API se a gravação falhar; TimeoutError se o tempo acabar com o
+    pedido ainda na fila (ele é cancelado); GravacaoPendente se acabar com ele já enviado.
+    """
+    futuro = enfileirar(sheet_id, nome_aba, linhas, value_input_option, coluna_id)
+    try:
+        return futuro.result(timeout=timeout)
+    except TimeoutError:
+        if futuro.done():
+            return futuro.result()  # Terminou bem na hora
+        if cancelar(futuro):
+            raise TimeoutError(f"Inserção na aba {nome_aba} cancelada: {timeout}s na fila sem ser gravada.")
+        raise GravacaoPendente(futuro, f"Inserção na aba {nome_aba} enviada e ainda sem resposta depois de {timeout}s.")
+
+def cancelar(futuro):
+    """Tira da fila um pedido que ainda não foi enviado. Retorna False se ele já saiu para gravação."""
+    with _condicao:
+        for chave, pedidos in list(_pendentes.items()):
+            for pedido in pedidos:
+                if pedido.futuro is futuro:
+                    pedidos.remove(pedido)
+                    if not pedidos:
+                        del _pendentes[chave]
+                    _anotar_no_diario({"resolvidos": [pedido.id]})
+                    _compactar_diario()
+                    return futuro.cancel()
+    return False
+
+def quando_gravado(futuro, sucesso, falha=None):
+    """Chama sucesso(primeira_linha) ou falha(erro) quando o pedido terminar (na thread da fila)."""
+    def concluido(f):
+        try:
+            erro = f.exception()
+            if erro is None:
+                sucesso(f.result())
+            elif falha is not None:
+                falha(erro)
+        except Exception as e:
+            logging.error(f"Erro ao concluir inserção pendente: {e}")
+    futuro.add_done_callback(concluido)
+
+# === GRAVAÇÃO ===
+def _retirar_lote(chave, forcar):
+    """Retira da fila os pedidos de uma aba que devem ser gravados agora (chamar com _condicao)."""
+    global _em_gravacao
+    pedidos = _pendentes.get(chave)
+    if not pedidos:
+        return []
+    total = sum(len(pedido.linhas) for pedido in pedidos)
+    vencido = time.monotonic() - pedidos[0].criado_em >= ESPERA_MAXIMA
+    if not (forcar or vencido or total >= TAMANHO_LOTE):
+        return []
+    lote, linhas = [], 0
+    while pedidos and (not lote or linhas + len(pedidos[0].linhas) <= TAMANHO_LOTE):
+        pedido = pedidos.pop(0)
+        lote.append(pedido)
+        linhas += len(pedido.linhas)
+    if not pedidos:
+        del _pendentes[chave]
+    _em_gravacao += len(lote)
+    return lote
+
+def _gravar_lote(lote):
+    global _em_gravacao
+    primeiro = lote[0]
+    linhas = [linha for pedido in lote for linha in pedido.linhas]
+    ids = [pedido.id for pedido in lote]
+    intervalo = None
+    with _condicao:
+        _anotar_no_diario({"enviando": ids})  # Daqui em diante a API pode ter aplicado o append
+    try:
+        resposta = get_aba(primeiro.sheet_id, primeiro.nome_aba).append_rows(
+            linhas, value_input_option=primeiro.modo
+        )
+        inicio = linha_do_append(resposta)
+        intervalo = (resposta.get("updates") or {}).get("updatedRange") if isinstance(resposta, dict) else None
+        erro = None
+    except Exception as e:
+        logging.error(f"[ERRO Planilha] Falha ao inserir {len(linhas)} linha(s) na aba {primeiro.nome_aba}: {e}")
+        erro = e
+
+    # O produtor recebe o erro e decide (ex: avisar o usuário); o pedido sai do diário de qualquer forma
+    with _condicao:
+        _anotar_no_diario({"resolvidos": ids, "intervalo": intervalo})
+        _em_gravacao -= len(lote)
+        _compactar_diario()
+        _condicao.notify_all()
+
+    deslocamento = 0
+    for pedido in lote:
+        if erro:
+            pedido.futuro.set_exception(erro)
+        else:
+            pedido.futuro.set_result(inicio + deslocamento if inicio else None)
+        deslocamento += len(pedido.linhas)
+    if not erro:
+        logging.info(f"{len(linhas)} linha(s) de {len(lote)} pedido(s) inseridas na aba {primeiro.nome_aba} em 1 chamada.")
+
+def _ciclo(forcar=False):
+    with _condicao:
+        forcar = forcar or not _em_gravacao  # Ninguém gravando: não há com quem juntar, grava já
+        lotes = [lote for lote in (_retirar_lote(chave, forcar) for chave in list(_pendentes)) if lote]
+    for lote in lotes:
+        _gravar_lote(lote)
+    return len(lotes)
+
+def descarregar(timeout=TIMEOUT_PADRAO):
+    """Grava imediatamente tudo o que está na fila (ex: no desligamento) e espera terminar."""
+    limite = time.monotonic() + timeout
+    _ciclo(forcar=True)
+    with _condicao:
+        while (_pendentes or _em_gravacao) and time.monotonic() < limite:
+            _condicao.wait(0.1)
+
+# === RECUPERAÇÃO E THREAD ===
+def _avisar_falha_recuperacao(futuro):
+    if futuro.exception():
+        logging.error(f"Falha ao regravar pedido recuperado do diário: {futuro.exception()}")
+
+def _normalizar_linha(linha):
+    valores = ["" if valor is None else str(valor).strip() for valor in linha]
+    while valores and not valores[-1]:
+        valores.pop()  # A API não devolve as células vazias do fim da linha
+    return valores
+
+def _ja_gravadas(linhas, valores_aba):
+    """Se as linhas aparecem, em sequência, no conteúdo da aba (comparando o texto das células)."""
+    procuradas = [_normalizar_linha(linha) for linha in linhas]
+    existentes = [_normalizar_linha(linha) for linha in valores_aba]
+    n = len(procuradas)
+    # De baixo para cima: um append aplicado fica no fim da aba
+    return any(existentes[i:i + n] == procuradas for i in range(len(existentes) - n, -1, -1))
+
+def _recuperar_diario(registros):
+    """Reenfileira os pedidos que ficaram no diário (processo interrompido antes da gravação).
+
+    Pedidos nunca enviados são regravados direto. Os enviados sem confirmação só são
+    regravados se não estiverem na planilha (pela coluna de ID ou pelo conteúdo das linhas).
+    """
+    ids_gravados, valores_abas = {}, {}
+    for registro in registros:
+        linhas = registro["linhas"]
+        coluna_id = registro.get("coluna_id")
+        chave = (registro["sheet_id"], registro["aba"])
+        if coluna_id is not None:
+            if chave not in ids_gravados:
+                ids_gravados[chave] = set(get_aba(*chave).col_values(coluna_id + 1))
+            linhas = [linha for linha in linhas if linha[coluna_id] not in ids_gravados[chave]]
+        elif registro.get("enviado"):
+            if chave not in valores_abas:
+                valores_abas[chave] = get_aba(*chave).get_all_values()
+            if _ja_gravadas(linhas, valores_abas[chave]):
+                logging.info(f"Pedido {registro['id']} do diário já está na aba {registro['aba']}; não será regravado.")
+                linhas = []
+        if linhas:
+            logging.warning(f"Recuperando {len(linhas)} linha(s) pendentes para a aba {registro['aba']} do diário.")
+            futuro = enfileirar(registro["sheet_id"], registro["aba"], linhas, registro.get("modo", "RAW"), coluna_id)
+            futuro.add_done_callback(_avisar_falha_recuperacao)
+        # O pedido antigo só sai do diário depois que o novo foi anotado
+        with _condicao:
+            _anotar_no_diario({"resolvidos": [registro["id"]]})
+            _compactar_diario()
+
+def _loop(registros_recuperados):
+    try:
+        _recuperar_diario(registros_recuperados)
+    except Exception as e:
+        logging.error(f"Erro ao recuperar o diário da fila de inserções: {e}")
+    while True:
+        with _condicao:
+            if not _pendentes:
+                _condicao.wait()
+            elif _em_gravacao:  # descarregar() gravando em outra thread: junta com o que vier depois
+                mais_antigo = min(pedidos[0].criado_em for pedidos in _pendentes.values())
+                _condicao.wait(max(0.0, mais_antigo + ESPERA_MAXIMA - time.monotonic()))
+        try:
+            _ciclo()
+        except Exception as e:
+            logging.error(f"Erro na fila de inserções: {e}")
+
+def iniciar():
+    """Inicia (uma única vez por processo) a thread da fila e recupera o diário."""
+    global _thread
+    with _condicao:
+        if _thread and _thread.is_alive():
+            return
+        # Lê o diário antes de aceitar pedidos novos, para não confundi-los com pendências antigas
+        registros = [] if _pendentes else _ler_diario()
+        _thread = threading.Thread(target=_loop, args=(registros,), name="fila-insercoes", daemon=True)
+        _thread.start()
@@ -0,0 +1,183 @@
+"""
+Fila de mensagens recebidas pelo webhook: uma caixa de entrada (mailbox) por usuário.
+
+Cada número tem a sua caixa, e só um worker por vez trabalha numa caixa: as
+mensagens de um usuário são processadas estritamente na ordem de chegada, uma
+depois da outra (sem corrida no estado nem nos fluxos de confirmação), enquanto
+usuários diferentes andam em paralelo nos WORKERS threads.
+
+Justiça entre usuários: as caixas com mensagens esperam numa fila circular. Um
+worker pega a caixa da vez, processa no máximo QUANTUM mensagens e, se ainda
+sobrar alguma, devolve a caixa para o fim da fila. Além disso cada caixa aceita
+no máximo MAXIMO_POR_USUARIO mensagens esperando, então um usuário que manda
+muitas mensagens seguidas não ocupa a CAPACIDADE da fila inteira.
+
+As duas formas do webhook passam por aqui: no modo assíncrono ele só enfileira e
+responde 200 na hora; no modo síncrono espera o Future da mensagem antes de
+responder. metricas() expõe profundidade e atraso para dimensionar os workers.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+WORKERS = int(os.getenv("FILA_MENSAGENS_WORKERS", "8"))
+CAPACIDADE = int(os.getenv("FILA_MENSAGENS_CAPACIDADE", "1000"))  # mensagens esperando, somando todos os usuários
+MAXIMO_POR_USUARIO = int(os.getenv("FILA_MENSAGENS_MAXIMO_POR_USUARIO", "20"))
+QUANTUM = int(os.getenv("FILA_MENSAGENS_QUANTUM", "2"))  # mensagens seguidas de um usuário antes de passar a vez
+PESO_MEDIA = 0.1  # Suavização das médias móveis de atraso e duração
+
+_condicao = threading.Condition()  # Protege as caixas, a fila de vez, os contadores e as métricas
+_caixas = {}                       # numero -> deque de (mensagem, recebida_em, futuro) esperando
+_vez = deque()                     # Números com mensagens esperando e sem worker, na ordem da vez
+_ocupados = set()                  # Números sendo processados por algum worker agora
+_profundidade = 0
+_threads = []
+_processar = None
+_parando = False
+_metricas = {
+    "recebidas": 0, "processadas": 0, "falhas": 0, "rejeitadas": 0, "rejeitadas_por_usuario": 0,
+    "atraso_ultimo": 0.0, "atraso_medio": 0.0, "atraso_maximo": 0.0,
+    "duracao_media": 0.0,
+}
+
+def _media(atual, novo):
+    return novo if not atual else atual + PESO_MEDIA * (novo - atual)
+
+# === PRODUTOR (webhook) ===
+def enfileirar(numero, mensagem):
+    """Coloca a mensagem na caixa do usuário.
+
+    Returns:
+        Future: Resolve com o retorno de processar(numero, mensagem) (ou com a exceção dele).
+        None se a fila (ou a caixa do usuário) está cheia ou parada: o webhook deve responder 503.
+    """
+    global _profundidade
+    with _condicao:
+        caixa = _caixas.get(numero)
+        if _parando or not _threads or _profundidade >= CAPACIDADE:
+            _metricas["rejeitadas"] += 1
+            return None
+        if caixa is not None and len(caixa) >= MAXIMO_POR_USUARIO:
+            _metricas["rejeitadas_por_usuario"] += 1
+            return None
+        if caixa is None:
+            caixa = _caixas[numero] = deque()
+        futuro = Future()
+        caixa.append((mensagem, time.monotonic(), futuro))
+        _profundidade += 1
+        _metricas["recebidas"] += 1
+        if numero not in _ocupados and len(caixa) == 1:
+            _vez.append(numero)  # Caixa estava vazia: entra no fim da fila de vez
+            _condicao.notify()
+    return futuro
+
+# === WORKERS ===
+def _executar(numero, mensagem, recebida_em, futuro):
+    inicio = time.monotonic()
+    atraso = inicio - recebida_em
+    with _condicao:
+        _metricas["atraso_ultimo"] = atraso
+        _metricas["atraso_medio"] = _media(_metricas["atraso_medio"], atraso)
+        _metricas["atraso_maximo"] = max(_metricas["atraso_maximo"], atraso)
+    if not futuro.set_running_or_notify_cancel():
+        return
+    try:
+        futuro.set_result(_processar(numero, mensagem))
+        falhou = False
+    except Exception as e:
+        # O processador já avisou o usuário; quem espera o Future (modo síncrono) recebe a exceção
+        falhou = True
+        logging.error(f"Falha ao processar mensagem de {numero}: {e}")
+        futuro.set_exception(e)
+    with _condicao:
+        _metricas["falhas" if falhou else "processadas"] += 1
+        _metricas["duracao_media"] = _media(_metricas["duracao_media"], time.monotonic() - inicio)
+
+def _atender(numero):
+    """Processa até QUANTUM mensagens da caixa do usuário (o worker é o único dono dela enquanto isso)."""
+    global _profundidade
+    for _ in range(max(1, QUANTUM)):
+        with _condicao:
+            caixa = _caixas.get(numero)
+            if not caixa:
+                break
+            mensagem, recebida_em, futuro = caixa.popleft()
+            _profundidade -= 1
+        _executar(numero, mensagem, recebida_em, futuro)
+    with _condicao:
+        _ocupados.discard(numero)
+        if _caixas.get(numero):
+            _vez.append(numero)  # Ainda tem mensagens: volta para o fim da fila, depois dos outros
+            _condicao.notify()
+        else:
+            _caixas.pop(numero, None)
+        _condicao.notify_all()
+
+def _loop():
+    while True:
+        with _condicao:
+            while not _vez and not _parando:
+                _condicao.wait()
+            if not _vez:
+                return  # Parando e sem nada esperando
+            numero = _vez.popleft()
+            _ocupados.add(numero)
+        try:
+            _atender(numero)
+        except Exception as e:
+            logging.error(f"Erro no worker da fila de mensagens: {e}")
+
+def iniciar(processar, workers=WORKERS):
+    """Inicia (uma única vez por processo) os workers.
+
+    Args:
+        processar (callable): processar(numero, mensagem), chamado numa thread de worker.
+        workers (int): Quantidade de threads (usuários atendidos em paralelo).
+    """
+    global _processar, _parando
+    with _condicao:
+        if _threads and any(thread.is_alive() for thread in _threads):
+            return
+        _processar = processar
+        _parando = False
+        _threads[:] = [
+            threading.Thread(target=_loop, name=f"fila-mensagens-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+    for thread in _threads:
+        thread.start()
+    logging.info(f"Fila de mensagens iniciada com {len(_threads)} worker(s), capacidade {CAPACIDADE}.")
+
+def parar(timeout=30):
+    """Para de aceitar mensagens e espera os workers esvaziarem as caixas (ex: no desligamento)."""
+    global _parando
+    with _condicao:
+        _parando = True
+        _condicao.notify_all()
+    limite = time.monotonic() + timeout
+    for thread in _threads:
+        thread.join(max(0.0, limite - time.monotonic()))
+    with _condicao:
+        if _profundidade or _ocupados:
+            logging.warning(f"Fila de mensagens parada com {_profundidade} mensagem(ns) não processada(s).")
+
+# === MÉTRICAS ===
+def metricas():
+    """Profundidade da fila e atrasos (segundos entre a chegada e o início do processamento)."""
+    agora = time.monotonic()
+    with _condicao:
+        mais_antiga = min((caixa[0][1] for caixa in _caixas.values() if caixa), default=None)
+        return {
+            "workers": len(_threads),
+            "workers_vivos": sum(thread.is_alive() for thread in _threads),
+            "capacidade": CAPACIDADE,
+            "profundidade": _profundidade,
+            "usuarios_esperando": len(_vez),
+            "usuarios_em_processamento": len(_ocupados),
+            "maior_caixa": max((len(caixa) for caixa in _caixas.values()), default=0),
+            "espera_mais_antiga": round(agora - mais_antiga, 3) if mais_antiga is not None else 0.0,
+            **{chave: round(valor, 3) if isinstance(valor, float) else valor for chave, valor in _metricas.items()},
+        }
@@ -4,7 +4,11 @@ from datetime import datetime
 import pytz
 from dotenv import load_dotenv
 
-from planilhas import get_gastos_diarios
+from planilhas import get_gastos_diarios, GOOGLE_SHEET_GASTOS_ID
+from replica_planilhas import replica_gastos_diarios, chave_gasto
+from escrita_lote import escrita_em_lote
+import fila_insercoes
+import alertas_limite
 
 load_dotenv()
 
@@ -66,11 +70,22 @@ def gerar_id_unico(numero_usuario, descricao, valor, data_gasto):
     base = f"{numero_usuario}-{descricao}-{valor}-{data_gasto}"
     return hashlib.md5(base.encode()).hexdigest()
 
+def _montar_linha_gasto(nome_usuario, numero_usuario, descricao, valor, forma_pagamento, categoria, data_gasto, data_registro, id_unico):
+    return [
+        nome_usuario if nome_usuario else "Usuário",
+        numero_usuario,
+        descricao,
+        categoria,
+        f"R${valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
+        forma_pagamento,
+        data_gasto,
+        data_registro,
+        id_unico
+    ]
+
 # === REGISTRO DE GASTO ===
 def registrar_gasto(nome_usuario, numero_usuario, descricao, valor, forma_pagamento, data_gasto=None, categoria_manual=None):
     try:
-        aba = get_gastos_diarios()
-
         fuso = pytz.timezone("America/Sao_Paulo")
         agora = datetime.now(fuso)
         data_registro = agora.strftime("%d/%m/%Y %H:%M:%S")
@@ -79,57 +94,131 @@ def registrar_gasto(nome_usuario, numero_usuario, descricao, valor, forma_pagame
         categoria = categoria_manual or categorizar(descricao) or "A DEFINIR"
         id_unico = gerar_id_unico(numero_usuario, descricao, valor, data_gasto)
 
-        registros = [linha[8] for linha in aba.get_all_values()[1:] if len(linha) >= 9]
-        if id_unico in registros:
+        # Verificação O(1) no índice de IDs da réplica (reserva o ID enquanto grava)
+        if not replica_gastos_diarios.reservar_id(id_unico):
             return {"status": "ignorado", "mensagem": "Esse gasto já foi registrado.", "categoria": categoria}
 
-        nova_linha = [
-            nome_usuario if nome_usuario else "Usuário",
-            numero_usuario,
-            descricao,
-            categoria,
-            f"R${valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
-            forma_pagamento,
-            data_gasto,
-            data_registro,
-            id_unico
-        ]
+        nova_linha = _montar_linha_gasto(nome_usuario, numero_usuario, descricao, valor, forma_pagamento,
+                                         categoria, data_gasto, data_registro, id_unico)
         print("[DEBUG] Inserindo na planilha:", nova_linha)
 
         try:
-            aba.append_row(nova_linha, value_input_option="USER_ENTERED")
+            # A fila junta este append com os de outros usuários num único append_rows
+            numero_linha = fila_insercoes.inserir(GOOGLE_SHEET_GASTOS_ID, "Gastos Diários", [nova_linha],
+                                                  value_input_option="USER_ENTERED", coluna_id=8)
+            replica_gastos_diarios.registrar_linha(numero_linha, nova_linha)
             print("[SUCESSO APPEND_ROW] Dados enviados:", nova_linha)
+        except fila_insercoes.GravacaoPendente as e:
+            # Já enviado: o ID segue reservado (um reenvio não duplica) até a gravação terminar
+            print("[APPEND_ROW PENDENTE]:", e)
+            fila_insercoes.quando_gravado(
+                e.futuro,
+                lambda linha: (replica_gastos_diarios.registrar_linha(linha, nova_linha),
+                               alertas_limite.avaliar_gasto(numero_usuario, categoria, valor, data_gasto)),
+                lambda erro: replica_gastos_diarios.liberar_id(id_unico),
+            )
+            return {"status": "ok", "categoria": categoria, "pendente": True}
         except Exception as e:
+            replica_gastos_diarios.liberar_id(id_unico)
             print("[ERRO GRAVE APPEND_ROW]:", e)
             return {"status": "erro", "mensagem": str(e)}
 
+        # Confere se o gasto fez a categoria entrar numa nova faixa do limite (envio do alerta é assíncrono)
+        alertas_limite.avaliar_gasto(numero_usuario, categoria, valor, data_gasto)
         return {"status": "ok", "categoria": categoria}
 
     except Exception as e:
         print(f"[ERRO ao registrar gasto] {e}")
         return {"status": "erro", "mensagem": str(e)}
 
+# === REGISTRO DE GASTOS EM LOTE (importações) ===
+def _avaliar_alertas_do_lote(numero_usuario, ids_novos, valores_por_id, data_gasto):
+    soma_por_categoria = {}
+    for id_unico in ids_novos:
+        categoria, valor = valores_por_id[id_unico]
+        soma_por_categoria[categoria] = soma_por_categoria.get(categoria, 0) + valor
+    for categoria, soma in soma_por_categoria.items():
+        alertas_limite.avaliar_gasto(numero_usuario, categoria, soma, data_gasto)
+
+def registrar_gastos_em_lote(nome_usuario, numero_usuario, gastos, data_gasto=None):
+    """Registra vários gastos com um único append_rows, ignorando os já registrados.
+
+    Args:
+        nome_usuario (str): Nome do usuário.
+        numero_usuario (str): Número do usuário formatado.
+        gastos (list): Lista de dicts com descricao, valor, forma_pagamento e categoria (opcional),
+            como retornado por parsear_gastos_em_lote.
+        data_gasto (str): Data dos gastos (dd/mm/aaaa). Padrão: hoje.
+
+    Returns:
+        dict: {"status": "ok"|"erro", "registrados": int, "ignorados": int}
+    """
+    try:
+        fuso = pytz.timezone("America/Sao_Paulo")
+        agora = datetime.now(fuso)
+        data_registro = agora.strftime("%d/%m/%Y %H:%M:%S")
+        data_gasto = data_gasto or agora.strftime("%d/%m/%Y")
+
+        linhas_por_id = {}
+        valores_por_id = {}
+        for gasto in gastos:
+            id_unico = gerar_id_unico(numero_usuario, gasto["descricao"], gasto["valor"], data_gasto)
+            categoria = gasto.get("categoria") or categorizar(gasto["descricao"]) or "A DEFINIR"
+            linhas_por_id.setdefault(id_unico, _montar_linha_gasto(
+                nome_usuario, numero_usuario, gasto["descricao"], gasto["valor"], gasto["forma_pagamento"],
+                categoria, data_gasto, data_registro, id_unico
+            ))
+            valores_por_id.setdefault(id_unico, (categoria, gasto["valor"]))
+
+        ids_novos = replica_gastos_diarios.reservar_ids_novos(list(linhas_por_id))
+        ignorados = len(gastos) - len(ids_novos)
+        if not ids_novos:
+            return {"status": "ok", "registrados": 0, "ignorados": ignorados}
+
+        novas_linhas = [linhas_por_id[id_unico] for id_unico in ids_novos]
+        try:
+            primeira_linha = fila_insercoes.inserir(GOOGLE_SHEET_GASTOS_ID, "Gastos Diários", novas_linhas,
+                                                    value_input_option="USER_ENTERED", coluna_id=8)
+            replica_gastos_diarios.registrar_linhas(primeira_linha, novas_linhas)
+        except fila_insercoes.GravacaoPendente as e:
+            # Já enviado: os IDs seguem reservados até a gravação terminar
+            print("[APPEND_ROWS PENDENTE]:", e)
+            fila_insercoes.quando_gravado(
+                e.futuro,
+                lambda linha: (replica_gastos_diarios.registrar_linhas(linha, novas_linhas),
+                               _avaliar_alertas_do_lote(numero_usuario, ids_novos, valores_por_id, data_gasto)),
+                lambda erro: [replica_gastos_diarios.liberar_id(id_unico) for id_unico in ids_novos],
+            )
+            return {"status": "ok", "registrados": len(novas_linhas), "ignorados": ignorados, "pendente": True}
+        except Exception as e:
+            for id_unico in ids_novos:
+                replica_gastos_diarios.liberar_id(id_unico)
+            print("[ERRO GRAVE APPEND_ROWS]:", e)
+            return {"status": "erro", "mensagem": str(e), "registrados": 0, "ignorados": ignorados}
+
+        _avaliar_alertas_do_lote(numero_usuario, ids_novos, valores_por_id, data_gasto)
+        return {"status": "ok", "registrados": len(novas_linhas), "ignorados": ignorados}
+
+    except Exception as e:
+        print(f"[ERRO ao registrar gastos em lote] {e}")
+        return {"status": "erro", "mensagem": str(e), "registrados": 0, "ignorados": 0}
+
 # === ALTERAR CATEGORIA ===
 def atualizar_categoria(numero_usuario, descricao, data_gasto, nova_categoria):
     try:
+        encontrado = replica_gastos_diarios.localizar_confirmado(
+            "descricao_data", chave_gasto(numero_usuario, descricao, data_gasto)
+        )
+        if not encontrado:
+            print("[ATUALIZAR CATEGORIA] Nenhum gasto correspondente encontrado.")
+            return False
+
+        i, _ = encontrado
         aba = get_gastos_diarios()
-        registros = aba.get_all_values()
-
-        for i, linha in enumerate(registros[1:], start=2):  # pula cabeçalho
-            numero = linha[1].strip()
-            desc = linha[2].strip().lower()
-            data = linha[6].strip()
-
-            if (
-                numero == numero_usuario
-                and desc == descricao.strip().lower()
-                and data == data_gasto
-            ):
-                aba.update_cell(i, 4, nova_categoria)  # coluna D (categoria)
-                return True
-
-        print("[ATUALIZAR CATEGORIA] Nenhum gasto correspondente encontrado.")
-        return False
+        aba.update_cell(i, 4, nova_categoria)  # coluna D (categoria)
+        aba.gravar_pendentes()  # Dentro do lote da mensagem: só atualiza a réplica depois de gravar
+        replica_gastos_diarios.atualizar_celula(i, 4, nova_categoria)
+        return True
 
     except Exception as e:
         print(f"[ERRO ao atualizar categoria] {e}")
@@ -137,20 +226,22 @@ def atualizar_categoria(numero_usuario, descricao, data_gasto, nova_categoria):
 
 # === CORREÇÃO DE GASTO ===
 def corrigir_gasto(numero_usuario, descricao, valor, forma_pagamento, categoria, data_gasto):
+    encontrado = replica_gastos_diarios.localizar_confirmado(
+        "descricao_data", chave_gasto(numero_usuario, descricao, data_gasto)
+    )
+    if not encontrado:
+        return False
+
+    i, _ = encontrado
     aba = get_gastos_diarios()
-    registros = aba.get_all_values()
-
-    for i, linha in enumerate(registros[1:], start=2):  
-        if (linha[1].strip() == numero_usuario and
-            linha[2].strip().lower() == descricao.strip().lower() and
-            linha[6].strip() == data_gasto):
-            aba.update_cell(i, 3, descricao)
-            aba.update_cell(i, 4, categoria)
-            aba.update_cell(i, 5, f"{valor:.2f}".replace('.', ','))
-            aba.update_cell(i, 6, forma_pagamento)
-            return True
-
-    return False
+    novos_valores = {3: descricao, 4: categoria, 5: f"{valor:.2f}".replace('.', ','), 6: forma_pagamento}
+    with escrita_em_lote():  # Colunas C a F numa única chamada
+        for coluna, novo_valor in novos_valores.items():
+            aba.update_cell(i, coluna, novo_valor)
+        aba.gravar_pendentes()  # Grava já, mesmo dentro do lote da mensagem: a réplica só muda depois
+    for coluna, novo_valor in novos_valores.items():
+        replica_gastos_diarios.atualizar_celula(i, coluna, novo_valor)
+    return True
 
 import re
 
@@ -0,0 +1,214 @@
+"""
+Porta única de acesso à API do Google Sheets: cota, prioridade, retentativa e coalescência.
+
+Toda chamada que vai à API (leitura ou escrita em uma aba, abertura de planilha)
+passa por executar():
+
+- Cota: um balde de fichas para leituras e outro para escritas, reabastecidos a
+  LEITURAS_POR_MINUTO / ESCRITAS_POR_MINUTO (cota por usuário do Google: 60/min).
+- Prioridade: cada chamada pertence a uma faixa, definida por contexto com
+  `with prioridade("alertas"):`. Sem nada definido vale "interativo" (webhook).
+  Com fichas disputadas, a faixa mais alta é atendida primeiro, e as faixas mais
+  baixas não podem gastar a reserva do balde (RESERVAS), que fica para o webhook.
+  Assim um job em lote não esgota a cota e derruba as respostas com 429.
+- Retentativa: com atraso exponencial e variação aleatória, até TENTATIVAS vezes.
+  Leituras repetem em 429, 5xx e erros de rede. Escritas só repetem quando é
+  certo que a API não aplicou a chamada (429, ou conexão que nem chegou a abrir):
+  um timeout ou 5xx depois de um append_rows aplicado duplicaria linhas. Quem
+  precisa se recuperar disso usa o próprio diário (ex: fila_insercoes).
+- Coalescência: leituras idênticas simultâneas (mesma aba, método e argumentos)
+  viram uma chamada só; quem chegou depois recebe uma cópia do resultado.
+
+planilhas.get_aba entrega as abas já embrulhadas em AbaControlada.
+"""
+import os
+import copy
+import time
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import Future
+from gspread.exceptions import APIError
+from requests.exceptions import ConnectionError as ErroConexao, ConnectTimeout, Timeout
+
+LEITURAS_POR_MINUTO = int(os.getenv("SHEETS_LEITURAS_POR_MINUTO", "60"))
+ESCRITAS_POR_MINUTO = int(os.getenv("SHEETS_ESCRITAS_POR_MINUTO", "60"))
+TENTATIVAS = int(os.getenv("SHEETS_TENTATIVAS", "5"))
+ESPERA_BASE = float(os.getenv("SHEETS_ESPERA_BASE", "1"))     # segundos, dobra a cada tentativa
+ESPERA_MAXIMA = float(os.getenv("SHEETS_ESPERA_MAXIMA", "64"))
+
+# Faixas em ordem de prioridade e a fração do balde que cada uma não pode usar
+FAIXAS = ("interativo", "alertas", "relatorios")
+RESERVAS = {"interativo": 0.0, "alertas": 0.25, "relatorios": 0.5}
+
+_LEITURAS = {
+    "acell", "batch_get", "cell", "col_values", "find", "findall", "get", "get_all_cells",
+    "get_all_records", "get_all_values", "get_note", "get_records", "get_values", "range", "row_values",
+}
+
+_prioridade = contextvars.ContextVar("prioridade_sheets", default="interativo")
+
+@contextmanager
+def prioridade(faixa):
+    """Define a faixa de prioridade das chamadas ao Sheets feitas dentro do bloco."""
+    if faixa not in RESERVAS:
+        raise ValueError(f"Faixa de prioridade desconhecida: {faixa}")
+    token = _prioridade.set(faixa)
+    try:
+        yield
+    finally:
+        _prioridade.reset(token)
+
+# === BALDE DE FICHAS COM PRIORIDADE ===
+class _Balde:
+    def __init__(self, nome, por_minuto):
+        self.nome = nome
+        self.capacidade = float(max(1, por_minuto))
+        self.reposicao = self.capacidade / 60.0  # fichas por segundo
+        self.fichas = self.capacidade
+        self.atualizado_em = time.monotonic()
+        self.condicao = threading.Condition()
+        self.esperando = {faixa: 0 for faixa in FAIXAS}
+        self.espera_total = {faixa: 0.0 for faixa in FAIXAS}
+
+    def _repor(self):
+        agora = time.monotonic()
+        self.fichas = min(self.capacidade, self.fichas + (agora - self.atualizado_em) * self.reposicao)
+        self.atualizado_em = agora
+
+    def _pode(self, faixa):
+        # Ninguém de faixa mais alta esperando, e a reserva da faixa continua intacta
+        if any(self.esperando[f] for f in FAIXAS[:FAIXAS.index(faixa)]):
+            return False
+        return self.fichas >= 1 + RESERVAS[faixa] * self.capacidade
+
+    def adquirir(self, faixa):
+        inicio = time.monotonic()
+        with self.condicao:
+            self.esperando[faixa] += 1
+            try:
+                while True:
+                    self._repor()
+                    if self._pode(faixa):
+                        self.fichas -= 1
+                        break
+                    falta = 1 + RESERVAS[faixa] * self.capacidade - self.fichas
+                    self.condicao.wait(max(0.01, falta / self.reposicao))
+            finally:
+                self.esperando[faixa] -= 1
+                self.condicao.notify_all()  # Faixas mais baixas podem ter sido liberadas
+            self.espera_total[faixa] += time.monotonic() - inicio
+
+# === EXECUÇÃO ===
+_baldes = {"leitura": _Balde("leitura", LEITURAS_POR_MINUTO), "escrita": _Balde("escrita", ESCRITAS_POR_MINUTO)}
+_lock = threading.Lock()
+_em_voo = {}  # chave da leitura -> Future da chamada em andamento
+_contadores = {"chamadas": 0, "retentativas": 0, "coalescidas": 0, "falhas": 0}
+
+def _status(erro):
+    if isinstance(erro, APIError):
+        return getattr(getattr(erro, "response", None), "status_code", None)
+    return None
+
+def _temporario(erro, tipo):
+    """Se vale repetir a chamada. Escritas só quando a API certamente não a aplicou."""
+    status = _status(erro)
+    if status == 429 or isinstance(erro, ConnectTimeout):
+        return True
+    if tipo == "escrita":
+        return False
+    return isinstance(erro, (ErroConexao, Timeout)) or (status is not None and status >= 500)
+
+def _chamar(tipo, funcao, args, kwargs, descricao):
+    faixa = _prioridade.get()
+    for tentativa in range(1, TENTATIVAS + 1):
+        _baldes[tipo].adquirir(faixa)
+        with _lock:
+            _contadores["chamadas"] += 1
+        try:
+            return funcao(*args, **kwargs)
+        except Exception as e:
+            if not _temporario(e, tipo) or tentativa == TENTATIVAS:
+                with _lock:
+                    _contadores["falhas"] += 1
+                raise
+            espera = min(ESPERA_MAXIMA, ESPERA_BASE * 2 ** (tentativa - 1)) * random.uniform(0.5, 1.5)
+            with _lock:
+                _contadores["retentativas"] += 1
+            logging.warning(f"[Sheets] {descricao} falhou ({_status(e) or type(e).__name__}: {e}); tentativa {tentativa + 1} em {espera:.1f}s.")
+            time.sleep(espera)
+
+def executar(tipo, funcao, *args, chave=None, descricao="chamada", **kwargs):
+    """Executa uma chamada à API respeitando cota, prioridade e retentativas.
+
+    Args:
+        tipo (str): "leitura" ou "escrita" (qual cota é consumida).
+        funcao (callable): A chamada do gspread.
+        chave (hashable): Para leituras, identifica chamadas idênticas que podem ser coalescidas.
+        descricao (str): Texto para o log.
+    """
+    if chave is None:
+        return _chamar(tipo, funcao, args, kwargs, descricao)
+    with _lock:
+        futuro = _em_voo.get(chave)
+        lider = futuro is None
+        if lider:
+            futuro = _em_voo[chave] = Future()
+        else:
+            _contadores["coalescidas"] += 1
+    if not lider:
+        return copy.deepcopy(futuro.result())
+    try:
+        resultado = _chamar(tipo, funcao, args, kwargs, descricao)
+        futuro.set_result(resultado)
+        return resultado
+    except BaseException as e:
+        futuro.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            _em_voo.pop(chave, None)
+
+class AbaControlada:
+    """Proxy de gspread.Worksheet: todo método que acessa a API passa por executar()."""
+
+    def __init__(self, aba):
+        self._aba = aba
+
+    def __getattr__(self, nome):
+        atributo = getattr(self._aba, nome)
+        if not callable(atributo):
+            return atributo  # title, id, row_count...: já vieram com a aba, sem chamada à API
+        tipo = "leitura" if nome in _LEITURAS else "escrita"
+        descricao = f"{nome} na aba '{self._aba.title}'"
+
+        def controlado(*args, **kwargs):
+            chave = None
+            if tipo == "leitura":
+                chave = (id(self._aba), nome, args, tuple(sorted(kwargs.items())))
+                try:
+                    hash(chave)
+                except TypeError:
+                    chave = None
+            return executar(tipo, atributo, *args, chave=chave, descricao=descricao, **kwargs)
+        return controlado
+
+    def __repr__(self):
+        return f"AbaControlada({self._aba!r})"
+
+# === MÉTRICAS ===
+def metricas():
+    with _lock:
+        resultado = dict(_contadores)
+    for tipo, balde in _baldes.items():
+        with balde.condicao:
+            balde._repor()
+            resultado[tipo] = {
+                "fichas": round(balde.fichas, 2),
+                "por_minuto": balde.capacidade,
+                "esperando": dict(balde.esperando),
+                "espera_total": {faixa: round(total, 3) for faixa, total in balde.espera_total.items()},
+            }
+    return resultado
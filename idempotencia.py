@@ -0,0 +1,114 @@
+"""
+Idempotência do webhook pelo MessageSid do Twilio.
+
+O Twilio reenvia a mesma mensagem (mesmo MessageSid) quando não recebe resposta
+a tempo. registrar() é chamado no webhook antes de qualquer processamento e diz
+se o MessageSid é novo; repetido, a requisição é respondida sem tocar em
+planilha, estado ou OpenAI. (Antes a comparação era pelo texto da última
+mensagem, o que descartava um "sim" legítimo repetido e deixava passar
+reenvios quando outra mensagem chegava no meio.)
+
+Duas camadas:
+- memória do processo: dicionário ordenado por chegada, com validade (TTL) e
+  tamanho máximo. Reenvio já visto por este processo é rejeitado em microssegundos;
+- banco SQLite compartilhado (idempotencia.sqlite3): vale entre workers do uvicorn.
+  O INSERT OR IGNORE decide atomicamente quem processa a mensagem.
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from armazenamento_local import conectar, transacao, caminho_do_banco
+
+BANCO = os.getenv("IDEMPOTENCIA_BANCO", caminho_do_banco("idempotencia.sqlite3"))
+VALIDADE = int(os.getenv("IDEMPOTENCIA_VALIDADE", "86400"))         # segundos que um MessageSid fica lembrado
+MAXIMO = int(os.getenv("IDEMPOTENCIA_MAXIMO", "100000"))            # MessageSids lembrados, no máximo
+LIMPEZA_A_CADA = int(os.getenv("IDEMPOTENCIA_LIMPEZA_A_CADA", "500"))  # inserções entre limpezas do banco
+
+_lock = threading.Lock()
+_vistos = OrderedDict()  # message_sid -> recebido_em (time.time()), em ordem de chegada
+_insercoes = 0
+_banco_pronto = False
+
+def _conexao():
+    global _banco_pronto
+    # NORMAL: perder o último registro numa queda de energia só permite reprocessar um reenvio
+    conexao = conectar(BANCO, sincronismo="NORMAL")
+    if not _banco_pronto:
+        conexao.execute(
+            "CREATE TABLE IF NOT EXISTS mensagens_recebidas (message_sid TEXT PRIMARY KEY, recebida_em REAL NOT NULL)"
+        )
+        conexao.execute("CREATE INDEX IF NOT EXISTS idx_recebida_em ON mensagens_recebidas (recebida_em)")
+        _banco_pronto = True
+    return conexao
+
+def _esquecer_vencidos(agora):
+    """Tira da memória os mais antigos: vencidos ou além do tamanho máximo (chamar com _lock)."""
+    while _vistos:
+        sid, recebido_em = next(iter(_vistos.items()))
+        if recebido_em > agora - VALIDADE and len(_vistos) <= MAXIMO:
+            break
+        del _vistos[sid]
+
+def _limpar_banco(conexao, agora):
+    with transacao(conexao):
+        conexao.execute("DELETE FROM mensagens_recebidas WHERE recebida_em < ?", (agora - VALIDADE,))
+        conexao.execute(
+            "DELETE FROM mensagens_recebidas WHERE message_sid IN ("
+            "SELECT message_sid FROM mensagens_recebidas ORDER BY recebida_em DESC LIMIT -1 OFFSET ?)",
+            (MAXIMO,),
+        )
+
+# === API ===
+def registrar(message_sid):
+    """Marca o MessageSid como recebido.
+
+    Returns:
+        bool: True se é a primeira vez (processar); False se é repetido (ignorar).
+        Sem MessageSid não há como deduplicar: retorna True.
+    """
+    global _insercoes
+    if not message_sid:
+        return True
+    agora = time.time()
+    with _lock:
+        recebido_em = _vistos.get(message_sid)
+        if recebido_em is not None and recebido_em > agora - VALIDADE:
+            return False
+    try:
+        conexao = _conexao()
+        with transacao(conexao):
+            conexao.execute("DELETE FROM mensagens_recebidas WHERE message_sid = ? AND recebida_em < ?",
+                            (message_sid, agora - VALIDADE))
+            novo = conexao.execute(
+                "INSERT OR IGNORE INTO mensagens_recebidas (message_sid, recebida_em) VALUES (?, ?)",
+                (message_sid, agora),
+            ).rowcount == 1
+        with _lock:
+            _insercoes += 1
+            limpar = _insercoes % LIMPEZA_A_CADA == 0
+        if limpar:
+            _limpar_banco(conexao, agora)
+    except Exception as e:
+        # Sem o banco, vale só a memória deste processo: melhor processar do que perder a mensagem
+        logging.error(f"Erro no registro de idempotência de {message_sid}, usando só a memória: {e}")
+        novo = True
+    with _lock:
+        _vistos[message_sid] = agora
+        _vistos.move_to_end(message_sid)
+        _esquecer_vencidos(agora)
+    return novo
+
+def liberar(message_sid):
+    """Esquece o MessageSid (ex: a mensagem foi recusada com 503 e o reenvio do Twilio deve ser processado)."""
+    if not message_sid:
+        return
+    with _lock:
+        _vistos.pop(message_sid, None)
+    try:
+        conexao = _conexao()
+        with transacao(conexao):
+            conexao.execute("DELETE FROM mensagens_recebidas WHERE message_sid = ?", (message_sid,))
+    except Exception as e:
+        logging.error(f"Erro ao liberar {message_sid} no registro de idempotência: {e}")
@@ -0,0 +1,177 @@
+"""
+Índice vetorial local da base de conhecimento (pasta knowledge/).
+
+A base tem poucas dezenas de pedaços, então a busca exata por força bruta é
+mais rápida que a ida e volta ao Pinecone: os embeddings ficam numa matriz
+float32 (vetores.f32, uma linha por pedaço, já normalizada) aberta com
+np.memmap, e o texto/categoria de cada linha em metadados.json. A similaridade
+de cosseno vira um produto escalar; o filtro por categoria usa os índices das
+linhas de cada categoria, montados na carga.
+
+ingest_data.py grava o índice (gravar()), com o manifesto da ingestão (hash de
+cada arquivo e os ids dos seus pedaços) no próprio metadados.json. Cada gravação
+vai para uma subpasta nova de INDICE_LOCAL_PASTA (padrão knowledge/indice,
+versionada junto com os textos) e só então o arquivo ATUAL, que guarda o nome da
+subpasta em uso, é trocado com um único os.replace: quem lê nunca junta os
+vetores de uma gravação com os metadados de outra. buscar() percebe a troca pelo
+conteúdo de ATUAL e recarrega; se o índice foi gerado com outro modelo de
+embedding que o da consulta, devolve None e a busca cai no Pinecone.
+"""
+import os
+import json
+import logging
+import shutil
+import threading
+import time
+import numpy as np
+
+PASTA = os.getenv("INDICE_LOCAL_PASTA", os.path.join("knowledge", "indice"))
+ARQUIVO_VETORES = "vetores.f32"
+ARQUIVO_METADADOS = "metadados.json"
+ARQUIVO_ATUAL = "ATUAL"
+VERSOES_MANTIDAS = 2  # A anterior fica para quem ainda está lendo durante a troca
+
+_lock = threading.Lock()
+_carregado = {}  # pasta -> (versão, modelo, matriz, itens, {categoria: np.array de linhas})
+_avisados = set()  # (versão, modelo da consulta) já avisados de modelo diferente
+
+def _normalizar(vetores):
+    vetores = np.asarray(vetores, dtype=np.float32)
+    normas = np.linalg.norm(vetores, axis=-1, keepdims=True)
+    return vetores / np.where(normas == 0, 1, normas)
+
+# === GRAVAÇÃO ===
+def gravar(itens, vetores, modelo, pasta=PASTA, arquivos=None):
+    """Grava o índice (substitui o anterior).
+
+    Args:
+        itens (list): Metadados de cada linha (dicts com "id", "text", "categoria", "source"...).
+        vetores (list): Embeddings na mesma ordem dos itens.
+        modelo (str): Modelo de embedding usado (a consulta precisa usar o mesmo).
+        arquivos (dict): Manifesto da ingestão ({arquivo: {"sha256", "pedacos"}}), guardado junto.
+    """
+    matriz = _normalizar(vetores).reshape(len(itens), -1) if itens else np.zeros((0, 0), dtype=np.float32)
+    versao = f"v{time.time_ns()}-{os.getpid()}"
+    pasta_versao = os.path.join(pasta, versao)
+    os.makedirs(pasta_versao)
+    matriz.tofile(os.path.join(pasta_versao, ARQUIVO_VETORES))
+    with open(os.path.join(pasta_versao, ARQUIVO_METADADOS), "w", encoding="utf-8") as f:
+        json.dump(
+            {"modelo": modelo, "dimensao": int(matriz.shape[1]), "arquivos": arquivos or {}, "itens": itens},
+            f, ensure_ascii=False, indent=1,
+        )
+    # A subpasta nova está completa: uma única troca atômica passa os dois arquivos a valer
+    caminho_atual = os.path.join(pasta, ARQUIVO_ATUAL)
+    with open(caminho_atual + ".tmp", "w", encoding="utf-8") as f:
+        f.write(versao)
+    os.replace(caminho_atual + ".tmp", caminho_atual)
+    _apagar_versoes_antigas(pasta)
+
+def _apagar_versoes_antigas(pasta):
+    versoes = sorted(
+        (nome for nome in os.listdir(pasta)
+         if nome.startswith("v") and os.path.isdir(os.path.join(pasta, nome))),
+        key=lambda nome: int(nome[1:].split("-")[0]),
+    )
+    for nome in versoes[:-VERSOES_MANTIDAS]:
+        shutil.rmtree(os.path.join(pasta, nome), ignore_errors=True)
+    # Formato antigo (arquivos soltos na pasta), de antes das subpastas
+    for nome in (ARQUIVO_VETORES, ARQUIVO_METADADOS):
+        if os.path.exists(os.path.join(pasta, nome)):
+            os.remove(os.path.join(pasta, nome))
+
+# === CARGA ===
+def _versao_atual(pasta):
+    """(versão, subpasta) em uso; None se o índice não existir."""
+    try:
+        with open(os.path.join(pasta, ARQUIVO_ATUAL), encoding="utf-8") as f:
+            versao = f.read().strip()
+        return versao, os.path.join(pasta, versao)
+    except FileNotFoundError:
+        pass
+    # Formato antigo: arquivos soltos na pasta, identificados pela data de metadados.json
+    try:
+        return str(os.stat(os.path.join(pasta, ARQUIVO_METADADOS)).st_mtime_ns), pasta
+    except FileNotFoundError:
+        return None
+
+def _ler_versao(pasta_versao):
+    with open(os.path.join(pasta_versao, ARQUIVO_METADADOS), encoding="utf-8") as f:
+        return json.load(f)
+
+def _carregar(pasta):
+    versao_atual = _versao_atual(pasta)
+    if versao_atual is None:
+        return None
+    versao, pasta_versao = versao_atual
+    atual = _carregado.get(pasta)
+    if atual and atual[0] == versao:
+        return atual
+    with _lock:
+        atual = _carregado.get(pasta)
+        if atual and atual[0] == versao:
+            return atual
+        metadados = _ler_versao(pasta_versao)
+        itens = metadados["itens"]
+        if itens:
+            matriz = np.memmap(os.path.join(pasta_versao, ARQUIVO_VETORES), dtype=np.float32, mode="r",
+                               shape=(len(itens), metadados["dimensao"]))
+        else:
+            matriz = np.zeros((0, metadados["dimensao"]), dtype=np.float32)
+        categorias = {}
+        for i, item in enumerate(itens):
+            categorias.setdefault(item.get("categoria"), []).append(i)
+        atual = (versao, metadados["modelo"], matriz, itens,
+                 {categoria: np.array(linhas) for categoria, linhas in categorias.items()})
+        _carregado[pasta] = atual
+        logging.info(f"Índice local carregado de {pasta_versao}: {len(itens)} pedaço(s), modelo {metadados['modelo']}.")
+        return atual
+
+def ler(pasta=PASTA):
+    """Conteúdo gravado: (metadados, {id: vetor}) ou (None, {}) se o índice não existir."""
+    versao_atual = _versao_atual(pasta)
+    if versao_atual is None:
+        return None, {}
+    _, pasta_versao = versao_atual
+    metadados = _ler_versao(pasta_versao)
+    itens = metadados["itens"]
+    if not itens:
+        return metadados, {}
+    matriz = np.fromfile(os.path.join(pasta_versao, ARQUIVO_VETORES), dtype=np.float32).reshape(len(itens), metadados["dimensao"])
+    return metadados, {item["id"]: matriz[i] for i, item in enumerate(itens)}
+
+def disponivel(pasta=PASTA):
+    return _carregar(pasta) is not None
+
+# === BUSCA ===
+def buscar(vetor, modelo, top_k=4, categoria=None, pasta=PASTA):
+    """Os top_k itens mais parecidos com o vetor (cosseno), opcionalmente só de uma categoria.
+
+    Args:
+        modelo (str): Modelo de embedding que gerou o vetor da consulta.
+
+    Returns:
+        list: Pares (similaridade, item) em ordem decrescente; None se o índice não existir
+        ou tiver sido gerado com outro modelo (os vetores não são comparáveis).
+    """
+    carregado = _carregar(pasta)
+    if carregado is None:
+        return None
+    _, modelo_indice, matriz, itens, categorias = carregado
+    if modelo_indice != modelo:
+        if (carregado[0], modelo) not in _avisados:
+            _avisados.add((carregado[0], modelo))
+            logging.warning(f"Índice local gerado com {modelo_indice}, consulta com {modelo}: usando o Pinecone.")
+        return None
+    linhas = categorias.get(categoria, np.array([], dtype=int)) if categoria else None
+    candidatos = matriz if linhas is None else matriz[linhas]
+    if not len(candidatos) or top_k <= 0:
+        return []
+    similaridades = candidatos @ _normalizar(vetor)
+    k = min(top_k, len(similaridades))
+    melhores = np.argpartition(-similaridades, k - 1)[:k]
+    melhores = melhores[np.argsort(-similaridades[melhores])]
+    return [
+        (float(similaridades[i]), itens[i if linhas is None else int(linhas[i])])
+        for i in melhores
+    ]
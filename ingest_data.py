@@ -1,34 +1,22 @@
 import os
+import sys
+import hashlib
 from dotenv import load_dotenv
-import openai
-import pinecone
-from uuid import uuid4
-import tiktoken
+import indice_local
+import cache_embeddings
 
 load_dotenv()
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
-pinecone_api_key = os.getenv("PINECONE_API_KEY")
-pinecone_index_name = os.getenv("PINECONE_INDEX_NAME")
-pinecone_env = os.getenv("PINECONE_ENV")
-
-# Inicialização correta da versão 6.x do Pinecone
-pc = pinecone.Pinecone(api_key=pinecone_api_key)
-
-# Verificar e criar índice se necessário
-existing_indexes = [index_info['name'] for index_info in pc.list_indexes()]
-if pinecone_index_name not in existing_indexes:
-    pc.create_index(
-        name=pinecone_index_name,
-        dimension=1536,
-        metric="cosine",
-        spec=pinecone.ServerlessSpec(cloud="aws", region=pinecone_env)
-    )
-
-index = pc.Index(pinecone_index_name)
-
 knowledge_dir = "knowledge"
-encoding = tiktoken.encoding_for_model("text-embedding-ada-002")
+EMBEDDING_MODEL = "text-embedding-ada-002"
+_encoding = None
+
+def get_encoding():
+    global _encoding
+    if _encoding is None:
+        import tiktoken
+        _encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+    return _encoding
 
 def read_files(path):
     contents = []
@@ -40,6 +28,7 @@ def read_files(path):
     return contents
 
 def chunk_text_by_tokens(text, max_tokens=4000):
+    encoding = get_encoding()
     tokens = encoding.encode(text)
     chunks = []
     for i in range(0, len(tokens), max_tokens):
@@ -48,11 +37,7 @@ def chunk_text_by_tokens(text, max_tokens=4000):
     return chunks
 
 def embed_text(text):
-    response = openai.Embedding.create(
-        input=text,
-        model="text-embedding-ada-002"
-    )
-    return response['data'][0]['embedding']
+    return cache_embeddings.embedding(text, EMBEDDING_MODEL)
 
 def infer_tag(filename):
     nome = filename.lower()
@@ -65,32 +50,92 @@ def infer_tag(filename):
     else:
         return "geral"
 
-print("📚 Iniciando ingestão...")
-files = read_files(knowledge_dir)
-total_chunks = 0
-
-for filename, text in files:
-    chunks = chunk_text_by_tokens(text)
-    vectors = []
-    tag = infer_tag(filename)
-    print(f"🗂️  Arquivo: {filename} | Categoria atribuída: {tag}")
-    
-    for chunk in chunks:
-        embedding = embed_text(chunk)
-        vector = {
-            "id": str(uuid4()),
-            "values": embedding,
-            "metadata": {
-                "source": filename,
-                "text": chunk,
-                "categoria": tag,
-                "user_id": "sistema"
-            }
-        }
-        vectors.append(vector)
-    
-    index.upsert(vectors=vectors)
-    total_chunks += len(vectors)
-    print(f"✅ {filename} -> {len(vectors)} pedaços enviados.")
-
-print(f"\n🎉 Ingestão concluída com sucesso. Total de pedaços enviados: {total_chunks}")
\ No newline at end of file
+def chunk_id(filename, chunk):
+    """Id estável do pedaço: muda só se o texto (ou o arquivo de origem, ou o modelo) mudar."""
+    return hashlib.sha256(f"{EMBEDDING_MODEL}\0{filename}\0{chunk}".encode("utf-8")).hexdigest()[:32]
+
+def planejar(path=knowledge_dir, pasta_indice=indice_local.PASTA):
+    """Compara os textos de knowledge/ com o que já está no índice local.
+
+    Arquivos com o mesmo hash do manifesto nem são divididos de novo.
+
+    Returns:
+        dict: itens (todos os pedaços, na ordem do novo índice), novos (ids a gerar),
+            removidos (ids que saem), vetores (id -> vetor já indexado), arquivos (novo manifesto).
+    """
+    metadados, vetores = indice_local.ler(pasta_indice)
+    if metadados and metadados.get("modelo") != EMBEDDING_MODEL:
+        metadados, vetores = None, {}  # Outro modelo: tudo é gerado de novo
+    manifesto = (metadados or {}).get("arquivos", {})
+    existentes = {item["id"]: item for item in (metadados or {}).get("itens", [])}
+
+    itens, arquivos = [], {}
+    for filename, text in sorted(read_files(path)):
+        hash_arquivo = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        anterior = manifesto.get(filename)
+        inalterado = anterior and anterior["sha256"] == hash_arquivo
+        if inalterado and all(i in existentes and i in vetores for i in anterior["pedacos"]):
+            pedacos = [existentes[i] for i in anterior["pedacos"]]
+        else:
+            tag = infer_tag(filename)
+            pedacos, vistos = [], set()
+            for chunk in chunk_text_by_tokens(text):
+                id_pedaco = chunk_id(filename, chunk)
+                if id_pedaco in vistos:
+                    continue  # Pedaço repetido no mesmo arquivo: indexado uma vez só
+                vistos.add(id_pedaco)
+                pedacos.append({"id": id_pedaco, "source": filename, "text": chunk, "categoria": tag, "user_id": "sistema"})
+        arquivos[filename] = {"sha256": hash_arquivo, "pedacos": [item["id"] for item in pedacos]}
+        itens.extend(pedacos)
+
+    ids = {item["id"] for item in itens}
+    return {
+        "itens": itens,
+        "novos": [item["id"] for item in itens if item["id"] not in vetores],
+        "removidos": [id_pedaco for id_pedaco in existentes if id_pedaco not in ids],
+        "vetores": vetores,
+        "arquivos": arquivos,
+        "mudou_manifesto": arquivos != manifesto,
+    }
+
+def ingerir(path=knowledge_dir, pasta_indice=indice_local.PASTA, dry_run=False):
+    """Atualiza o índice local: gera embeddings só dos pedaços novos e tira os que sumiram.
+
+    Rodar de novo sem mudanças nos textos não gera nenhum embedding nem regrava o índice.
+    Com dry_run=True só mostra o que seria adicionado e removido.
+    """
+    print("📚 Iniciando ingestão...")
+    plano = planejar(path, pasta_indice)
+    itens, novos, removidos = plano["itens"], set(plano["novos"]), plano["removidos"]
+    origem = {item["id"]: item["source"] for item in itens}
+    for filename in plano["arquivos"]:
+        adicionados = sum(1 for id_pedaco in novos if origem[id_pedaco] == filename)
+        print(f"🗂️  {filename} | categoria: {infer_tag(filename)} | "
+              f"{len(plano['arquivos'][filename]['pedacos'])} pedaço(s), {adicionados} novo(s)")
+    print(f"➕ Adicionar: {len(novos)} | ➖ Remover: {len(removidos)} | "
+          f"= Manter: {len(itens) - len(novos)}")
+
+    if dry_run:
+        for id_pedaco in removidos:
+            print(f"   - {id_pedaco}")
+        for id_pedaco in plano["novos"]:
+            print(f"   + {id_pedaco} ({origem[id_pedaco]})")
+        print("🔎 Simulação (--dry-run): nada foi gerado nem gravado.")
+        return plano
+
+    if not novos and not removidos and not plano["mudou_manifesto"]:
+        print("\n🎉 Índice local já está em dia. Nada a fazer.")
+        return plano
+
+    vetores = plano["vetores"]
+    for item in itens:
+        if item["id"] in novos:
+            vetores[item["id"]] = embed_text(item["text"])
+    indice_local.gravar(itens, [vetores[item["id"]] for item in itens], EMBEDDING_MODEL,
+                        pasta=pasta_indice, arquivos=plano["arquivos"])
+    print(f"\n🎉 Ingestão concluída com sucesso. Total de pedaços no índice local ({pasta_indice}): {len(itens)}")
+    return plano
+
+if __name__ == "__main__":
+    # python ingest_data.py [--dry-run]
+    ingerir(dry_run="--dry-run" in sys.argv[1:])
@@ -0,0 +1,84 @@
+"""
+Tempo de partida do app, por componente, e aquecimento dos clientes externos em segundo plano.
+
+main.py importa este módulo antes de todos os outros, então o relógio começa
+junto com o import do app. O relatório (endpoint /inicializacao) mostra:
+- marcos: segundos desde o início até cada etapa (imports concluídos, startup
+  concluído, aquecimento concluído);
+- etapas: duração de cada componente medido com medir() (imports de cada
+  biblioteca pesada e grupo de módulos, passos do startup, aquecimento de cada cliente);
+- erros: componentes cujo aquecimento falhou (o uso normal tenta de novo depois).
+
+Os clientes externos (Google Sheets, Pinecone, Twilio) são criados no primeiro
+uso. aquecer() os cria numa thread depois que o servidor já aceita requisições,
+para a primeira mensagem não pagar esse custo. INICIALIZACAO_AQUECER=false
+desliga o aquecimento (tudo fica para o primeiro uso).
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+AQUECER = os.getenv("INICIALIZACAO_AQUECER", "true").lower() in ("1", "true", "sim")
+
+_inicio = time.perf_counter()
+_lock = threading.Lock()
+_marcos = {}
+_etapas = {}   # etapa -> {componente: segundos}
+_erros = {}    # componente -> mensagem
+_thread_aquecimento = None
+
+def marcar(nome):
+    """Anota quantos segundos se passaram desde o início até este ponto."""
+    segundos = round(time.perf_counter() - _inicio, 3)
+    with _lock:
+        _marcos[nome] = segundos
+    logging.info(f"[Inicialização] {nome}: {segundos:.2f}s desde o início.")
+
+@contextmanager
+def medir(etapa, componente):
+    """Mede a duração do bloco e a registra em etapa/componente."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _etapas.setdefault(etapa, {})[componente] = round(time.perf_counter() - inicio, 3)
+
+# === AQUECIMENTO ===
+def _aquecer(componentes):
+    for nome, funcao in componentes:
+        try:
+            with medir("aquecimento", nome):
+                funcao()
+        except Exception as e:
+            logging.warning(f"[Inicialização] Aquecimento de {nome} falhou (fica para o primeiro uso): {e}")
+            with _lock:
+                _erros[nome] = str(e)
+    marcar("aquecimento concluído")
+
+def aquecer(componentes):
+    """Cria os clientes em segundo plano, em ordem, uma única vez por processo.
+
+    Args:
+        componentes (list): Pares (nome, funcao) — funcao cria/carrega o componente.
+    """
+    global _thread_aquecimento
+    if not AQUECER:
+        return
+    with _lock:
+        if _thread_aquecimento is not None:
+            return
+        _thread_aquecimento = threading.Thread(target=_aquecer, args=(componentes,), name="aquecimento", daemon=True)
+    _thread_aquecimento.start()
+
+# === RELATÓRIO ===
+def relatorio():
+    with _lock:
+        return {
+            "marcos": dict(_marcos),
+            "etapas": {etapa: dict(componentes) for etapa, componentes in _etapas.items()},
+            "erros": dict(_erros),
+            "aquecimento_em_andamento": bool(_thread_aquecimento and _thread_aquecimento.is_alive()),
+        }
@@ -0,0 +1,96 @@
+"""
+Cache em memória da aba 'Limites': {numero: {categoria: {"diario", "semanal", "mensal"}}}.
+
+A aba inteira é lida de uma vez (1 chamada) e reaproveitada por todas as consultas,
+inclusive pelos jobs de alerta, que antes baixavam a aba uma vez por usuário.
+salvar_limite_usuario atualiza o cache logo depois de gravar na planilha, e uma
+recarga acontece a cada INTERVALO_RECARGA segundos para captar edições feitas
+direto na planilha (ou quando invalidar() é chamado).
+"""
+import os
+import time
+import logging
+import threading
+from planilhas import get_limites, formatar_numero
+from agregacao import valor_em_centavos
+
+INTERVALO_RECARGA = int(os.getenv("LIMITES_INTERVALO_RECARGA", "300"))  # segundos
+
+# Colunas: A NÚMERO, B CATEGORIA, C LIMITE_DIARIO, D LIMITE_SEMANAL, E LIMITE_MENSAL
+COLUNAS_TIPO = {"diario": 3, "semanal": 4, "mensal": 5}
+
+_lock = threading.RLock()
+_limites = {}  # numero -> {categoria: {"diario": float|None, "semanal": float|None, "mensal": float|None}}
+_linhas = {}   # (numero, categoria em minúsculas) -> (numero_linha, categoria como está na planilha)
+_carregado_em = None
+
+def _valor(texto):
+    centavos = valor_em_centavos(texto)
+    return centavos / 100 if centavos is not None else None
+
+def carregar(forcar=False):
+    """Lê a aba Limites (1 chamada) se o cache estiver vazio, vencido ou se forcar=True."""
+    global _limites, _linhas, _carregado_em
+    with _lock:
+        if not forcar and _carregado_em is not None and time.monotonic() - _carregado_em < INTERVALO_RECARGA:
+            return
+        limites, linhas = {}, {}
+        for i, linha in enumerate(get_limites().get_all_values()[1:], start=2):
+            linha = linha + [""] * (5 - len(linha))
+            numero = formatar_numero(str(linha[0]))
+            categoria = str(linha[1]).strip()
+            if not numero or not categoria or (numero, categoria.lower()) in linhas:
+                continue  # Mantém a primeira ocorrência, como a busca linha a linha
+            linhas[(numero, categoria.lower())] = (i, categoria)
+            limites.setdefault(numero, {})[categoria] = {
+                tipo: _valor(linha[coluna - 1]) for tipo, coluna in COLUNAS_TIPO.items()
+            }
+        _limites, _linhas, _carregado_em = limites, linhas, time.monotonic()
+        logging.info(f"Limites carregados: {len(linhas)} linha(s) de {len(limites)} usuário(s).")
+
+def invalidar():
+    """Força a releitura da aba na próxima consulta."""
+    global _carregado_em
+    with _lock:
+        _carregado_em = None
+
+# === CONSULTAS ===
+def limites_do_usuario(numero, tipo="mensal"):
+    """{categoria: limite} do tipo pedido (diario/semanal/mensal), só com valores preenchidos."""
+    carregar()
+    with _lock:
+        categorias = _limites.get(formatar_numero(str(numero)), {})
+        return {categoria: valores[tipo] for categoria, valores in categorias.items() if valores[tipo] is not None}
+
+def todos_os_limites(tipo="mensal"):
+    """{numero: {categoria: limite}} de todos os usuários (1 leitura da aba no máximo)."""
+    carregar()
+    with _lock:
+        return {
+            numero: {categoria: valores[tipo] for categoria, valores in categorias.items() if valores[tipo] is not None}
+            for numero, categorias in _limites.items()
+        }
+
+def linha_do_limite(numero, categoria):
+    """Número da linha do limite (numero, categoria) na planilha, ou None se ainda não existe."""
+    carregar()
+    with _lock:
+        encontrado = _linhas.get((formatar_numero(str(numero)), str(categoria).strip().lower()))
+        return encontrado[0] if encontrado else None
+
+# === ATUALIZAÇÃO (chamar DEPOIS de gravar na planilha) ===
+def registrar(numero, categoria, tipo, valor, numero_linha):
+    """Reflete no cache um limite recém-gravado. Sem número de linha, invalida o cache."""
+    if numero_linha is None:
+        invalidar()
+        return
+    numero = formatar_numero(str(numero))
+    categoria = str(categoria).strip()
+    with _lock:
+        existente = _linhas.get((numero, categoria.lower()))
+        if existente:
+            categoria = existente[1]  # Mantém a grafia que já está na planilha
+        else:
+            _linhas[(numero, categoria.lower())] = (numero_linha, categoria)
+        valores = _limites.setdefault(numero, {}).setdefault(categoria, dict.fromkeys(COLUNAS_TIPO))
+        valores[tipo] = _valor(valor)
@@ -1,33 +1,68 @@
+import inicializacao  # Primeiro import: marca o início do relógio da partida
 import os
-import openai
-import requests
-from fastapi import FastAPI, Request, HTTPException 
-from twilio.rest import Client
-from dotenv import load_dotenv
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-import pytz
+import asyncio
 import datetime
 import re
 import json 
 import logging 
-import mensagens
-from gastos import registrar_gasto, categorizar, corrigir_gasto, atualizar_categoria, parsear_gastos_em_lote 
-from estado_usuario import salvar_estado, carregar_estado, resetar_estado, resposta_enviada_recentemente, salvar_ultima_resposta
-from gerar_resumo import gerar_resumo
-from resgatar_contexto import buscar_conhecimento_relevante
-from upgrade import verificar_upgrade_automatico
-from armazenar_mensagem import armazenar_mensagem
-from definir_limite import salvar_limite_usuario
-from memoria_usuario import resumo_do_mes, verificar_limites, contexto_principal_usuario
-from emocional import detectar_emocao, aumento_pos_emocao
-from registrar_gastos_fixos import salvar_gasto_fixo, atualizar_categoria_gasto_fixo 
-from planilhas import get_pagantes, get_gratuitos, get_aba
-from engajamento import avaliar_engajamento
-from indicadores import get_indicadores
-from enviar_alertas import verificar_alertas
-from enviar_lembretes import enviar_lembretes
-from consultas import consultar_status_limites
+
+# Bibliotecas pesadas medidas uma a uma (o módulo que importar depois já as encontra carregadas)
+with inicializacao.medir("imports", "fastapi"):
+    from fastapi import FastAPI, Request, HTTPException 
+    from starlette.concurrency import run_in_threadpool
+with inicializacao.medir("imports", "requests_dotenv_pytz"):
+    import requests
+    from dotenv import load_dotenv
+    import pytz
+with inicializacao.medir("imports", "google_sheets"):
+    import gspread
+    import google.oauth2.service_account
+with inicializacao.medir("imports", "numpy"):
+    import numpy
+with inicializacao.medir("imports", "twilio"):
+    import twilio.rest
+
+# Módulos do app
+with inicializacao.medir("imports", "planilhas_e_gateway"):
+    import gateway_sheets
+    from planilhas import get_pagantes, get_gratuitos, get_aba
+    from escrita_lote import escrita_em_lote
+with inicializacao.medir("imports", "replicas_e_agregacao"):
+    from replica_planilhas import replica_gastos_diarios, replica_gastos_fixos
+    import agregacao
+    import consolidado_mensal
+with inicializacao.medir("imports", "filas_e_envios"):
+    import mensagens
+    import contadores
+    import fila_insercoes
+    import fila_mensagens
+    import idempotencia
+    import enviar_whatsapp
+    import agendador
+with inicializacao.medir("imports", "conhecimento"):
+    import vector_store
+    import indice_local
+    import cache_embeddings
+    from resgatar_contexto import buscar_conhecimento_relevante
+    from armazenar_mensagem import armazenar_mensagem
+with inicializacao.medir("imports", "fluxos"):
+    from gastos import registrar_gasto, categorizar, corrigir_gasto, atualizar_categoria, parsear_gastos_em_lote 
+    from estado_usuario import salvar_estado, carregar_estado, resetar_estado, resposta_enviada_recentemente, salvar_ultima_resposta, sessao_de_estado
+    from gerar_resumo import gerar_resumo
+    from upgrade import verificar_upgrade_automatico
+    from definir_limite import salvar_limite_usuario
+    from memoria_usuario import resumo_do_mes, verificar_limites, contexto_principal_usuario
+    from emocional import detectar_emocao, aumento_pos_emocao
+    from registrar_gastos_fixos import salvar_gasto_fixo, salvar_lote_gastos_fixos, atualizar_categoria_gasto_fixo 
+    import diretorio_usuarios
+    from diretorio_usuarios import buscar_usuario, obter_ou_criar_usuario, atualizar_usuario, aba_do_usuario, iniciar_ressincronizacao_periodica
+    from engajamento import avaliar_engajamento
+    from indicadores import get_indicadores
+    from enviar_alertas import verificar_alertas
+    from enviar_lembretes import enviar_lembretes
+    from consultas import consultar_status_limites
+
+inicializacao.marcar("imports concluídos")
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -37,21 +72,17 @@ app = FastAPI()
 # Validação inicial das variáveis de ambiente essenciais
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
-MESSAGING_SERVICE_SID = os.getenv("TWILIO_MESSAGING_SERVICE_SID")
+MESSAGING_SERVICE_SID = enviar_whatsapp.MESSAGING_SERVICE_SID
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 SHEET_ID_GASTOS = os.getenv("GOOGLE_SHEET_GASTOS_ID")
+# Modo assíncrono do webhook: enfileira e responde na hora (ver fila_mensagens)
+WEBHOOK_ASSINCRONO = os.getenv("WEBHOOK_MODO_ASSINCRONO", "false").lower() in ("1", "true", "sim")
+# Jobs agendados dentro do app; desligar quando rodarem num processo separado (python agendador.py)
+AGENDADOR_ATIVO = os.getenv("AGENDADOR_ATIVO", "true").lower() in ("1", "true", "sim")
 
 if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, MESSAGING_SERVICE_SID, OPENAI_API_KEY]):
     logging.error("ERRO CRÍTICO: Variáveis de ambiente essenciais (Twilio SID/Token/MessagingSID, OpenAI Key) não configuradas.")
 
-openai.api_key = OPENAI_API_KEY
-try:
-    client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-    logging.info("Cliente Twilio inicializado com sucesso.")
-except Exception as e:
-    logging.error(f"ERRO CRÍTICO: Falha ao inicializar cliente Twilio: {e}")
-    client = None 
-
 try:
     with open("prompt.txt", "r", encoding="utf-8") as arquivo_prompt:
         prompt_base = arquivo_prompt.read().strip()
@@ -144,14 +175,8 @@ def interpretar_gasto_simples(mensagem_usuario):
 # === FUNÇÕES AUXILIARES (planilhas, formatação, envio, etc. - mantidas) ===
 def get_user_status(user_number):
     try:
-        pagantes = get_pagantes().col_values(2)
-        gratuitos = get_gratuitos().col_values(2)
-        if user_number in pagantes:
-            return "Pagantes"
-        elif user_number in gratuitos:
-            return "Gratuitos"
-        else:
-            return "Novo"
+        usuario = buscar_usuario(format_number(user_number))
+        return usuario["aba"] if usuario else "Novo"
     except Exception as e:
         logging.error(f"Erro ao verificar status do usuário {user_number}: {e}")
         return "Novo"
@@ -159,22 +184,9 @@ def get_user_status(user_number):
 def get_user_sheet(user_number):
     user_number_fmt = format_number(user_number) 
     try:
-        aba_pagantes = get_pagantes()
-        aba_gratuitos = get_gratuitos()
-        pagantes = aba_pagantes.col_values(2)
-        gratuitos = aba_gratuitos.col_values(2)
-        if user_number_fmt in pagantes:
-            logging.info(f"Usuário {user_number_fmt} encontrado na aba Pagantes.")
-            return aba_pagantes
-        elif user_number_fmt in gratuitos:
-            logging.info(f"Usuário {user_number_fmt} encontrado na aba Gratuitos.")
-            return aba_gratuitos
-        else:
-            logging.info(f"Usuário {user_number_fmt} não encontrado. Adicionando à aba Gratuitos.")
-            now = datetime.datetime.now(pytz.timezone("America/Sao_Paulo")).strftime("%d/%m/%Y %H:%M:%S")
-            aba_gratuitos.append_row(["", user_number_fmt, "", now, 0, 0]) 
-            logging.info(f"Usuário {user_number_fmt} adicionado com sucesso.")
-            return aba_gratuitos
+        usuario = obter_ou_criar_usuario(user_number_fmt)
+        logging.info(f"Usuário {user_number_fmt} encontrado na aba {usuario['aba']} (linha {usuario['linha']}).")
+        return aba_do_usuario(usuario)
     except Exception as e:
         logging.error(f"Erro CRÍTICO ao obter/criar planilha para usuário {user_number_fmt}: {e}")
         raise HTTPException(status_code=500, detail="Erro interno ao acessar dados do usuário.")
@@ -201,9 +213,9 @@ def count_tokens(text):
     return len(text.split()) 
 
 def send_message(to, body):
-    """Envia mensagem via Twilio com logging e tratamento de erro."""
-    if not client:
-        logging.error(f"Tentativa de enviar mensagem para {to} falhou: Cliente Twilio não inicializado.")
+    """Coloca a mensagem na fila de envio do Twilio (enviar_whatsapp), com logging e tratamento de erro."""
+    if not enviar_whatsapp.configurado():
+        logging.error(f"Tentativa de enviar mensagem para {to} falhou: Twilio não configurado.")
         return False
     if not body or not body.strip():
         logging.warning(f"Tentativa de enviar mensagem VAZIA para {to}. Ignorado.")
@@ -212,49 +224,35 @@ def send_message(to, body):
         logging.info(f"Resposta duplicada para {to} detectada e não enviada.")
         return False
 
-    # Divide a mensagem em partes se exceder o limite do WhatsApp/Twilio
-    partes = [body[i:i+1500] for i in range(0, len(body), 1500)]
-    success = True
-    try:
-        logging.info(f"Tentando enviar mensagem para {to}: \'{body[:50]}...\' ({len(partes)} parte(s))")
-        for i, parte in enumerate(partes):
-            message = client.messages.create(
-                body=parte,
-                messaging_service_sid=MESSAGING_SERVICE_SID,
-                to=f"whatsapp:{to}"
-            )
-            logging.info(f"Parte {i+1}/{len(partes)} enviada para {to}. SID: {message.sid}")
-        salvar_ultima_resposta(to, body) # Salva a resposta completa enviada
-        logging.info(f"Mensagem completa enviada com sucesso para {to}.")
-    except Exception as e:
-        logging.error(f"ERRO TWILIO ao enviar mensagem para {to}: {e}")
-        success = False
-    return success
+    # A fila divide em partes de 1500 caracteres e envia em ordem, com retentativas
+    logging.info(f"Enfileirando mensagem para {to}: \'{body[:50]}...\'")
+    if not enviar_whatsapp.enviar_whatsapp(to, body):
+        return False
+    salvar_ultima_resposta(to, body) # Salva a resposta completa enfileirada
+    return True
 
-def get_interactions(sheet, row):
+def get_interactions(user_number):
+    # Servido pelo buffer em memória (contadores.py), sem leitura da planilha
     try:
-        val = sheet.cell(row, 6).value # Coluna F para interações
-        return int(val) if val and str(val).isdigit() else 0
+        return contadores.get_interacoes(user_number)
     except Exception as e:
-        logging.error(f"[ERRO Planilha] get_interactions (linha {row}): {e}")
+        logging.error(f"[ERRO Contadores] get_interactions ({user_number}): {e}")
         return 0
 
-def increment_interactions(sheet, row):
+def increment_interactions(user_number):
     try:
-        count = get_interactions(sheet, row) + 1
-        sheet.update_cell(row, 6, count)
-        return count
+        return contadores.incrementar_interacoes(user_number)
     except Exception as e:
-        logging.error(f"[ERRO Planilha] increment_interactions (linha {row}): {e}")
-        return get_interactions(sheet, row) # Retorna o valor antigo em caso de erro
+        logging.error(f"[ERRO Contadores] increment_interactions ({user_number}): {e}")
+        return get_interactions(user_number) # Retorna o valor atual em caso de erro
 
-def passou_limite(sheet, row):
+def passou_limite(user_number):
     try:
-        status = sheet.title # Nome da aba (Pagantes ou Gratuitos)
-        if status != "Gratuitos": return False # Pagantes não têm limite
-        return get_interactions(sheet, row) >= 10
+        usuario = buscar_usuario(user_number)
+        if not usuario or usuario["aba"] != "Gratuitos": return False # Pagantes não têm limite
+        return get_interactions(user_number) >= 10
     except Exception as e:
-        logging.error(f"[ERRO Planilha] passou_limite (linha {row}): {e}")
+        logging.error(f"[ERRO Contadores] passou_limite ({user_number}): {e}")
         return False # Assume que não passou em caso de erro
 
 def is_boas_vindas(text):
@@ -279,22 +277,19 @@ def quer_lista_comandos(texto):
     termos = ["quais comandos", "comandos disponíveis", "o que você faz", "como usar", "me ajuda com comandos", "o que posso pedir", "me manda os comandos", "comando", "menu", "como funciona", "/comandos", "/ajuda", "opções"]
     return any(t in texto_lower for t in termos)
 
-def get_tokens(sheet, row):
+def get_tokens(user_number):
     try:
-        val = sheet.cell(row, 5).value # Coluna E para tokens
-        return int(val) if val and str(val).isdigit() else 0
+        return contadores.get_tokens(user_number)
     except Exception as e:
-        logging.error(f"[ERRO Planilha] get_tokens (linha {row}): {e}")
+        logging.error(f"[ERRO Contadores] get_tokens ({user_number}): {e}")
         return 0
 
-def increment_tokens(sheet, row, novos_tokens):
+def increment_tokens(user_number, novos_tokens):
     try:
-        tokens_atuais = get_tokens(sheet, row)
-        sheet.update_cell(row, 5, tokens_atuais + novos_tokens)
-        return tokens_atuais + novos_tokens
+        return contadores.incrementar_tokens(user_number, novos_tokens)
     except Exception as e:
-        logging.error(f"[ERRO Planilha] increment_tokens (linha {row}): {e}")
-        return get_tokens(sheet, row) # Retorna o valor antigo em caso de erro
+        logging.error(f"[ERRO Contadores] increment_tokens ({user_number}): {e}")
+        return get_tokens(user_number) # Retorna o valor atual em caso de erro
 
 # Lista de categorias válidas (para validação de entrada do usuário)
 CATEGORIAS_VALIDAS = [
@@ -312,7 +307,7 @@ async def whatsapp_webhook(request: Request):
         form = await request.form()
         incoming_msg = form.get("Body", "").strip()
         from_number_raw = form.get("From", "")
-        msg_lower = incoming_msg.lower() # Definir msg_lower aqui
+        message_sid = form.get("MessageSid", "")
         
         if not incoming_msg or not from_number_raw:
             logging.warning("Requisição recebida sem 'Body' ou 'From'. Ignorando.")
@@ -325,48 +320,52 @@ async def whatsapp_webhook(request: Request):
         logging.error(f"Erro ao processar formulário da requisição: {e}")
         raise HTTPException(status_code=400, detail="Erro ao processar dados da requisição.")
 
+    # Reenvio do Twilio (mesmo MessageSid): responde sem processar de novo.
+    # O registro é uma gravação no SQLite: fica numa thread, fora do event loop
+    if not await run_in_threadpool(idempotencia.registrar, message_sid):
+        logging.info(f"Mensagem duplicada de {from_number} ({message_sid}) detectada e ignorada.")
+        return {"status": "mensagem duplicada ignorada"}
+
+    # Toda mensagem passa pela caixa do usuário: em ordem por usuário, usuários diferentes em paralelo
+    futuro = fila_mensagens.enfileirar(from_number, incoming_msg)
+    if futuro is None:
+        await run_in_threadpool(idempotencia.liberar, message_sid)  # O reenvio do Twilio deve ser processado
+        logging.error(f"Fila de mensagens cheia: mensagem de {from_number} recusada (Twilio vai reenviar).")
+        raise HTTPException(status_code=503, detail="Fila de mensagens cheia.")
+    if WEBHOOK_ASSINCRONO:
+        # Responde ao Twilio na hora; o processamento fica com os workers da fila_mensagens
+        return {"status": "mensagem enfileirada"}
+    # Modo síncrono: espera o worker terminar, sem travar o event loop
+    return await asyncio.wrap_future(futuro)
+
+def processar_mensagem(from_number, incoming_msg):
+    """Processa uma mensagem recebida (bloqueante: planilhas, OpenAI, Pinecone e Twilio).
+
+    Chamada pelos workers da fila_mensagens, um usuário por vez em cada worker.
+    As escritas em célula da mensagem inteira viram um batch_update por aba no final,
+    e o estado do usuário é gravado em disco uma única vez (sessao_de_estado).
+    """
+    with escrita_em_lote(), sessao_de_estado():
+        return _processar_mensagem(from_number, incoming_msg)
+
+def _processar_mensagem(from_number, incoming_msg):
+    msg_lower = incoming_msg.lower()
+
     try: # Bloco try principal
         estado = carregar_estado(from_number)
-        ultima_msg_registrada = estado.get("ultima_msg", "")
-
-        # Evita processar a mesma mensagem duas vezes (problema comum com webhooks)
-        if incoming_msg == ultima_msg_registrada:
-            logging.info(f"Mensagem duplicada de {from_number} detectada e ignorada.")
-            return {"status": "mensagem duplicada ignorada"}
-
-        estado["ultima_msg"] = incoming_msg # Registra a mensagem atual para evitar duplicidade futura
+        # Reenvios do Twilio já foram descartados no webhook (idempotencia, pelo MessageSid)
+        estado["ultima_msg"] = incoming_msg # Registra a mensagem atual
 
         # --- SETUP USUÁRIO --- 
+        # Dados vêm do diretório em memória (diretorio_usuarios): nenhuma leitura do Sheets aqui
         try:
-            sheet_usuario = get_user_sheet(from_number) 
-            col_numeros = sheet_usuario.col_values(2) # Coluna B tem os números
-            linha_index = col_numeros.index(from_number) + 1 # +1 porque index é 0-based e planilhas são 1-based
-            linha_usuario = sheet_usuario.row_values(linha_index)
-            logging.info(f"Dados da linha {linha_index} recuperados para {from_number}.")
-            
-            # Garante que linha_usuario tenha tamanho suficiente
-            while len(linha_usuario) < 7: linha_usuario.append("") 
-                
-            name = linha_usuario[0].strip() # Coluna A: Nome
-            email = linha_usuario[2].strip() # Coluna C: Email
-            status_usuario = sheet_usuario.title # Nome da aba
-            
-        except ValueError: 
-             # Usuário foi adicionado por get_user_sheet mas index falhou? Retentar.
-             logging.warning(f"Index falhou para {from_number} após get_user_sheet. Tentando recarregar e encontrar.")
-             try:
-                 sheet_usuario = get_user_sheet(from_number) # Garante que está na planilha
-                 col_numeros = sheet_usuario.col_values(2)
-                 linha_index = col_numeros.index(from_number) + 1
-                 linha_usuario = sheet_usuario.row_values(linha_index)
-                 while len(linha_usuario) < 7: linha_usuario.append("")
-                 name = linha_usuario[0].strip()
-                 email = linha_usuario[2].strip()
-                 status_usuario = sheet_usuario.title
-                 logging.info(f"Usuário {from_number} encontrado na segunda tentativa na linha {linha_index}.")
-             except ValueError:
-                 logging.error(f"ERRO CRÍTICO: Usuário {from_number} não encontrado na planilha mesmo após adição/verificação.")
-                 raise HTTPException(status_code=500, detail="Erro interno crítico ao localizar dados do usuário.")
+            usuario = obter_ou_criar_usuario(from_number)
+            sheet_usuario = aba_do_usuario(usuario)
+            linha_index = usuario["linha"]
+            name = usuario["nome"] # Coluna A: Nome
+            email = usuario["email"] # Coluna C: Email
+            status_usuario = usuario["aba"] # Nome da aba
+            logging.info(f"Dados da linha {linha_index} ({status_usuario}) recuperados do diretório para {from_number}.")
         except Exception as e:
             logging.error(f"ERRO CRÍTICO ao obter dados da planilha para {from_number}: {e}")
             raise HTTPException(status_code=500, detail="Erro interno ao acessar dados da planilha.")
@@ -374,7 +373,7 @@ async def whatsapp_webhook(request: Request):
         # --- VERIFICA LIMITE DE INTERAÇÕES (USUÁRIO GRATUITO) ---
         convite_premium_enviado = estado.get("convite_premium_enviado", False)
         if status_usuario == "Gratuitos" and not convite_premium_enviado:
-            interacoes = get_interactions(sheet_usuario, linha_index)
+            interacoes = get_interactions(from_number)
             if interacoes >= 10:
                 logging.info(f"Usuário gratuito {from_number} atingiu o limite de {interacoes} interações.")
                 # Usa a mensagem do módulo mensagens.py
@@ -383,15 +382,15 @@ async def whatsapp_webhook(request: Request):
                 estado["convite_premium_enviado"] = True
                 salvar_estado(from_number, estado)
                 # Incrementa interação mesmo ao enviar o convite
-                increment_interactions(sheet_usuario, linha_index)
+                increment_interactions(from_number)
                 return {"status": "limite gratuito atingido, convite enviado"}
             else:
                 # Incrementa interação para usuários gratuitos abaixo do limite
-                increment_interactions(sheet_usuario, linha_index)
+                increment_interactions(from_number)
                 logging.info(f"Interação {interacoes + 1}/10 para usuário gratuito {from_number}.")
         elif status_usuario == "Pagantes":
              # Incrementa interações para pagantes também (para métricas, se necessário)
-             increment_interactions(sheet_usuario, linha_index)
+             increment_interactions(from_number)
              logging.info(f"Interação registrada para usuário pagante {from_number}.")
 
         # --- FLUXO DE ONBOARDING/CADASTRO --- 
@@ -410,6 +409,8 @@ async def whatsapp_webhook(request: Request):
                 if nome_capturado and (not name or name == "Usuário"):
                     try: 
                         sheet_usuario.update_cell(linha_index, 1, nome_capturado) # Coluna A: Nome
+                        sheet_usuario.gravar_pendentes() # Só atualiza o diretório depois de gravar
+                        atualizar_usuario(from_number, nome=nome_capturado)
                         name = nome_capturado
                         nome_atualizado = True
                         logging.info(f"Nome de {from_number} atualizado para {name}")
@@ -418,6 +419,8 @@ async def whatsapp_webhook(request: Request):
                 if email_capturado and not email:
                     try: 
                         sheet_usuario.update_cell(linha_index, 3, email_capturado) # Coluna C: Email
+                        sheet_usuario.gravar_pendentes() # Só atualiza o diretório depois de gravar
+                        atualizar_usuario(from_number, email=email_capturado)
                         email = email_capturado
                         email_atualizado = True
                         logging.info(f"Email de {from_number} atualizado para {email}")
@@ -698,22 +701,18 @@ async def whatsapp_webhook(request: Request):
                 sucesso = []
                 falha = []
 
-                aba_gastos_fixos = get_aba(SHEET_ID_GASTOS, "Gastos Fixos")
-                celulas_existentes = aba_gastos_fixos.findall(str(from_number))
-
-                descricoes_existentes = set()
-                for cel in celulas_existentes:
-                    linha_atual = aba_gastos_fixos.row_values(cel.row)
-                    descricoes_existentes.add(linha_atual[1].strip().lower())
-
-                for gasto in gastos_pendentes:
-                    if gasto["descricao"].strip().lower() in descricoes_existentes:
-                        continue
-
-                    resultado = salvar_gasto_fixo(
-                        from_number, gasto["descricao"], gasto["valor"], gasto["dia"], gasto["categoria_status"]
-                    )
-
+                descricoes_existentes = {
+                    linha_atual[1].strip().lower()
+                    for _, linha_atual in replica_gastos_fixos.linhas_do_usuario(from_number)
+                }
+
+                novos = [
+                    {"descricao": gasto["descricao"], "valor": gasto["valor"], "dia": gasto["dia"], "categoria": gasto["categoria_status"]}
+                    for gasto in gastos_pendentes
+                    if gasto["descricao"].strip().lower() not in descricoes_existentes
+                ]
+                # Todos os gastos confirmados numa única inserção na planilha
+                for gasto, resultado in zip(novos, salvar_lote_gastos_fixos(from_number, novos)):
                     if resultado["status"] == "ok":
                         sucesso.append(gasto["descricao"])
                     else:
@@ -985,17 +984,20 @@ async def whatsapp_webhook(request: Request):
             respostas_nao = ["não", "nao", "dispenso", "deixa", "nada", "negativo", "melhor não", "melhor nao", "não precisa", "tranquilo", "prefiro nao"]
 
             if resposta_usuario in respostas_sim:
-                send_message(from_number, mensagens.estilo_msg("✅ Maravilha! Lembretes automáticos ativados. Vou te avisar sempre no dia anterior e também no dia do vencimento, beleza? 😉"))
-                estado["lembretes_fixos_ativos"] = True
                 gastos_fixos_aba = get_aba(SHEET_ID_GASTOS, "Gastos Fixos")
                 numero_formatado = from_number.replace("whatsapp:", "").replace("+", "").replace(" ", "").strip()
-                celulas = gastos_fixos_aba.findall(numero_formatado)
-                if celulas:
-                    for celula in celulas:
-                        linha = celula.row
-                        gastos_fixos_aba.update_cell(linha, 7, "SIM")  # Coluna G (LEMBRETE_ATIVO)
+                linhas_fixos = replica_gastos_fixos.linhas_do_usuario(numero_formatado)
+                if linhas_fixos:
+                    with escrita_em_lote():  # Todas as linhas numa única chamada
+                        for linha, _ in linhas_fixos:
+                            gastos_fixos_aba.update_cell(linha, 7, "SIM")  # Coluna G (LEMBRETE_ATIVO)
+                        gastos_fixos_aba.gravar_pendentes()  # Grava antes de confirmar ao usuário e mudar a réplica
+                    for linha, _ in linhas_fixos:
+                        replica_gastos_fixos.atualizar_celula(linha, 7, "SIM")
                 else:
                     logging.warning(f"Nenhuma célula encontrada para o número {numero_formatado} em Gastos Fixos.")
+                send_message(from_number, mensagens.estilo_msg("✅ Maravilha! Lembretes automáticos ativados. Vou te avisar sempre no dia anterior e também no dia do vencimento, beleza? 😉"))
+                estado["lembretes_fixos_ativos"] = True
 
             elif resposta_usuario in respostas_nao:
                 send_message(from_number, mensagens.estilo_msg("Combinado! Sem lembretes por enquanto. Se precisar depois é só me avisar. 😉"))
@@ -1246,6 +1248,8 @@ async def whatsapp_webhook(request: Request):
             
             try:
                 logging.info(f"Chamando GPT para {from_number} com {len(historico_gpt)} mensagens no histórico.")
+                import openai  # Import pesado: fica para o primeiro uso ou para o aquecimento (ver inicializacao)
+                openai.api_key = OPENAI_API_KEY
                 response_gpt = openai.ChatCompletion.create(
                     model="gpt-4-turbo", # Usar modelo mais capaz para conversas gerais
                     messages=historico_gpt,
@@ -1255,7 +1259,7 @@ async def whatsapp_webhook(request: Request):
                 resposta_gpt = response_gpt["choices"][0]["message"]["content"].strip()
                 tokens_usados = response_gpt["usage"]["total_tokens"]
                 logging.info(f"Resposta do GPT recebida para {from_number}. Tokens usados: {tokens_usados}")
-                increment_tokens(sheet_usuario, linha_index, tokens_usados)
+                increment_tokens(from_number, tokens_usados)
                 
                 # Envia a resposta do GPT
                 send_message(from_number, mensagens.estilo_msg(resposta_gpt))
@@ -1303,6 +1307,84 @@ async def whatsapp_webhook(request: Request):
         # Retorna um erro 500 genérico
         raise HTTPException(status_code=500, detail="Erro interno inesperado no servidor.")
 
+def _aquecer_openai():
+    import openai
+    openai.api_key = OPENAI_API_KEY
+
+def _aquecer_twilio():
+    if enviar_whatsapp.configurado():
+        enviar_whatsapp.cliente_twilio()
+
+def _iniciar_reconciliacao_das_replicas():
+    replica_gastos_diarios.iniciar_reconciliacao_periodica()
+    replica_gastos_fixos.iniciar_reconciliacao_periodica()
+
+def _aquecer_replicas():
+    replica_gastos_diarios.atualizar()
+    replica_gastos_fixos.atualizar()
+
+@app.on_event("startup")
+async def iniciar_tarefas_de_fundo():
+    # Só inicia threads: nada aqui espera rede, para o servidor aceitar requisições logo
+    passos = [
+        # Mantém o diretório de usuários em dia com alterações feitas direto na planilha
+        ("diretorio_usuarios", iniciar_ressincronizacao_periodica),
+        ("contadores", contadores.iniciar_descarga_periodica),
+        ("replicas", _iniciar_reconciliacao_das_replicas),
+        ("consolidado_mensal", consolidado_mensal.iniciar_gravacao_periodica),
+        ("fila_insercoes", fila_insercoes.iniciar),  # Regrava o que ficou no diário se o processo caiu com inserções na fila
+        ("fila_mensagens", lambda: fila_mensagens.iniciar(processar_mensagem)),
+        ("envios_whatsapp", enviar_whatsapp.iniciar),  # Retoma os envios que ficaram na fila
+    ]
+    if AGENDADOR_ATIVO:
+        passos.append(("agendador", agendador.iniciar))  # Só o worker que vencer a eleição de líder executa os jobs
+    for nome, funcao in passos:
+        with inicializacao.medir("startup", nome):
+            funcao()
+    inicializacao.marcar("startup concluído")
+    # Clientes externos e cargas iniciais em segundo plano, com o servidor já no ar
+    inicializacao.aquecer([
+        ("openai", _aquecer_openai),
+        ("google_sheets", diretorio_usuarios.carregar),
+        ("replicas", _aquecer_replicas),
+        ("indice_local", indice_local.disponivel),
+        ("pinecone", vector_store.indice),
+        ("twilio", _aquecer_twilio),
+    ])
+
+@app.on_event("shutdown")
+async def finalizar_tarefas_de_fundo():
+    # Termina as mensagens já aceitas antes de gravar o que ficou pendente
+    agendador.parar()
+    fila_mensagens.parar()
+    enviar_whatsapp.parar()
+    # Grava as inserções enfileiradas e os contadores de tokens/interações que ainda estão só em memória
+    fila_insercoes.descarregar()
+    contadores.descarregar()
+    consolidado_mensal.gravar()
+
+@app.get("/metricas")
+async def metricas():
+    # Profundidade e atraso da fila de mensagens, para dimensionar FILA_MENSAGENS_WORKERS.
+    # Envios e embeddings consultam o SQLite: ficam numa thread, fora do event loop
+    return {
+        "webhook_assincrono": WEBHOOK_ASSINCRONO,
+        "fila_mensagens": fila_mensagens.metricas(),
+        "envios_whatsapp": await run_in_threadpool(enviar_whatsapp.metricas),
+        "sheets": gateway_sheets.metricas(),
+        "embeddings": await run_in_threadpool(cache_embeddings.metricas),
+    }
+
+@app.get("/inicializacao")
+async def relatorio_inicializacao():
+    # Tempo de partida por componente (imports, startup, aquecimento), para comparar entre deploys
+    return inicializacao.relatorio()
+
+@app.get("/jobs")
+async def jobs():
+    # Agenda, próxima execução e histórico (duração, status) dos jobs periódicos
+    return await run_in_threadpool(agendador.situacao)
+
 # Endpoint adicional para testes ou status (opcional)
 @app.get("/")
 async def root():
@@ -1,14 +1,15 @@
-from planilhas import get_gastos_diarios, get_limites
+from planilhas import ler_limites_usuario
+from replica_planilhas import replica_gastos_diarios
 from datetime import datetime
 import pytz
 from collections import Counter
 import re
+import consolidado_mensal
 
 def get_gastos_usuario(numero_usuario):
-    aba = get_gastos_diarios()
-    registros = aba.get_all_values()[1:]
     gastos_usuario = [
-        linha for linha in registros if linha[1].strip() == numero_usuario
+        linha for _, linha in replica_gastos_diarios.linhas_do_usuario(numero_usuario)
+        if linha[1].strip() == numero_usuario
     ]
     return gastos_usuario
 
@@ -18,60 +19,38 @@ def resumo_do_mes(numero_usuario, mes=None, ano=None):
     mes = mes or agora.month
     ano = ano or agora.year
 
-    gastos = get_gastos_usuario(numero_usuario)
-    total = 0
-    categorias = []
-
-    for linha in gastos:
-        try:
-            data = datetime.strptime(linha[6], "%d/%m/%Y")
-            if data.month == mes and data.year == ano:
-                valor_str = linha[4].replace("R$", "").replace(".", "").replace(",", ".").strip()
-                valor = float(valor_str)
-                total += valor
-                categorias.append(linha[3])
-        except:
-            continue
+    por_categoria = consolidado_mensal.categorias_do_mes(numero_usuario, ano, mes)
 
-    if not categorias:
+    if not por_categoria:
         return "Nenhum gasto encontrado neste mês."
 
-    contagem = Counter(categorias)
-    mais_frequentes = contagem.most_common(3)
+    total = sum(total_cat for total_cat, _ in por_categoria.values())
+    # Mais frequentes primeiro; empates ficam na ordem em que a categoria apareceu (como Counter.most_common)
+    mais_frequentes = sorted(por_categoria.items(), key=lambda item: -item[1][1])[:3]
     resumo = f"📅 *Resumo das suas finanças em {mes}/{ano}:*\n"
     resumo += f"Total gasto: R$ {total:.2f}\n"
     resumo += "Categorias mais frequentes:\n"
 
-    for cat, qtd in mais_frequentes:
-        total_cat = sum(float(linha[4].replace("R$", "").replace(".", "").replace(",", ".").strip()) for linha in gastos if linha[3] == cat and data.strptime(linha[6], "%d/%m/%Y").month == mes and data.strptime(linha[6], "%d/%m/%Y").year == ano)
+    for cat, (total_cat, qtd) in mais_frequentes:
         resumo += f"- {cat}: R${total_cat:.2f} ({qtd}x)\n"
 
     return resumo
 
 def verificar_limites(numero_usuario):
     try:
-        limites = get_limites()
-        gastos = get_gastos_usuario(numero_usuario)
-        total_por_categoria = {}
-
-        for linha in gastos:
-            categoria = linha[3]
-            valor_str = linha[4].replace("R$", "").replace(".", "").replace(",", ".").strip()
-            valor = float(valor_str)
-            total_por_categoria[categoria] = total_por_categoria.get(categoria, 0) + valor
+        hoje = datetime.now(pytz.timezone("America/Sao_Paulo"))
+        limites = ler_limites_usuario(numero_usuario)
+        total_por_categoria = consolidado_mensal.totais_do_mes(numero_usuario, hoje.year, hoje.month)
 
         resposta = "🔎 *Status dos limites*\n"
-        for linha in limites.get_all_values()[1:]:
-            if linha[1] == numero_usuario:
-                categoria = linha[2]
-                limite = float(linha[3])
-                total = total_por_categoria.get(categoria, 0)
-                if total > limite:
-                    resposta += f"⚠️ *{categoria}* passou do limite (R$ {total:.2f} / R$ {limite:.2f})\n"
-                else:
-                    resposta += f"✅ *{categoria}* está dentro (R$ {total:.2f} / R$ {limite:.2f})\n"
-
-        return resposta or "Sem limites registrados."
+        for categoria, limite in limites.items():
+            total = total_por_categoria.get(categoria, 0)
+            if total > limite:
+                resposta += f"⚠️ *{categoria}* passou do limite (R$ {total:.2f} / R$ {limite:.2f})\n"
+            else:
+                resposta += f"✅ *{categoria}* está dentro (R$ {total:.2f} / R$ {limite:.2f})\n"
+
+        return resposta if limites else "Sem limites registrados."
 
     except Exception as e:
         return f"[Erro ao verificar limites] {str(e)}"
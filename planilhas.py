@@ -1,9 +1,14 @@
 import os
+import logging
+import threading
 import gspread
 from dotenv import load_dotenv
-from oauth2client.service_account import ServiceAccountCredentials
+from google.oauth2.service_account import Credentials
 import datetime
+import re
 import pytz
+from escrita_lote import AbaComLote
+from gateway_sheets import AbaControlada, executar
 
 load_dotenv()
 
@@ -12,21 +17,81 @@ GOOGLE_SHEET_GASTOS_ID = os.getenv("GOOGLE_SHEET_GASTOS_ID")
 GOOGLE_SHEETS_KEY_FILE = os.getenv("GOOGLE_SHEETS_KEY_FILE")
 
 scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-creds = ServiceAccountCredentials.from_json_keyfile_name(GOOGLE_SHEETS_KEY_FILE, scope)
-gs = gspread.authorize(creds)
 
+# === CLIENTE E ABAS (criados no primeiro uso, um por processo) ===
+# Nada é autorizado no import: o primeiro get_aba cria o cliente. A sessão do
+# google-auth renova o token sozinha quando ele expira.
+_lock_cliente = threading.RLock()
+_cliente = None
+_cache_planilhas = {}  # sheet_id -> {nome da aba: propriedades} (uma leitura de metadados por planilha)
 _cache_abas = {}
 
+def cliente():
+    """Cliente gspread compartilhado, autorizado na primeira chamada."""
+    global _cliente
+    with _lock_cliente:
+        if _cliente is None:
+            creds = Credentials.from_service_account_file(GOOGLE_SHEETS_KEY_FILE, scopes=scope)
+            _cliente = gspread.authorize(creds)
+            logging.info("Cliente do Google Sheets autorizado.")
+        return _cliente
+
 def formatar_numero(numero):
     return numero.replace("whatsapp:", "").replace("+", "").replace(" ", "").strip()
 
+def linha_do_append(resposta):
+    """Extrai o número da primeira linha gravada a partir da resposta de append_row/append_rows.
+
+    Args:
+        resposta (dict): Resposta da API (ex: {"updates": {"updatedRange": "'Gratuitos'!A15:F15"}}).
+
+    Returns:
+        int: Número da linha (base 1) ou None se a resposta não trouxer o intervalo.
+    """
+    try:
+        intervalo = resposta["updates"]["updatedRange"]
+    except (TypeError, KeyError):
+        return None
+    match = re.match(r"[A-Z]+(\d+)", intervalo.split("!")[-1])
+    return int(match.group(1)) if match else None
+
+class _Planilha(gspread.Spreadsheet):
+    """Spreadsheet que guarda a resposta de metadados lida ao ser criada (já traz todas as abas)."""
+
+    def fetch_sheet_metadata(self, params=None):
+        self.metadados = super().fetch_sheet_metadata(params)
+        return self.metadados
+
+def _abrir_planilha(sheet_id):
+    """Abre a planilha e guarda as propriedades de todas as abas, numa única leitura de metadados."""
+    # Mesmo que cliente().open_by_key, mas sem jogar fora a lista de abas da resposta
+    try:
+        planilha = executar("leitura", _Planilha, cliente(), {"id": sheet_id}, descricao=f"abrir planilha {sheet_id}")
+    except gspread.exceptions.APIError as e:
+        if getattr(e.response, "status_code", None) == 404:
+            raise gspread.SpreadsheetNotFound(e.response) from e
+        raise
+    propriedades = {aba["properties"]["title"]: aba["properties"] for aba in planilha.metadados["sheets"]}
+    _cache_planilhas[sheet_id] = (planilha, propriedades)
+    return _cache_planilhas[sheet_id]
+
 def get_aba(sheet_id, nome_aba):
     chave = f"{sheet_id}_{nome_aba}"
-    if chave not in _cache_abas:
-        planilha = gs.open_by_key(sheet_id)
-        aba = planilha.worksheet(nome_aba)
-        _cache_abas[chave] = aba
-    return _cache_abas[chave]
+    aba = _cache_abas.get(chave)
+    if aba is not None:
+        return aba
+    with _lock_cliente:
+        if chave not in _cache_abas:
+            aberta = _cache_planilhas.get(sheet_id)
+            if aberta is None or nome_aba not in aberta[1]:
+                aberta = _abrir_planilha(sheet_id)  # Primeira vez, ou aba criada depois da última leitura
+            planilha, propriedades = aberta
+            if nome_aba not in propriedades:
+                raise gspread.WorksheetNotFound(nome_aba)
+            aba = gspread.Worksheet(planilha, propriedades[nome_aba])
+            # Agrupa gravações dentro de escrita_em_lote(); cada chamada à API passa pelo gateway_sheets
+            _cache_abas[chave] = AbaComLote(AbaControlada(aba))
+        return _cache_abas[chave]
 
 def get_pagantes():
     return get_aba(GOOGLE_SHEET_ID, "Pagantes")
@@ -44,21 +109,9 @@ def get_gastos_fixos():
     return get_aba(GOOGLE_SHEET_GASTOS_ID, "Gastos Fixos")
 
 def get_user_sheet(user_number):
-    user_number = formatar_numero(user_number)
-    aba_pagantes = get_pagantes()
-    aba_gratuitos = get_gratuitos()
-
-    pagantes = [formatar_numero(num) for num in aba_pagantes.col_values(2)]
-    gratuitos = [formatar_numero(num) for num in aba_gratuitos.col_values(2)]
-
-    if user_number in pagantes:
-        return aba_pagantes
-    elif user_number in gratuitos:
-        return aba_gratuitos
-    else:
-        now = datetime.datetime.now(pytz.timezone("America/Sao_Paulo")).strftime("%d/%m/%Y %H:%M:%S")
-        aba_gratuitos.append_row(["", user_number, "", now, 0, 0])
-        return aba_gratuitos
+    # Import local para evitar import circular (diretorio_usuarios depende deste módulo)
+    from diretorio_usuarios import obter_ou_criar_usuario, aba_do_usuario
+    return aba_do_usuario(obter_ou_criar_usuario(formatar_numero(user_number)))
 
 
 def ler_limites_usuario(numero_usuario):
@@ -71,22 +124,9 @@ def ler_limites_usuario(numero_usuario):
         dict: Dicionário com {categoria: limite_mensal_float} ou {} se não encontrado/erro.
     """
     try:
-        aba_limites = get_limites()
-        todos_limites = aba_limites.get_all_records() # Assume cabeçalhos na linha 1
-        limites_usuario = {}
-        for linha in todos_limites:
-            # Assume que a coluna 'NÚMERO' contém o número formatado
-            if str(linha.get('NÚMERO')) == numero_usuario:
-                categoria = linha.get('CATEGORIA')
-                limite_str = linha.get('LIMITE_MENSAL') # Pega da coluna E
-                if categoria and limite_str:
-                    try:
-                        # Tenta converter para float, removendo 'R$', '.' e substituindo ',' por '.'
-                        limite_float = float(str(limite_str).replace('R$', '').replace('.', '').replace(',', '.').strip())
-                        limites_usuario[categoria] = limite_float
-                    except ValueError:
-                        print(f"[WARN] Valor de limite inválido para {categoria} do usuário {numero_usuario}: {limite_str}")
-        return limites_usuario
+        # Import local para evitar import circular (limites depende deste módulo)
+        from limites import limites_do_usuario
+        return limites_do_usuario(numero_usuario)
     except Exception as e:
         print(f"[ERROR] Erro ao ler limites para {numero_usuario}: {e}")
         return {}
@@ -102,8 +142,9 @@ def ler_gastos_usuario_periodo(numero_usuario, data_inicio):
         list: Lista de dicionários [{coluna: valor}, ...] ou [] se não encontrado/erro.
     """
     try:
-        aba_gastos = get_gastos_diarios()
-        todos_gastos = aba_gastos.get_all_records()
+        # Import local para evitar import circular (replica_planilhas depende deste módulo)
+        from replica_planilhas import replica_gastos_diarios
+        todos_gastos = replica_gastos_diarios.registros_do_usuario(numero_usuario)
         gastos_filtrados = []
         fuso_sp = pytz.timezone("America/Sao_Paulo")
 
@@ -147,10 +188,13 @@ def ler_gastos_usuario_periodo(numero_usuario, data_inicio):
 
 def salvar_gasto_fixo(numero_usuario, descricao, valor, dia, categoria, lembrete_ativo=False):
     try:
-        aba_gastos_fixos = get_gastos_fixos()
         lembrete = "SIM" if lembrete_ativo else "NÃO"
         nova_linha = [numero_usuario, descricao, valor, "", categoria, dia, lembrete]
-        aba_gastos_fixos.append_row(nova_linha)
+        # Imports locais: fila_insercoes e replica_planilhas importam este módulo
+        import fila_insercoes
+        from replica_planilhas import replica_gastos_fixos
+        numero_linha = fila_insercoes.inserir(GOOGLE_SHEET_GASTOS_ID, "Gastos Fixos", [nova_linha])
+        replica_gastos_fixos.registrar_linha(numero_linha, nova_linha)
         return {"status": "ok"}
     except Exception as e:
         print(f"[ERRO] ao salvar gasto fixo: {e}")
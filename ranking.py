@@ -1,21 +1,15 @@
 import os
-import gspread
 from collections import defaultdict
 from dotenv import load_dotenv
-from oauth2client.service_account import ServiceAccountCredentials
+from planilhas import get_aba
 
 load_dotenv()
 GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
-GOOGLE_SHEETS_KEY_FILE = os.getenv("GOOGLE_SHEETS_KEY_FILE")
-
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-creds = ServiceAccountCredentials.from_json_keyfile_name(GOOGLE_SHEETS_KEY_FILE, scope)
-gs = gspread.authorize(creds)
 
 # === RANKING GERAL ===
 def get_ranking_geral(top=5):
     try:
-        aba = gs.open_by_key(GOOGLE_SHEET_ID).worksheet("Engajamento")
+        aba = get_aba(GOOGLE_SHEET_ID, "Engajamento")
         dados = aba.get_all_records()
         pontuacoes = defaultdict(int)
 
@@ -44,7 +38,7 @@ def get_ranking_geral(top=5):
 # === RANKING INDIVIDUAL ===
 def get_ranking_usuario(numero):
     try:
-        aba = gs.open_by_key(GOOGLE_SHEET_ID).worksheet("Engajamento")
+        aba = get_aba(GOOGLE_SHEET_ID, "Engajamento")
         dados = aba.get_all_records()
         total = 0
 
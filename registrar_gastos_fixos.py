@@ -3,7 +3,9 @@ Função para registrar gastos fixos mensais na planilha.
 """
 import logging
 import re
-from planilhas import get_gastos_fixos, formatar_numero
+from planilhas import get_gastos_fixos, formatar_numero, GOOGLE_SHEET_GASTOS_ID
+import fila_insercoes
+from replica_planilhas import replica_gastos_fixos, chave_gasto_fixo
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -12,93 +14,131 @@ CATEGORIAS_VALIDAS = [
     'Alimentação', 'Utilidades', 'Investimentos', 'Outros'
 ]
 
-def salvar_gasto_fixo(numero_usuario, descricao, valor, dia_vencimento, categoria):
+def _montar_linha_gasto_fixo(numero_usuario, descricao, valor, dia_vencimento, categoria):
+    """Valida os dados e monta a linha da aba 'Gastos Fixos'.
+
+    Returns:
+        tuple: (linha, None) se válido ou (None, {"status": "erro", "mensagem": ...}).
+    """
+    # Validação ROBUSTA
     try:
-        # Validação ROBUSTA
-        try:
-            valor_float = float(valor)
-            if valor_float < 0: raise ValueError("Valor negativo")
-        except ValueError:
-            logging.error(f"Valor inválido '{valor}' para gasto fixo '{descricao}' do usuário {numero_usuario}.")
-            return {"status": "erro", "mensagem": f"O valor '{valor}' não é válido. Use o formato 1234.56"}
+        valor_float = float(valor)
+        if valor_float < 0: raise ValueError("Valor negativo")
+    except ValueError:
+        logging.error(f"Valor inválido '{valor}' para gasto fixo '{descricao}' do usuário {numero_usuario}.")
+        return None, {"status": "erro", "mensagem": f"O valor '{valor}' não é válido. Use o formato 1234.56"}
 
-        try:
-            dia_int = int(dia_vencimento)
-            if not 1 <= dia_int <= 31: raise ValueError("Dia inválido")
-        except ValueError:
-            logging.error(f"Dia inválido '{dia_vencimento}' para gasto fixo '{descricao}' do usuário {numero_usuario}.")
-            return {"status": "erro", "mensagem": f"O dia '{dia_vencimento}' não é válido. Deve ser um número entre 1 e 31."}
-
-        if categoria not in CATEGORIAS_VALIDAS:
-            logging.error(f"Categoria inválida '{categoria}' para gasto fixo '{descricao}' do usuário {numero_usuario}.")
-            return {"status": "erro", "mensagem": f"A categoria '{categoria}' não é válida. Escolha uma categoria da lista."}
-
-        aba_gastos_fixos = get_gastos_fixos()
-        # Colunas esperadas: NÚMERO, DESCRIÇÃO, VALOR, FORMA_PGTO, CATEGORIA, DIA_DO_MÊS
-        linha = [
-            str(numero_usuario), # Garante que seja string
-            str(descricao).strip().capitalize(),
-            f'{valor_float:.2f}'.replace('.', ','), # Usa valor_float validado
-            "", # FORMA_PGTO (deixar em branco por enquanto)
-            str(categoria).strip().capitalize(),
-            str(dia_int) # Usa dia_int validado
-        ]
-        aba_gastos_fixos.append_row(linha)
+    try:
+        dia_int = int(dia_vencimento)
+        if not 1 <= dia_int <= 31: raise ValueError("Dia inválido")
+    except ValueError:
+        logging.error(f"Dia inválido '{dia_vencimento}' para gasto fixo '{descricao}' do usuário {numero_usuario}.")
+        return None, {"status": "erro", "mensagem": f"O dia '{dia_vencimento}' não é válido. Deve ser um número entre 1 e 31."}
+
+    if categoria not in CATEGORIAS_VALIDAS:
+        logging.error(f"Categoria inválida '{categoria}' para gasto fixo '{descricao}' do usuário {numero_usuario}.")
+        return None, {"status": "erro", "mensagem": f"A categoria '{categoria}' não é válida. Escolha uma categoria da lista."}
+
+    # Colunas esperadas: NÚMERO, DESCRIÇÃO, VALOR, FORMA_PGTO, CATEGORIA, DIA_DO_MÊS
+    linha = [
+        str(numero_usuario), # Garante que seja string
+        str(descricao).strip().capitalize(),
+        f'{valor_float:.2f}'.replace('.', ','), # Usa valor_float validado
+        "", # FORMA_PGTO (deixar em branco por enquanto)
+        str(categoria).strip().capitalize(),
+        str(dia_int) # Usa dia_int validado
+    ]
+    return linha, None
+
+def _erro_ao_salvar(descricao, e):
+    # Mensagem de erro mais amigável
+    return {
+        "status": "erro", 
+        "mensagem": f"Ops! Algo deu errado ao tentar salvar o gasto '{str(descricao)}'. Verifique se todos os dados estão corretos e tente novamente. Detalhe técnico: {str(e)}"
+    }
+
+def salvar_gasto_fixo(numero_usuario, descricao, valor, dia_vencimento, categoria):
+    try:
+        linha, erro = _montar_linha_gasto_fixo(numero_usuario, descricao, valor, dia_vencimento, categoria)
+        if erro:
+            return erro
+        numero_linha = fila_insercoes.inserir(GOOGLE_SHEET_GASTOS_ID, "Gastos Fixos", [linha])
+        replica_gastos_fixos.registrar_linha(numero_linha, linha)
         logging.info(f"Gasto fixo '{str(descricao)}' para {numero_usuario} salvo com sucesso.")
         return {"status": "ok"}
+    except fila_insercoes.GravacaoPendente as e:
+        # Já enviado: a réplica recebe a linha quando a gravação terminar
+        logging.warning(f"Gasto fixo '{str(descricao)}' para {numero_usuario} ainda sendo gravado: {e}")
+        fila_insercoes.quando_gravado(e.futuro, lambda numero_linha: replica_gastos_fixos.registrar_linha(numero_linha, linha))
+        return {"status": "ok", "pendente": True}
     except Exception as e:
         logging.error(f"Erro ao salvar gasto fixo '{str(descricao)}' para {numero_usuario}: {e}", exc_info=True)
-        # Mensagem de erro mais amigável
-        return {
-            "status": "erro", 
-            "mensagem": f"Ops! Algo deu errado ao tentar salvar o gasto '{str(descricao)}'. Verifique se todos os dados estão corretos e tente novamente. Detalhe técnico: {str(e)}"
-        }
+        return _erro_ao_salvar(descricao, e)
 
-def atualizar_categoria_gasto_fixo(numero_usuario, descricao_gasto, dia_gasto, nova_categoria):
-    try:
-        aba_gastos_fixos = get_gastos_fixos()
-        
-        todos_os_valores = aba_gastos_fixos.get_all_values()
-        if not todos_os_valores:
-            logging.warning(f"A planilha 'Gastos Fixos' está vazia. Não é possível atualizar categoria para {numero_usuario}.")
-            return False
-            
-        headers = todos_os_valores[0]
+def salvar_lote_gastos_fixos(numero_usuario, gastos):
+    """Salva vários gastos fixos do usuário com um único append (ex: confirmação da lista inteira).
+
+    Args:
+        numero_usuario (str): Número do usuário.
+        gastos (list): Dicts com descricao, valor, dia e categoria.
+
+    Returns:
+        list: Um resultado por gasto, na mesma ordem ({"status": "ok"} ou {"status": "erro", "mensagem": ...}).
+    """
+    resultados = [None] * len(gastos)
+    validos = []  # (posição, linha)
+    for i, gasto in enumerate(gastos):
         try:
-            idx_numero = headers.index('NÚMERO') 
-            idx_descricao = headers.index('DESCRIÇÃO') 
-            idx_categoria = headers.index('CATEGORIA') 
-            idx_dia = headers.index('DIA_DO_MÊS') 
-        except ValueError:
-            logging.warning("Headers não encontradas como esperado na planilha 'Gastos Fixos'. Usando índices fixos.")
-            idx_numero = 0
-            idx_descricao = 1
-            idx_categoria = 4
-            idx_dia = 5
-
-        linha_para_atualizar = -1
-        for i, linha_valores in enumerate(todos_os_valores[1:], start=2): 
-            if len(linha_valores) > max(idx_numero, idx_descricao, idx_dia, idx_categoria):
-                num_planilha = str(linha_valores[idx_numero]).strip()
-                desc_planilha = str(linha_valores[idx_descricao]).strip().lower()
-                dia_planilha_str = str(linha_valores[idx_dia]).strip()
-
-                if (
-                    num_planilha == str(numero_usuario) and
-                    desc_planilha == str(descricao_gasto).strip().lower() and
-                    dia_planilha_str == str(dia_gasto) 
-                ):
-                    linha_para_atualizar = i
-                    break
-            
-        if linha_para_atualizar != -1:
-            aba_gastos_fixos.update_cell(linha_para_atualizar, idx_categoria + 1, str(nova_categoria).strip().capitalize()) 
-            logging.info(f"Categoria do gasto fixo '{str(descricao_gasto)}' (dia {str(dia_gasto)}) para {str(numero_usuario)} atualizada para '{str(nova_categoria)}'.")
-            return True
+            linha, erro = _montar_linha_gasto_fixo(
+                numero_usuario, gasto["descricao"], gasto["valor"], gasto["dia"], gasto["categoria"]
+            )
+        except Exception as e:
+            logging.error(f"Erro ao validar gasto fixo '{gasto.get('descricao')}' para {numero_usuario}: {e}", exc_info=True)
+            linha, erro = None, _erro_ao_salvar(gasto.get("descricao"), e)
+        if erro:
+            resultados[i] = erro
         else:
+            validos.append((i, linha))
+    if not validos:
+        return resultados
+
+    linhas = [linha for _, linha in validos]
+    try:
+        primeira_linha = fila_insercoes.inserir(GOOGLE_SHEET_GASTOS_ID, "Gastos Fixos", linhas)
+        replica_gastos_fixos.registrar_linhas(primeira_linha, linhas)
+        logging.info(f"{len(linhas)} gasto(s) fixo(s) para {numero_usuario} salvos com sucesso.")
+        for i, _ in validos:
+            resultados[i] = {"status": "ok"}
+    except fila_insercoes.GravacaoPendente as e:
+        logging.warning(f"Lote de gastos fixos para {numero_usuario} ainda sendo gravado: {e}")
+        fila_insercoes.quando_gravado(e.futuro, lambda primeira_linha: replica_gastos_fixos.registrar_linhas(primeira_linha, linhas))
+        for i, _ in validos:
+            resultados[i] = {"status": "ok", "pendente": True}
+    except Exception as e:
+        logging.error(f"Erro ao salvar lote de gastos fixos para {numero_usuario}: {e}", exc_info=True)
+        for i, _ in validos:
+            resultados[i] = _erro_ao_salvar(gastos[i]["descricao"], e)
+    return resultados
+
+def atualizar_categoria_gasto_fixo(numero_usuario, descricao_gasto, dia_gasto, nova_categoria):
+    try:
+        # Colunas: NÚMERO, DESCRIÇÃO, VALOR, FORMA_PGTO, CATEGORIA, DIA_DO_MÊS (mesma ordem de salvar_gasto_fixo)
+        encontrado = replica_gastos_fixos.localizar_confirmado(
+            "descricao_dia", chave_gasto_fixo(numero_usuario, descricao_gasto, dia_gasto)
+        )
+        if not encontrado:
             logging.warning(f"Gasto fixo '{str(descricao_gasto)}' (dia {str(dia_gasto)}) para {str(numero_usuario)} não encontrado para atualização de categoria.")
             return False
 
+        linha_para_atualizar, _ = encontrado
+        nova_categoria = str(nova_categoria).strip().capitalize()
+        aba = get_gastos_fixos()
+        aba.update_cell(linha_para_atualizar, 5, nova_categoria)
+        aba.gravar_pendentes()  # Dentro do lote da mensagem: só atualiza a réplica depois de gravar
+        replica_gastos_fixos.atualizar_celula(linha_para_atualizar, 5, nova_categoria)
+        logging.info(f"Categoria do gasto fixo '{str(descricao_gasto)}' (dia {str(dia_gasto)}) para {str(numero_usuario)} atualizada para '{str(nova_categoria)}'.")
+        return True
+
     except Exception as e:
         logging.error(f"Erro ao atualizar categoria do gasto fixo '{str(descricao_gasto)}' para {str(numero_usuario)}: {e}", exc_info=True)
         return False
@@ -0,0 +1,372 @@
+"""
+Réplicas locais de abas do Google Sheets (ex: 'Gastos Diários').
+
+A réplica baixa a aba inteira uma vez e, a partir daí, só busca as linhas novas
+desde a última contagem conhecida (uma leitura de intervalo pequena). As gravações
+feitas pelo próprio app são aplicadas na réplica na hora, e uma reconciliação
+completa periódica corrige qualquer edição feita direto na planilha.
+"""
+import os
+import logging
+import threading
+import time
+from planilhas import get_gastos_diarios, get_gastos_fixos, formatar_numero
+from gateway_sheets import prioridade
+
+INTERVALO_SINCRONIZACAO = int(os.getenv("REPLICA_INTERVALO_SINCRONIZACAO", "15"))    # segundos
+INTERVALO_RECONCILIACAO = int(os.getenv("REPLICA_INTERVALO_RECONCILIACAO", "600"))  # segundos
+
+def _letra_coluna(numero_coluna):
+    letras = ""
+    while numero_coluna:
+        numero_coluna, resto = divmod(numero_coluna - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+class ReplicaAba:
+    """Cópia em memória de uma aba, com sincronização incremental por contagem de linhas.
+
+    As linhas são guardadas sem o cabeçalho: a posição i da lista corresponde à
+    linha i + 2 da planilha. Linhas nunca são alteradas no lugar (cada atualização
+    troca a lista da linha), então os snapshots retornados podem ser lidos sem lock.
+
+    Além do índice por usuário, aceita índices secundários nomeados: cada função
+    recebe a linha e devolve a chave (ou None para não indexar a linha).
+    """
+
+    def __init__(self, obter_aba, largura, coluna_usuario=1, coluna_id=None, indices=None,
+                 intervalo_sincronizacao=INTERVALO_SINCRONIZACAO,
+                 intervalo_reconciliacao=INTERVALO_RECONCILIACAO):
+        self._obter_aba = obter_aba
+        self._largura = largura
+        self._coluna_usuario = coluna_usuario
+        self._coluna_id = coluna_id
+        self._intervalo_sincronizacao = intervalo_sincronizacao
+        self._intervalo_reconciliacao = intervalo_reconciliacao
+        self._lock = threading.RLock()
+        self._lock_sincronizacao = threading.Lock()  # Uma busca na API por vez; o _lock nunca espera a rede
+        self._cabecalho = []
+        self._linhas = []
+        self._funcoes_indice = {"usuario": self._chave_usuario, **(indices or {})}
+        self._indices = {nome: {} for nome in self._funcoes_indice}  # nome -> {chave: [índices em _linhas]}
+        self._ids = set()        # IDs únicos já gravados (quando coluna_id é informada)
+        self._ids_reservados = set()  # IDs com gravação em andamento
+        self._carregada = False
+        self._geracao = 0  # Muda a cada recarga completa
+        self._trocadas = []  # Índices de linhas trocadas (edições) desde a última recarga, em ordem
+        self._ultima_sincronizacao = 0.0
+        self._thread_reconciliacao = None
+        self._ouvintes = []  # Funções avisadas a cada mudança (ver adicionar_ouvinte)
+
+    # === Helpers internos ===
+    def _normalizar(self, linha):
+        linha = [str(valor) for valor in linha[:self._largura]]
+        return linha + [""] * (self._largura - len(linha))
+
+    def _chave_usuario(self, linha):
+        return formatar_numero(linha[self._coluna_usuario])
+
+    def _indexar(self, indice):
+        linha = self._linhas[indice]
+        for nome, funcao in self._funcoes_indice.items():
+            chave = funcao(linha)
+            if chave:
+                self._indices[nome].setdefault(chave, []).append(indice)
+        if self._coluna_id is not None and linha[self._coluna_id]:
+            self._ids.add(linha[self._coluna_id])
+            self._ids_reservados.discard(linha[self._coluna_id])
+
+    def _avisar(self, evento, *dados):
+        for ouvinte in self._ouvintes:
+            try:
+                ouvinte(evento, *dados)
+            except Exception as e:
+                logging.error(f"Erro em ouvinte da réplica ({evento}): {e}")
+
+    def _acrescentar_linha(self, valores):
+        nova = self._normalizar(valores)
+        self._linhas.append(nova)
+        self._indexar(len(self._linhas) - 1)
+        self._avisar("linha", None, nova)
+
+    def _trocar_linha(self, indice, nova):
+        antiga = self._linhas[indice]
+        self._desindexar(indice)
+        self._linhas[indice] = nova
+        self._indexar(indice)
+        self._trocadas.append(indice)
+        self._avisar("linha", antiga, nova)
+
+    def _desindexar(self, indice):
+        linha = self._linhas[indice]
+        for nome, funcao in self._funcoes_indice.items():
+            indices = self._indices[nome].get(funcao(linha))
+            if indices and indice in indices:
+                indices.remove(indice)
+        if self._coluna_id is not None:
+            self._ids.discard(linha[self._coluna_id])
+
+    # === Sincronização com a planilha ===
+    def recarregar(self):
+        """Reconciliação completa: baixa a aba inteira (1 chamada) e substitui a réplica."""
+        valores = self._obter_aba().get_all_values()
+        with self._lock:
+            self._cabecalho = list(valores[0]) if valores else []
+            self._linhas = [self._normalizar(linha) for linha in valores[1:]]
+            self._indices = {nome: {} for nome in self._funcoes_indice}
+            self._ids = set()
+            for indice in range(len(self._linhas)):
+                self._indexar(indice)
+            self._carregada = True
+            self._geracao += 1
+            self._trocadas = []
+            self._ultima_sincronizacao = time.monotonic()
+            self._avisar("recarga", list(self._linhas))
+        logging.info(f"Réplica da aba recarregada: {len(self._linhas)} linhas.")
+
+    def sincronizar(self):
+        """Busca só as linhas depois da última conhecida (1 leitura de intervalo).
+
+        A leitura é feita sem o lock (consultas seguem respondendo com a cópia local);
+        as linhas entram depois, descontando as que chegaram por registrar_linha nesse meio tempo.
+        """
+        if not self._carregada:
+            self.recarregar()
+            return 0
+        with self._lock:
+            geracao, proxima = self._geracao, len(self._linhas) + 2
+        intervalo = f"A{proxima}:{_letra_coluna(self._largura)}"
+        novas = self._obter_aba().get(intervalo)
+        with self._lock:
+            if geracao != self._geracao:
+                return 0  # Recarregada enquanto isso: a carga completa já trouxe tudo
+            novas = novas[len(self._linhas) + 2 - proxima:]
+            for linha in novas:
+                self._acrescentar_linha(linha)
+            self._ultima_sincronizacao = time.monotonic()
+        if novas:
+            logging.info(f"Réplica sincronizada: {len(novas)} linha(s) nova(s) a partir da linha {proxima}.")
+        return len(novas)
+
+    def _garantir_atualizada(self):
+        if not self._carregada:
+            with self._lock_sincronizacao:  # Sem cópia local: todos esperam a primeira carga
+                if not self._carregada:
+                    self.recarregar()
+            return
+        if time.monotonic() - self._ultima_sincronizacao < self._intervalo_sincronizacao:
+            return
+        if not self._lock_sincronizacao.acquire(blocking=False):
+            return  # Outra thread já está buscando: responde com a cópia local
+        try:
+            self.sincronizar()
+        except Exception as e:
+            # Segue servindo a última cópia conhecida
+            logging.error(f"Erro ao sincronizar réplica, usando dados locais: {e}")
+        finally:
+            self._lock_sincronizacao.release()
+
+    def _loop_reconciliacao(self):
+        evento = threading.Event()
+        while not evento.wait(self._intervalo_reconciliacao):
+            try:
+                with prioridade("relatorios"):  # Não disputa a cota do Sheets com o webhook
+                    self.recarregar()
+            except Exception as e:
+                logging.error(f"Erro na reconciliação periódica da réplica: {e}")
+
+    def iniciar_reconciliacao_periodica(self):
+        with self._lock:
+            if self._thread_reconciliacao and self._thread_reconciliacao.is_alive():
+                return
+            self._thread_reconciliacao = threading.Thread(
+                target=self._loop_reconciliacao, name="replica-reconciliacao", daemon=True
+            )
+            self._thread_reconciliacao.start()
+
+    def adicionar_ouvinte(self, funcao):
+        """Registra uma função avisada (sob o lock da réplica) a cada mudança nas linhas.
+
+        Eventos: funcao("recarga", linhas) depois de uma carga completa (ou no registro,
+        se a réplica já estiver carregada) e
+        funcao("linha", antiga, nova) quando uma linha entra (antiga=None) ou é trocada.
+        """
+        with self._lock:
+            self._ouvintes.append(funcao)
+            if self._carregada:  # Quem chega depois da carga recebe o estado atual
+                funcao("recarga", list(self._linhas))
+
+    def atualizar(self):
+        """Carrega a réplica ou busca as linhas novas, se já passou o intervalo de sincronização."""
+        self._garantir_atualizada()
+
+    # === Leituras (sem download da aba inteira) ===
+    def cabecalho(self):
+        self._garantir_atualizada()
+        return list(self._cabecalho)
+
+    def linhas(self):
+        """Snapshot de todas as linhas (sem cabeçalho), como get_all_values()[1:]. Somente leitura."""
+        self._garantir_atualizada()
+        with self._lock:
+            return list(self._linhas)
+
+    def linhas_novas(self, geracao, desde, trocas_vistas=0):
+        """Leitura incremental para quem mantém estruturas derivadas da réplica.
+
+        Args:
+            geracao (int): Geração vista na leitura anterior (0 na primeira).
+            desde (int): Quantidade de linhas já processadas.
+            trocas_vistas (int): Quantidade de edições já processadas (o último total devolvido).
+
+        Returns:
+            tuple: (geracao_atual, posicao_inicial, linhas, trocadas, total_de_trocas).
+            trocadas é a lista de (índice, linha atual) das linhas antes de `desde` editadas
+            desde a leitura anterior. Se a geração mudou (recarga completa), posicao_inicial
+            é 0, vêm todas as linhas e trocadas fica vazia.
+        """
+        self._garantir_atualizada()
+        with self._lock:
+            if geracao != self._geracao:
+                return self._geracao, 0, self._linhas[:], [], len(self._trocadas)
+            indices = dict.fromkeys(i for i in self._trocadas[trocas_vistas:] if i < desde)
+            trocadas = [(indice, self._linhas[indice]) for indice in indices]
+            return self._geracao, desde, self._linhas[desde:], trocadas, len(self._trocadas)
+
+    def localizar(self, nome_indice, chave):
+        """Lista de (numero_linha_planilha, linha) com a chave no índice informado, em ordem de inserção."""
+        self._garantir_atualizada()
+        with self._lock:
+            indices = self._indices[nome_indice].get(chave, [])
+            return [(indice + 2, self._linhas[indice]) for indice in indices]
+
+    def localizar_confirmado(self, nome_indice, chave):
+        """Como localizar, mas confere a linha na planilha antes de devolver (para edições).
+
+        Lê só a linha candidata (1 chamada). Se ela não tiver mais a mesma chave (linhas
+        inseridas/apagadas direto na planilha deslocaram a numeração), recarrega a réplica
+        e tenta de novo.
+
+        Returns:
+            tuple: (numero_linha_planilha, linha) do primeiro registro com a chave, ou None.
+        """
+        funcao = self._funcoes_indice[nome_indice]
+        for tentativa in range(2):
+            encontrados = self.localizar(nome_indice, chave)
+            if not encontrados:
+                return None
+            numero_linha, linha = encontrados[0]
+            atual = self._normalizar(self._obter_aba().row_values(numero_linha))
+            if funcao(atual) == chave:
+                return numero_linha, atual
+            logging.warning(f"Linha {numero_linha} da réplica desatualizada (deslocamento na planilha). Recarregando.")
+            self.recarregar()
+        return None
+
+    def linhas_do_usuario(self, numero_usuario):
+        """Lista de (numero_linha_planilha, linha) do usuário, em ordem de inserção."""
+        return self.localizar("usuario", formatar_numero(str(numero_usuario)))
+
+    def _para_registro(self, cabecalho, linha):
+        return dict(zip(cabecalho, linha + [""] * (len(cabecalho) - len(linha))))
+
+    def registros(self):
+        """Equivalente a get_all_records() (valores como string)."""
+        cabecalho = self.cabecalho()
+        return [self._para_registro(cabecalho, linha) for linha in self.linhas()]
+
+    def registros_do_usuario(self, numero_usuario):
+        cabecalho = self.cabecalho()
+        return [self._para_registro(cabecalho, linha) for _, linha in self.linhas_do_usuario(numero_usuario)]
+
+    # === Índice de IDs únicos (deduplicação em O(1)) ===
+    def contem_id(self, id_unico):
+        self._garantir_atualizada()
+        with self._lock:
+            return id_unico in self._ids or id_unico in self._ids_reservados
+
+    def reservar_id(self, id_unico):
+        """Verifica e reserva o ID de forma atômica. Retorna False se o ID já existe ou está sendo gravado.
+
+        Após gravar na planilha, chame registrar_linha (que confirma o ID) ou, em caso de falha, liberar_id.
+        """
+        self._garantir_atualizada()
+        with self._lock:
+            if id_unico in self._ids or id_unico in self._ids_reservados:
+                return False
+            self._ids_reservados.add(id_unico)
+            return True
+
+    def liberar_id(self, id_unico):
+        with self._lock:
+            self._ids_reservados.discard(id_unico)
+
+    def reservar_ids_novos(self, ids):
+        """Versão em lote de reservar_id: reserva e retorna só os IDs ainda desconhecidos.
+
+        IDs repetidos dentro do próprio lote são considerados uma única vez.
+        """
+        self._garantir_atualizada()
+        with self._lock:
+            novos = []
+            for id_unico in ids:
+                if id_unico in self._ids or id_unico in self._ids_reservados:
+                    continue
+                self._ids_reservados.add(id_unico)
+                novos.append(id_unico)
+            return novos
+
+    # === Escritas locais (chamar DEPOIS de gravar na planilha) ===
+    def registrar_linhas(self, numero_primeira_linha, lista_valores):
+        """Aplica na réplica as linhas gravadas por um append_rows (linhas consecutivas)."""
+        for deslocamento, valores in enumerate(lista_valores):
+            numero_linha = numero_primeira_linha + deslocamento if numero_primeira_linha else None
+            self.registrar_linha(numero_linha, valores)
+
+    def registrar_linha(self, numero_linha, valores):
+        """Aplica na réplica uma linha que acabou de ser gravada na planilha via append."""
+        with self._lock:
+            if self._carregada:
+                indice = numero_linha - 2 if numero_linha else len(self._linhas)
+                if indice == len(self._linhas):
+                    self._acrescentar_linha(valores)
+                    return
+                if indice < len(self._linhas):
+                    self._trocar_linha(indice, self._normalizar(valores))
+                    return
+        # Réplica ainda não carregada, ou outro processo gravou linhas que ainda não vimos:
+        # a leitura (fora do lock) traz todas, inclusive esta
+        if not self._carregada:
+            self.recarregar()
+        else:
+            self.sincronizar()
+
+    def atualizar_celula(self, numero_linha, numero_coluna, valor):
+        """Aplica na réplica um update_cell que acabou de ser gravado na planilha."""
+        with self._lock:
+            indice = numero_linha - 2
+            if not self._carregada or not 0 <= indice < len(self._linhas) or numero_coluna > self._largura:
+                return
+            nova = list(self._linhas[indice])
+            nova[numero_coluna - 1] = str(valor)
+            self._trocar_linha(indice, nova)
+
+def chave_gasto(numero_usuario, descricao, data_gasto):
+    """Chave do índice 'descricao_data' de Gastos Diários: (número, descrição normalizada, data)."""
+    return (formatar_numero(str(numero_usuario)), str(descricao).strip().lower(), str(data_gasto).strip())
+
+def chave_gasto_fixo(numero_usuario, descricao, dia):
+    """Chave do índice 'descricao_dia' de Gastos Fixos: (número, descrição normalizada, dia)."""
+    return (formatar_numero(str(numero_usuario)), str(descricao).strip().lower(), str(dia).strip())
+
+# Colunas: NOME, NÚMERO, DESCRIÇÃO, CATEGORIA, VALOR (R$), FORMA DE PAGAMENTO, DATA DO GASTO, DATA DO REGISTRO, ID
+replica_gastos_diarios = ReplicaAba(
+    get_gastos_diarios, largura=9, coluna_id=8,
+    indices={"descricao_data": lambda linha: chave_gasto(linha[1], linha[2], linha[6])},
+)
+
+# Colunas: NÚMERO, DESCRIÇÃO, VALOR, FORMA_PGTO, CATEGORIA, DIA_DO_MÊS, LEMBRETE_ATIVO
+replica_gastos_fixos = ReplicaAba(
+    get_gastos_fixos, largura=7, coluna_usuario=0,
+    indices={"descricao_dia": lambda linha: chave_gasto_fixo(linha[0], linha[1], linha[5])},
+)
@@ -1,35 +1,29 @@
-import os
-import openai
-from pinecone import Index
 from dotenv import load_dotenv
-import tiktoken
+from vector_store import indice
+import cache_embeddings
+import indice_local
 
 load_dotenv(override=True)
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
-index = Index(
-    name=os.getenv("PINECONE_INDEX_NAME"),
-    api_key=os.getenv("PINECONE_API_KEY"),
-    host=os.getenv("PINECONE_HOST")
-)
-
-encoding = tiktoken.encoding_for_model("text-embedding-ada-002")
+MODELO_EMBEDDING = "text-embedding-ada-002"
 
 def gerar_embedding(texto):
-    response = openai.Embedding.create(
-        input=texto,
-        model="text-embedding-ada-002"
-    )
-    return response['data'][0]['embedding']
+    return cache_embeddings.embedding(texto, MODELO_EMBEDDING)
 
 def buscar_conhecimento_relevante(pergunta_usuario, categoria=None, top_k=4):
     try:
         embedding = gerar_embedding(pergunta_usuario)
 
+        # Base de conhecimento: busca exata no índice local (gerado por ingest_data.py)
+        encontrados = indice_local.buscar(embedding, MODELO_EMBEDDING, top_k=top_k, categoria=categoria)
+        if encontrados is not None:
+            textos = [item['text'].strip() for _, item in encontrados if item.get('text')]
+            return "\n\n".join(textos) if textos else ""
+
+        # Sem índice local (ingestão ainda não rodou ou outro modelo): usa os vetores antigos no Pinecone
         filtro = {"categoria": {"$eq": categoria}} if categoria else {}
 
-        resultado = index.query(
+        resultado = indice().query(
             vector=embedding,
             top_k=top_k,
             include_metadata=True,
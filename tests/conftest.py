@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Bancos locais (SQLite, diário de inserções) numa pasta temporária, antes de importar os módulos
+os.environ.setdefault("ARMAZENAMENTO_LOCAL_PASTA", tempfile.mkdtemp(prefix="meugpt-testes-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import agendador
+from agendador import Cron, Job, fuso, proximo_horario
+
+
+def _momento(dia, hora, minuto=0):
+    return fuso.localize(datetime(2026, 3, dia, hora, minuto))
+
+
+@pytest.fixture
+def diario():
+    return Cron("0 3 * * *")
+
+
+def test_sem_historico_comeca_no_proximo_horario(diario):
+    assert proximo_horario(diario, None, _momento(10, 3, 30)) == _momento(11, 3)
+
+
+def test_horario_perdido_dentro_da_tolerancia_roda_uma_vez(diario):
+    # Reinício às 03:30: a execução das 03:00 (último registro foi a de ontem) ainda vale
+    agora = _momento(10, 3, 30)
+    proxima = proximo_horario(diario, _momento(9, 3), agora, tolerancia=3600)
+    assert proxima == _momento(10, 3)
+    assert proxima <= agora
+
+
+def test_horario_perdido_fora_da_tolerancia_e_pulado(diario):
+    agora = _momento(10, 5)
+    assert proximo_horario(diario, _momento(9, 3), agora, tolerancia=3600) == _momento(11, 3)
+
+
+def test_horario_ja_registrado_nao_repete(diario):
+    agora = _momento(10, 3, 30)
+    assert proximo_horario(diario, _momento(10, 3), agora, tolerancia=3600) == _momento(11, 3)
+
+
+def _registrar(job, agendado_para, status, pid):
+    conexao = agendador._conexao()
+    conexao.execute(
+        "INSERT INTO execucoes (job, agendado_para, iniciado_em, status, pid) VALUES (?, ?, ?, ?, ?)",
+        (job, agendado_para.timestamp(), agendado_para.timestamp(), status, pid),
+    )
+
+
+def test_horario_interrompido_roda_de_novo_uma_vez(request):
+    job = Job(f"teste_{request.node.name}", lambda: None, "0 3 * * *", timeout=60)
+    agora = _momento(10, 3, 30)
+    _registrar(job.nome, _momento(9, 3), "ok", pid=1)
+    _registrar(job.nome, _momento(10, 3), "rodando", pid=-1)  # Processo que caiu no meio
+
+    agendador._agendar(job, agora)
+    assert job.proxima == _momento(10, 3)
+    status = agendador._conexao().execute(
+        "SELECT status FROM execucoes WHERE job = ? ORDER BY id", (job.nome,)
+    ).fetchall()
+    assert [s for s, in status] == ["ok", "interrompido"]
+
+    # A repetição também caiu: não insiste de novo
+    _registrar(job.nome, _momento(10, 3), "rodando", pid=-1)
+    agendador._agendar(job, agora)
+    assert job.proxima == _momento(11, 3)
+
+
+def test_varios_horarios_perdidos_rodam_so_o_mais_antigo_da_janela():
+    cron = Cron("*/15 * * * *")
+    agora = _momento(10, 12, 40)
+    # Parado desde 09:00 com tolerância de 1h: só os horários a partir de 11:40 contam
+    proxima = proximo_horario(cron, _momento(10, 9), agora, tolerancia=3600)
+    assert proxima == _momento(10, 11, 45)
+    assert cron.proxima(agora) - proxima > timedelta(0)
+
+
+def test_dia_da_semana_aceita_zero_e_sete_para_domingo():
+    domingo = _momento(15, 0)  # 15/03/2026 é domingo
+    assert Cron("0 9 * * 0").proxima(domingo) == _momento(15, 9)
+    assert Cron("0 9 * * 7").proxima(domingo) == _momento(15, 9)
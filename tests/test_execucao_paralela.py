@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+import execucao_paralela
+from execucao_paralela import ENVIADO, IGNORADO, executar, execucao_agendada
+
+
+@pytest.fixture
+def job(request):
+    return f"teste-{request.node.name}"
+
+
+def test_retoma_execucao_pulando_itens_feitos_e_repetindo_falhas(job):
+    vistos = []
+
+    def primeira(item):
+        vistos.append(item)
+        if item == "c":
+            raise RuntimeError("falha temporária")
+        return ENVIADO
+
+    resumo = executar(job, [(i, i) for i in "abc"], primeira, execucao="e1", workers=2)
+    assert (resumo["enviados"], resumo["falhas"]) == (2, 1)
+
+    vistos.clear()
+    resumo = executar(job, [(i, i) for i in "abcd"], lambda item: vistos.append(item) or IGNORADO, execucao="e1")
+    assert sorted(vistos) == ["c", "d"]
+    assert (resumo["ja_feitos"], resumo["ignorados"]) == (2, 2)
+
+
+def _interromper(job, execucao, iniciada_em):
+    # Simula um processo que caiu no meio: execução registrada, sem terminada_em, com um item feito
+    conexao = execucao_paralela._conexao()
+    conexao.execute(
+        "INSERT INTO execucoes (job, execucao, iniciada_em) VALUES (?, ?, ?)", (job, execucao, iniciada_em)
+    )
+    conexao.execute(
+        "INSERT INTO checkpoints (job, execucao, chave, resultado) VALUES (?, ?, 'a', ?)", (job, execucao, ENVIADO)
+    )
+
+
+def test_sem_execucao_retoma_a_interrompida_recente(job):
+    _interromper(job, "recente", time.time() - 60)
+    resumo = executar(job, [("a", "a"), ("b", "b")], lambda item: ENVIADO)
+    assert resumo["execucao"] == "recente"
+    assert resumo["ja_feitos"] == 1
+
+
+def test_execucao_interrompida_antiga_nao_e_retomada(job):
+    _interromper(job, "antiga", time.time() - (execucao_paralela.RETOMAR_HORAS + 1) * 3600)
+    resumo = executar(job, [("a", "a"), ("b", "b")], lambda item: ENVIADO)
+    assert resumo["execucao"] != "antiga"
+    assert (resumo["ja_feitos"], resumo["enviados"]) == (0, 2)
+
+
+def test_execucao_do_agendador_tem_precedencia_sobre_a_interrompida(job):
+    _interromper(job, "recente", time.time() - 60)
+    with execucao_agendada("2026-03-10T03:30"):
+        resumo = executar(job, [("a", "a")], lambda item: ENVIADO)
+    assert resumo["execucao"] == "2026-03-10T03:30"
+    assert resumo["enviados"] == 1
@@ -0,0 +1,151 @@
+import pytest
+
+import fila_insercoes
+
+
+class AbaFalsa:
+    """Aba em memória: append_rows devolve o updatedRange como a API do Sheets."""
+
+    def __init__(self, valores=None, falha=None):
+        self.valores = [list(linha) for linha in valores or []]
+        self.falha = falha
+        self.appends = 0
+
+    def append_rows(self, linhas, value_input_option="RAW"):
+        inicio = len(self.valores) + 1
+        self.valores.extend(list(linha) for linha in linhas)
+        self.appends += 1
+        if self.falha:
+            raise self.falha  # A API aplicou, mas a resposta não chegou
+        return {"updates": {"updatedRange": f"'Aba'!A{inicio}:C{len(self.valores)}"}}
+
+    def get_all_values(self):
+        return [[str(valor) for valor in linha] for linha in self.valores]
+
+    def col_values(self, coluna):
+        return [str(linha[coluna - 1]) for linha in self.valores]
+
+
+class Queda(BaseException):
+    """Processo interrompido no meio do append_rows."""
+
+
+@pytest.fixture
+def aba(monkeypatch, tmp_path):
+    aba = AbaFalsa([["Data", "Valor", "ID"]])
+    monkeypatch.setattr(fila_insercoes, "ARQUIVO_DIARIO", str(tmp_path / "fila.jsonl"))
+    monkeypatch.setattr(fila_insercoes, "get_aba", lambda sheet_id, nome: aba)
+    monkeypatch.setattr(fila_insercoes, "_pendentes", {})
+    monkeypatch.setattr(fila_insercoes, "_em_gravacao", 0)
+    return aba
+
+
+@pytest.fixture
+def reenfileirados(monkeypatch):
+    chamadas = []
+
+    def enfileirar(sheet_id, nome_aba, linhas, modo="RAW", coluna_id=None):
+        chamadas.append(linhas)
+        return fila_insercoes.Future()
+    monkeypatch.setattr(fila_insercoes, "enfileirar", enfileirar)
+    return chamadas
+
+
+def _pedido(linhas, coluna_id=None):
+    pedido = fila_insercoes._Pedido("p1", "planilha", "Aba", linhas, "RAW", coluna_id)
+    with fila_insercoes._condicao:
+        fila_insercoes._anotar_no_diario(pedido.para_diario())
+        fila_insercoes._pendentes[("planilha", "Aba", "RAW")] = [pedido]
+    return pedido
+
+
+def _cair_durante_o_append(aba, linhas, coluna_id=None):
+    aba.falha = Queda()
+    pedido = _pedido(linhas, coluna_id)
+    with pytest.raises(Queda):
+        fila_insercoes._ciclo()
+    return pedido
+
+
+def test_gravacao_confirma_com_o_intervalo_da_api(aba):
+    pedido = _pedido([["01/05", "10", "a1"]])
+    assert fila_insercoes._ciclo() == 1
+    assert pedido.futuro.result(timeout=1) == 2
+    assert fila_insercoes._ler_diario() == []
+
+
+def test_pedido_nunca_enviado_e_regravado(aba, reenfileirados):
+    _pedido([["01/05", "10", "a1"]])
+    registros = fila_insercoes._ler_diario()
+    assert [registro["enviado"] for registro in registros] == [False]
+
+    fila_insercoes._recuperar_diario(registros)
+    assert reenfileirados == [[["01/05", "10", "a1"]]]
+
+
+def test_append_aplicado_antes_da_queda_nao_e_regravado_sem_coluna_de_id(aba, reenfileirados):
+    _cair_durante_o_append(aba, [["01/05", 10, "a1"], ["02/05", 20, "a2"]])
+    registros = fila_insercoes._ler_diario()
+    assert [registro["enviado"] for registro in registros] == [True]
+
+    fila_insercoes._recuperar_diario(registros)
+    assert reenfileirados == []
+    assert fila_insercoes._ler_diario() == []
+
+
+def test_append_perdido_na_queda_e_regravado(aba, reenfileirados):
+    _cair_durante_o_append(aba, [["01/05", 10, "a1"]])
+    aba.valores.pop()  # A API não chegou a aplicar
+
+    fila_insercoes._recuperar_diario(fila_insercoes._ler_diario())
+    assert reenfileirados == [[["01/05", 10, "a1"]]]
+
+
+def test_coluna_de_id_filtra_linhas_ja_gravadas(aba, reenfileirados):
+    aba.valores.append(["01/05", "10", "a1"])
+    _pedido([["01/05", "10", "a1"], ["02/05", "20", "a2"]], coluna_id=2)
+
+    fila_insercoes._recuperar_diario(fila_insercoes._ler_diario())
+    assert reenfileirados == [[["02/05", "20", "a2"]]]
+
+
+def test_linha_corrompida_no_diario_e_ignorada(aba):
+    _pedido([["01/05", "10", "a1"]])
+    with open(fila_insercoes.ARQUIVO_DIARIO, "a", encoding="utf-8") as f:
+        f.write('{"resolvidos": ["p1"\n')  # Queda no meio da escrita da confirmação
+    assert [registro["id"] for registro in fila_insercoes._ler_diario()] == ["p1"]
+
+
+def test_fila_ociosa_grava_sem_esperar(aba, monkeypatch):
+    monkeypatch.setattr(fila_insercoes, "ESPERA_MAXIMA", 60)
+    _pedido([["01/05", "10", "a1"]])
+    assert fila_insercoes._ciclo() == 1
+
+    monkeypatch.setattr(fila_insercoes, "_em_gravacao", 1)  # Outra gravação em andamento: espera juntar
+    _pedido([["02/05", "20", "a2"]])
+    assert fila_insercoes._ciclo() == 0
+
+
+def test_tempo_esgotado_na_fila_cancela_o_pedido(aba, monkeypatch):
+    pedido = _pedido([["01/05", "10", "a1"]])
+    monkeypatch.setattr(fila_insercoes, "enfileirar", lambda *args, **kwargs: pedido.futuro)
+    with pytest.raises(TimeoutError) as erro:
+        fila_insercoes.inserir("planilha", "Aba", [], timeout=0.01)
+    assert not isinstance(erro.value, fila_insercoes.GravacaoPendente)
+    assert pedido.futuro.cancelled()
+    assert fila_insercoes._pendentes == {} and fila_insercoes._ler_diario() == []
+    assert fila_insercoes._ciclo(forcar=True) == 0 and aba.appends == 0
+
+
+def test_tempo_esgotado_depois_de_enviado_avisa_quando_gravar(aba, monkeypatch):
+    pedido = _pedido([["01/05", "10", "a1"]])
+    monkeypatch.setattr(fila_insercoes, "enfileirar", lambda *args, **kwargs: pedido.futuro)
+    with fila_insercoes._condicao:
+        lote = fila_insercoes._retirar_lote(("planilha", "Aba", "RAW"), forcar=True)  # Saiu para gravação
+    with pytest.raises(fila_insercoes.GravacaoPendente) as erro:
+        fila_insercoes.inserir("planilha", "Aba", [], timeout=0.01)
+
+    gravadas = []
+    fila_insercoes.quando_gravado(erro.value.futuro, gravadas.append)
+    fila_insercoes._gravar_lote(lote)
+    assert gravadas == [2]
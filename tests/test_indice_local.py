@@ -0,0 +1,30 @@
+import os
+
+import indice_local
+
+ITENS = [
+    {"id": "a", "text": "orçamento", "categoria": "financas"},
+    {"id": "b", "text": "gratidão", "categoria": "espiritualidade"},
+]
+VETORES = [[1.0, 0.0], [0.0, 1.0]]
+
+
+def test_regravar_troca_vetores_e_metadados_juntos(tmp_path):
+    indice_local.gravar(ITENS, VETORES, "modelo-a", pasta=tmp_path)
+    assert indice_local.buscar([1.0, 0.1], "modelo-a", top_k=1, pasta=tmp_path)[0][1]["id"] == "a"
+
+    indice_local.gravar(ITENS[::-1], VETORES, "modelo-a", pasta=tmp_path)
+    assert indice_local.buscar([1.0, 0.1], "modelo-a", top_k=1, pasta=tmp_path)[0][1]["id"] == "b"
+
+
+def test_so_as_versoes_recentes_ficam_na_pasta(tmp_path):
+    for _ in range(indice_local.VERSOES_MANTIDAS + 2):
+        indice_local.gravar(ITENS, VETORES, "modelo-a", pasta=tmp_path)
+    versoes = [nome for nome in os.listdir(tmp_path) if os.path.isdir(tmp_path / nome)]
+    assert len(versoes) == indice_local.VERSOES_MANTIDAS
+    assert (tmp_path / indice_local.ARQUIVO_ATUAL).read_text() in versoes
+
+
+def test_indice_de_outro_modelo_nao_responde(tmp_path):
+    indice_local.gravar(ITENS, VETORES, "modelo-a", pasta=tmp_path)
+    assert indice_local.buscar([1.0, 0.0], "modelo-b", pasta=tmp_path) is None
@@ -0,0 +1,78 @@
+import pytest
+
+import indice_local
+import ingest_data
+
+
+class EncodingFalso:
+    """Um token por caractere (o tiktoken precisa de rede para baixar o vocabulário)."""
+
+    def encode(self, texto):
+        return list(texto)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@pytest.fixture
+def pastas(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingest_data, "_encoding", EncodingFalso())
+    monkeypatch.setattr(ingest_data, "embed_text", lambda texto: [float(len(texto)), 1.0, 0.0])
+    textos, indice = tmp_path / "knowledge", tmp_path / "indice"
+    textos.mkdir()
+    (textos / "financas_basico.txt").write_text("orçamento", encoding="utf-8")
+    (textos / "espiritual.txt").write_text("gratidão", encoding="utf-8")
+    return textos, indice
+
+
+def test_primeira_ingestao_gera_tudo(pastas):
+    textos, indice = pastas
+    plano = ingest_data.planejar(textos, indice)
+    assert len(plano["novos"]) == len(plano["itens"]) == 2
+    assert plano["removidos"] == [] and plano["mudou_manifesto"]
+    assert {item["categoria"] for item in plano["itens"]} == {"financas", "espiritualidade"}
+
+
+def test_sem_mudancas_nao_gera_nada(pastas):
+    textos, indice = pastas
+    ingest_data.ingerir(textos, indice)
+    plano = ingest_data.planejar(textos, indice)
+    assert plano["novos"] == [] and plano["removidos"] == []
+    assert not plano["mudou_manifesto"]
+
+
+def test_arquivo_alterado_troca_so_os_seus_pedacos(pastas):
+    textos, indice = pastas
+    antes = ingest_data.ingerir(textos, indice)
+    (textos / "espiritual.txt").write_text("gratidão e fé", encoding="utf-8")
+    plano = ingest_data.planejar(textos, indice)
+
+    antigo = antes["arquivos"]["espiritual.txt"]["pedacos"]
+    novo = plano["arquivos"]["espiritual.txt"]["pedacos"]
+    assert plano["novos"] == novo and plano["removidos"] == antigo
+    assert plano["arquivos"]["financas_basico.txt"] == antes["arquivos"]["financas_basico.txt"]
+
+
+def test_arquivo_apagado_sai_do_indice(pastas):
+    textos, indice = pastas
+    antes = ingest_data.ingerir(textos, indice)
+    (textos / "financas_basico.txt").unlink()
+    plano = ingest_data.planejar(textos, indice)
+    assert plano["novos"] == []
+    assert plano["removidos"] == antes["arquivos"]["financas_basico.txt"]["pedacos"]
+
+
+def test_pedaco_repetido_no_arquivo_entra_uma_vez(pastas, monkeypatch):
+    textos, indice = pastas
+    monkeypatch.setattr(ingest_data, "chunk_text_by_tokens", lambda texto: ["igual", "igual", "outro"])
+    plano = ingest_data.planejar(textos, indice)
+    assert [item["text"] for item in plano["itens"] if item["source"] == "espiritual.txt"] == ["igual", "outro"]
+
+
+def test_outro_modelo_gera_tudo_de_novo(pastas):
+    textos, indice = pastas
+    plano = ingest_data.ingerir(textos, indice)
+    metadados, vetores = indice_local.ler(indice)
+    indice_local.gravar(metadados["itens"], [vetores[item["id"]] for item in metadados["itens"]],
+                        "outro-modelo", pasta=indice, arquivos=metadados["arquivos"])
+    assert sorted(ingest_data.planejar(textos, indice)["novos"]) == sorted(item["id"] for item in plano["itens"])
@@ -1,29 +1,55 @@
+"""
+Índice do Pinecone compartilhado pelo processo.
+
+Nada acessa a rede no import: indice() cria o cliente na primeira chamada
+(resgatar_contexto, armazenar_mensagem, ingest_data) e garantir_indice() —
+usado pela ingestão ou rodando este arquivo — cria o índice se ele não existir.
+"""
 import os
-import pinecone
-import openai
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Inicializa OpenAI
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
 # Configurações do Pinecone
 pinecone_api_key = os.getenv("PINECONE_API_KEY")
 pinecone_index_name = os.getenv("PINECONE_INDEX_NAME")
+pinecone_host = os.getenv("PINECONE_HOST")
 pinecone_env = os.getenv("PINECONE_ENV")
 
-# Inicializa Pinecone versão nova (6.x)
-pc = pinecone.Pinecone(api_key=pinecone_api_key)
+_lock = threading.Lock()
+_pc = None
+_index = None
+
+def _cliente():
+    global _pc
+    if _pc is None:
+        import pinecone  # Import pesado: só quando o Pinecone é usado de fato
+        _pc = pinecone.Pinecone(api_key=pinecone_api_key)
+    return _pc
+
+def indice():
+    """Índice do Pinecone, criado no primeiro uso (sem PINECONE_HOST, o host é consultado na API)."""
+    global _index
+    with _lock:
+        if _index is None:
+            _index = _cliente().Index(name=pinecone_index_name, host=pinecone_host or "")
+        return _index
 
-# Verifica se o índice existe, senão cria
-existing_indexes = [index_info['name'] for index_info in pc.list_indexes()]
-if pinecone_index_name not in existing_indexes:
-    pc.create_index(
-        name=pinecone_index_name,
-        dimension=1536,
-        metric="cosine",
-        spec=pinecone.ServerlessSpec(cloud="aws", region=pinecone_env)
-    )
+def garantir_indice():
+    """Cria o índice se ele ainda não existir."""
+    import pinecone
+    with _lock:
+        pc = _cliente()
+        existing_indexes = [index_info['name'] for index_info in pc.list_indexes()]
+        if pinecone_index_name not in existing_indexes:
+            pc.create_index(
+                name=pinecone_index_name,
+                dimension=1536,
+                metric="cosine",
+                spec=pinecone.ServerlessSpec(cloud="aws", region=pinecone_env)
+            )
 
-print("✅ Pinecone configurado com sucesso.")
\ No newline at end of file
+if __name__ == "__main__":
+    garantir_indice()
+    print("✅ Pinecone configurado com sucesso.")